@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+admission.py
+------------------------------------------------
+分析任务的内存准入控制与公平调度
+- 按上传文件估算每次分析的峰值内存：工作表声明的行列数（xlsx 的 dimension 标记，不解析数据）乘以
+  每单元格内存，读不到行列数时按文件大小折算；系数由 benchmarks/calibrate_admission.py 实测，
+  运行中再按独占运行时的实际峰值（指数加权）校准
+- 正在运行的任务估算内存之和不超过预算时才开始新任务，其余排队
+- 排队按用户/店铺分队列：正在运行任务少的用户优先，相同时最久未准入的用户优先；
+  一个用户提交大批任务时，其他用户的任务不需要等它们全部完成
+- 队首等待超过 STARVATION_SECONDS 的任务优先，不再让后面更小的任务插队；
+  估算超过整个预算的任务在没有其他任务运行时独占执行
+- 任务可指定所属的执行池（如后台任务线程池），同一池中同时准入的任务数不超过池的容量，
+  准入的任务不会在线程池队列中占着预算等待
+- 队列长度、运行数、已占用预算、等待时间写入 /metrics
+
+预算是整个服务的内存，按 worker 进程数（WEB_WORKERS，gunicorn.conf.py 按实际 worker 数设置，
+单进程部署为1）平均分给各进程，多个 worker 同时准入的任务估算之和不超过预算。
+
+通过环境变量配置：
+- ANALYSIS_MEMORY_BUDGET_MB: 同时运行的分析可使用的内存（MB，整个服务），默认为容器内存上限（或物理内存）的
+  BUDGET_SHARE 减去进程当前内存
+- ANALYSIS_STARVATION_SECONDS: 队首任务等待多久后不再允许插队，默认 60 秒
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+# 与 jobs 一起在服务启动时导入，不导入 pandas（table_io 在估算时才导入）
+from profiling import MetricsRegistry, current_rss_mb
+
+# 输入文件：路径或二进制文件对象（同 table_io.ExcelSource）
+InputFile = Union[str, Path, BinaryIO]
+
+# 各地区的内存模型（benchmarks/calibrate_admission.py 在合成数据上实测拟合）：
+# 峰值增量(MB) = base_mb + 输入单元格数 * bytes_per_cell / 1MB
+MEMORY_MODEL = {
+    "indonesia": {"base_mb": 33.2, "bytes_per_cell": 165.4},
+    "malaysia": {"base_mb": 31.6, "bytes_per_cell": 130.3},
+}
+
+# 读不到工作表尺寸（xls、未声明 dimension）时，按文件大小折算单元格数
+# （xlsx 实测约 6 字节/单元格，xls 未压缩、每单元格更大，按此折算偏保守）
+FILE_BYTES_PER_CELL = 6.0
+
+# 实测峰值校准：指数加权系数、校准倍数的范围；按单元格估算的部分小于 CALIBRATION_MIN_MB 的小任务
+# 峰值主要是固定开销和测量噪声，不用于校准
+CALIBRATION_ALPHA = 0.3
+CALIBRATION_BOUNDS = (0.5, 4.0)
+CALIBRATION_MIN_MB = 64.0
+
+# 默认预算占容器内存（或物理内存）的比例
+BUDGET_SHARE = 0.75
+
+STARVATION_SECONDS = 60.0
+
+
+def _file_size(source: InputFile) -> int:
+    """文件大小（路径或文件对象，不改变读取位置）"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def input_cells(files: Sequence[InputFile]) -> int:
+    """输入文件的单元格总数（工作表声明的行数 * 列数，读不到时按文件大小折算）"""
+    from table_io import sheet_dimensions
+
+    total = 0
+    for source in files:
+        dimensions = sheet_dimensions(source)
+        if dimensions is not None:
+            total += dimensions[0] * dimensions[1]
+        else:
+            total += int(_file_size(source) / FILE_BYTES_PER_CELL)
+    return total
+
+
+def worker_processes() -> int:
+    """同时运行分析的 worker 进程数（WEB_WORKERS，未设置时为单进程）"""
+    try:
+        return max(int(os.environ.get("WEB_WORKERS") or 1), 1)
+    except ValueError:
+        return 1
+
+
+def default_budget_mb() -> float:
+    """默认预算（整个服务）：容器内存上限（cgroup）或物理内存的 BUDGET_SHARE，减去进程当前内存"""
+    limit = None
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 未设置上限时为一个接近 2^63 的值
+        if value.isdigit() and int(value) < 2 ** 60:
+            limit = int(value)
+            break
+    if limit is None:
+        try:
+            limit = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError, AttributeError):
+            limit = 4 * 1024 ** 3
+    return max(limit / 1024 / 1024 * BUDGET_SHARE - current_rss_mb(), 256.0)
+
+
+class MemoryEstimator:
+    """按输入文件估算分析峰值内存，并按实测峰值校准（每个地区一个校准倍数，作用于按单元格估算的部分）"""
+
+    def __init__(self, model: Optional[Dict[str, dict]] = None):
+        self.model = model or MEMORY_MODEL
+        self.scale = {region: 1.0 for region in self.model}
+        self.lock = threading.Lock()
+
+    def _model(self, analysis_type: str) -> dict:
+        return self.model.get(analysis_type, self.model["indonesia"])
+
+    def raw_estimate(self, analysis_type: str, cells: int, scale: float = 1.0) -> float:
+        """按单元格数估算（MB），scale 为校准倍数"""
+        model = self._model(analysis_type)
+        return model["base_mb"] + scale * cells * model["bytes_per_cell"] / 1024 / 1024
+
+    def estimate(self, analysis_type: str, files: Sequence[InputFile]) -> float:
+        """
+        估算一次分析的峰值内存增量（MB）
+
+        Args:
+            analysis_type: 分析模块（indonesia / malaysia）
+            files: 全部输入文件（订单、结算、消耗表，路径或文件对象）
+        """
+        cells = input_cells(files)
+        with self.lock:
+            scale = self.scale.get(analysis_type, 1.0)
+        return self.raw_estimate(analysis_type, cells, scale)
+
+    def observe(self, analysis_type: str, estimated_mb: float, measured_mb: float) -> None:
+        """
+        用一次独占运行的实测峰值增量校准（并发运行时进程RSS包含其他任务，不用于校准）
+
+        Args:
+            estimated_mb: 该次运行的估算（已校准）
+            measured_mb: 实测峰值增量（阶段RSS峰值 - 开始时的RSS）
+        """
+        base = self._model(analysis_type)["base_mb"]
+        variable = estimated_mb - base
+        if variable < CALIBRATION_MIN_MB or measured_mb <= 0:
+            return
+        low, high = CALIBRATION_BOUNDS
+        with self.lock:
+            scale = self.scale.get(analysis_type, 1.0)
+            # 按单元格估算的部分已乘以当前倍数，实测/估算即为本次的修正量
+            target = scale * max(measured_mb - base, 0.0) / variable
+            self.scale[analysis_type] = min(high, max(low, (1 - CALIBRATION_ALPHA) * scale
+                                                      + CALIBRATION_ALPHA * target))
+
+
+class Ticket:
+    """一个等待或正在运行的分析"""
+
+    def __init__(self, owner: str, estimate_mb: float, start: Callable[["Ticket"], None], label: str = "",
+                 pool: Optional[str] = None):
+        self.owner = owner
+        self.estimate_mb = estimate_mb
+        self.start = start
+        self.label = label
+        self.pool = pool
+        self.enqueued_at = time.time()
+        self.admitted_at: Optional[float] = None
+        # 运行期间是否有其他任务同时运行（有则实测峰值不用于校准）
+        self.shared = False
+
+    @property
+    def wait_seconds(self) -> float:
+        return (self.admitted_at or time.time()) - self.enqueued_at
+
+
+class AdmissionScheduler:
+    """
+    按内存预算准入、按用户/店铺公平排队的调度器
+
+    Args:
+        budget_mb: 同时运行的分析估算内存之和的上限（MB，本进程）
+        metrics: 指标注册表，写入队列长度、运行数、占用预算和等待时间
+        starvation_seconds: 队首任务等待超过此时间后优先准入
+    """
+
+    def __init__(self, budget_mb: float, metrics: Optional[MetricsRegistry] = None,
+                 starvation_seconds: float = STARVATION_SECONDS):
+        self.budget_mb = budget_mb
+        self.metrics = metrics
+        self.starvation_seconds = starvation_seconds
+        # 用户/店铺 -> 排队的任务（按首次排队的顺序）；有排队或运行中任务的用户最近一次准入的时间
+        self.queues: Dict[str, deque] = {}
+        self.last_admitted: Dict[str, float] = {}
+        self.running: List[Ticket] = []
+        self.reserved_mb = 0.0
+        # 执行池 -> 同时准入的任务数上限（set_pool_limit）
+        self.pool_limits: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self._update_gauges()
+
+    # -------- 提交与释放 --------
+    def set_pool_limit(self, pool: str, limit: int) -> None:
+        """设置执行池的容量：该池中同时准入的任务数不超过 limit（如后台任务线程池的线程数）"""
+        with self.lock:
+            self.pool_limits[pool] = max(int(limit), 1)
+        self._dispatch()
+
+    def submit(self, owner: str, estimate_mb: float, start: Callable[[Ticket], None], label: str = "",
+               pool: Optional[str] = None) -> Ticket:
+        """
+        提交一个任务；准入后在调用 release 的线程或提交线程中调用 start(ticket)（start 应尽快返回，
+        如把任务交给线程池或唤醒等待的请求线程）
+
+        Args:
+            pool: 任务所属的执行池，池满时任务继续排队（不占用预算），其他任务可先准入
+
+        Returns:
+            任务票据，运行结束后调用 release(ticket)
+        """
+        ticket = Ticket(owner or "anonymous", estimate_mb, start, label, pool)
+        with self.lock:
+            self.queues.setdefault(ticket.owner, deque()).append(ticket)
+        self._dispatch()
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """任务结束（成功或失败），释放其预算并准入后续任务"""
+        with self.lock:
+            if ticket in self.running:
+                self.running.remove(ticket)
+                self.reserved_mb = max(0.0, self.reserved_mb - ticket.estimate_mb)
+            self._forget(ticket.owner)
+        self._dispatch()
+
+    def cancel(self, ticket: Ticket) -> bool:
+        """撤销仍在排队的任务，已准入时返回False"""
+        with self.lock:
+            queue = self.queues.get(ticket.owner)
+            if queue is None or ticket not in queue:
+                return False
+            queue.remove(ticket)
+            if not queue:
+                del self.queues[ticket.owner]
+            self._forget(ticket.owner)
+        # 撤销的可能是阻挡其他任务插队的队首任务
+        self._dispatch()
+        return True
+
+    @contextmanager
+    def admit(self, owner: str, estimate_mb: float, on_wait: Optional[Callable[[], None]] = None,
+              label: str = "") -> Iterator[Ticket]:
+        """
+        阻塞直到准入，结束时释放（同步请求使用）
+
+        用法:
+            with scheduler.admit("店铺A", 800) as ticket:
+                run_analysis(...)
+        """
+        admitted = threading.Event()
+        ticket = self.submit(owner, estimate_mb, lambda t: admitted.set(), label)
+        try:
+            if not admitted.is_set():
+                if on_wait is not None:
+                    on_wait()
+                admitted.wait()
+        except BaseException:
+            # 等待时被中断：未准入则撤销，已准入则释放
+            if not self.cancel(ticket):
+                self.release(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    # -------- 调度 --------
+    def _forget(self, owner: str) -> None:
+        """用户没有排队和运行中的任务时不再记录其准入时间（下次提交时与新用户同等对待）"""
+        if owner not in self.queues and all(t.owner != owner for t in self.running):
+            self.last_admitted.pop(owner, None)
+
+    def _pool_full(self, ticket: Ticket) -> bool:
+        limit = self.pool_limits.get(ticket.pool) if ticket.pool is not None else None
+        return limit is not None and sum(t.pool == ticket.pool for t in self.running) >= limit
+
+    def _fits(self, ticket: Ticket) -> bool:
+        if self._pool_full(ticket):
+            return False
+        if not self.running:
+            return True
+        return self.reserved_mb + ticket.estimate_mb <= self.budget_mb
+
+    def _select(self) -> Optional[Ticket]:
+        """
+        选出第一个放得下的队首任务：正在运行的任务少的用户优先，相同时最久未准入的用户优先；
+        有等待过久的队首任务时只考虑它（所属执行池已满的任务除外：它等的是线程而不是内存）
+        """
+        running = {}
+        for ticket in self.running:
+            running[ticket.owner] = running.get(ticket.owner, 0) + 1
+        heads = sorted((queue[0] for queue in self.queues.values()),
+                       key=lambda t: (running.get(t.owner, 0), self.last_admitted.get(t.owner, 0.0)))
+        if not heads:
+            return None
+        candidates = [t for t in heads if not self._pool_full(t)]
+        if not candidates:
+            return None
+        oldest = min(candidates, key=lambda t: t.enqueued_at)
+        if time.time() - oldest.enqueued_at > self.starvation_seconds:
+            heads = [oldest]
+        for ticket in heads:
+            if self._fits(ticket):
+                return ticket
+        return None
+
+    def _dispatch(self) -> None:
+        admitted = []
+        with self.lock:
+            while True:
+                ticket = self._select()
+                if ticket is None:
+                    break
+                queue = self.queues[ticket.owner]
+                queue.popleft()
+                if not queue:
+                    del self.queues[ticket.owner]
+                ticket.admitted_at = time.time()
+                self.last_admitted[ticket.owner] = ticket.admitted_at
+                if self.running:
+                    ticket.shared = True
+                    for other in self.running:
+                        other.shared = True
+                self.running.append(ticket)
+                self.reserved_mb += ticket.estimate_mb
+                admitted.append(ticket)
+        for ticket in admitted:
+            if self.metrics is not None:
+                self.metrics.observe("analysis_admission_wait_seconds", ticket.wait_seconds,
+                                     help="分析任务排队等待准入的时间（秒）")
+                self.metrics.inc("analysis_admitted_total", help="准入的分析任务数")
+            ticket.start(ticket)
+        self._update_gauges()
+
+    # -------- 状态 --------
+    def position(self, ticket: Ticket) -> Optional[int]:
+        """任务在其用户队列中的位置（从1开始），已准入时返回None"""
+        with self.lock:
+            queue = self.queues.get(ticket.owner)
+            if queue is None or ticket not in queue:
+                return None
+            return list(queue).index(ticket) + 1
+
+    def snapshot(self) -> dict:
+        """队列和预算占用（/healthz）"""
+        now = time.time()
+        with self.lock:
+            waiting = [t for queue in self.queues.values() for t in queue]
+            return {
+                "budget_mb": round(self.budget_mb, 1),
+                "reserved_mb": round(self.reserved_mb, 1),
+                "running": len(self.running),
+                "queued": len(waiting),
+                "queued_by_owner": {owner: len(queue) for owner, queue in self.queues.items()},
+                "oldest_wait_seconds": round(max((now - t.enqueued_at for t in waiting), default=0.0), 1),
+            }
+
+    def _update_gauges(self) -> None:
+        if self.metrics is None:
+            return
+        state = self.snapshot()
+        self.metrics.set_gauge("analysis_queue_depth", state["queued"], help="排队等待准入的分析任务数")
+        self.metrics.set_gauge("analysis_running", state["running"], help="正在运行的分析任务数")
+        self.metrics.set_gauge("analysis_memory_reserved_megabytes", state["reserved_mb"],
+                               help="正在运行的分析任务估算内存之和（MB）")
+        self.metrics.set_gauge("analysis_memory_budget_megabytes", state["budget_mb"],
+                               help="分析任务内存预算（MB）")
+
+
+def get_scheduler(metrics: Optional[MetricsRegistry] = None) -> AdmissionScheduler:
+    """按环境变量构建调度器（本进程的预算为整个服务的预算 / worker 进程数）"""
+    budget = os.environ.get("ANALYSIS_MEMORY_BUDGET_MB")
+    starvation = os.environ.get("ANALYSIS_STARVATION_SECONDS")
+    total = float(budget) if budget else default_budget_mb()
+    return AdmissionScheduler(total / worker_processes(), metrics,
+                              float(starvation) if starvation else STARVATION_SECONDS)
@@ -3,191 +3,97 @@
 """
 analysis_mal.py
 ------------------------------------------------
-马来跨境店财务数据分析模块
+马来跨境店财务数据分析模块（入口）
 - 支持多个订单表文件合并
 - 支持多个结算表文件合并
 - 单个产品消耗表
+
+计算由统一的分析引擎 region_engine 按 regions.MALAYSIA 配置执行，
+汇率、状态词表和SKU操作费均在配置中修改。
 """
 
 import pandas as pd
-import numpy as np
-from openpyxl import load_workbook
 from pathlib import Path
-from typing import List, Union
-
-# === 文件路径 ===
-orders_path     = '马7-1.1至4.30订单.xlsx'          # 订单表（第 2 行为注释）
-settlement_path = '马七 下 income_20250530073840.xlsx'  # 结算表
-cost_path       = '产品成本消耗表.xlsx'              # 产品成本消耗表
-output_path     = '订单_汇总_成本利润.xlsx'
+from typing import Callable, Dict, List, Optional, Union
 
-# 出库订单固定操作费（RM）
-OP_FEE = {'xifashui': 2.5, 'kingstick': 2.5}
+from profiling import StageProfiler
+from region_engine import run_region
+from region_engine import read_consumption_file as read_region_consumption
+from regions import MALAYSIA
+from table_io import ExcelSource, OutputTarget, TableSource
 
-def merge_order_files_mal(order_files: List[Union[str, Path]]) -> pd.DataFrame:
-    """合并多个马来订单表文件（跳过第2行注释）"""
-    all_orders = []
-    
-    for file_path in order_files:
-        try:
-            # 使用openpyxl读取，跳过第2行注释
-            wb = load_workbook(file_path, data_only=True)
-            rows = [[c for c in row] for row in wb.active.values]
-            header = [str(c).strip() if c else "" for c in rows[0]]
-            
-            # 跳过第2行注释，从第3行开始读取数据
-            df = pd.DataFrame(rows[2:], columns=header).dropna(subset=['Order ID'])
-            df.columns = df.columns.str.strip()
-            df['Order ID'] = df['Order ID'].astype(str)
-            df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce').fillna(0).astype(int)
-            
-            all_orders.append(df)
-            print(f"✅ 已读取马来订单文件: {Path(file_path).name} ({len(df)} 行)")
-        except Exception as e:
-            print(f"❌ 读取马来订单文件失败 {file_path}: {e}")
-            raise
-    
-    if not all_orders:
-        raise ValueError("没有成功读取任何马来订单文件")
-    
-    # 合并所有订单数据
-    merged_orders = pd.concat(all_orders, ignore_index=True)
-    print(f"📋 马来订单数据合并完成: 总计 {len(merged_orders)} 行")
-    
-    return merged_orders
+def read_consumption_file_mal(file_path: TableSource) -> pd.DataFrame:
+    """读取马来产品消耗成本表（使用解析缓存）；传入已解析的表时复制一份，避免修改调用方的数据"""
+    return read_region_consumption(MALAYSIA, file_path)
 
-def merge_settlement_files_mal(settlement_files: List[Union[str, Path]]) -> pd.DataFrame:
-    """合并多个马来结算表文件"""
-    all_settlements = []
-    
-    for file_path in settlement_files:
-        try:
-            df = pd.read_excel(file_path)
-            df.columns = df.columns.str.strip()
-            
-            # 过滤 Type 为 order 的记录
-            if 'Type' in df.columns:
-                df = df[df['Type'].astype(str).str.lower() == 'order']
-            
-            df['Order/adjustment ID'] = df['Order/adjustment ID'].astype(str)
-            
-            all_settlements.append(df)
-            print(f"✅ 已读取马来结算文件: {Path(file_path).name} ({len(df)} 行)")
-        except Exception as e:
-            print(f"❌ 读取马来结算文件失败 {file_path}: {e}")
-            raise
-    
-    if not all_settlements:
-        raise ValueError("没有成功读取任何马来结算文件")
-    
-    # 合并所有结算数据
-    merged_settlements = pd.concat(all_settlements, ignore_index=True)
-    print(f"💳 马来结算数据合并完成: 总计 {len(merged_settlements)} 行")
-    
-    return merged_settlements
-
-def process_malaysia_financial_data(order_files: List[Union[str, Path]], 
-                                  settlement_files: List[Union[str, Path]], 
-                                  consumption_file: Union[str, Path],
-                                  output_dir: Union[str, Path] = ".") -> Path:
+def process_malaysia_financial_data(order_files: List[ExcelSource], 
+                                  settlement_files: List[ExcelSource], 
+                                  consumption_file: TableSource,
+                                  output_dir: OutputTarget = ".",
+                                  workers: Optional[int] = None,
+                                  progress: Optional[Callable[[str, int], None]] = None,
+                                  writer_engine: Optional[str] = None,
+                                  output_format: str = "xlsx",
+                                  op_fee: Optional[Dict[str, float]] = None,
+                                  low_memory: bool = False,
+                                  state_dir: Optional[Union[str, Path]] = None,
+                                  sku_store: Optional[Union[str, Path]] = None,
+                                  profiler: Optional[StageProfiler] = None,
+                                  settlement_policy: str = "latest",
+                                  summary: Optional[dict] = None,
+                                  scenario_dir: Optional[Union[str, Path]] = None,
+                                  chunk_rows: Optional[int] = None,
+                                  memory_limit_mb: Optional[float] = None) -> OutputTarget:
     """
     处理马来跨境店财务数据分析
     
     Args:
-        order_files: 订单文件列表
+        order_files: 订单文件列表（文件路径或二进制文件对象，如上传流）
         settlement_files: 结算文件列表  
-        consumption_file: 产品消耗文件
-        output_dir: 输出目录
+        consumption_file: 产品消耗文件，或已解析的产品消耗成本表（DataFrame，多个店铺共用时只解析一次）
+        output_dir: 输出目录，或可写的二进制缓冲区（如 BytesIO，结果直接写入内存）
+        workers: 并行解析文件的进程数，None时使用默认配置
+        progress: 进度回调 progress(阶段名称, 百分比)，用于后台任务上报进度
+        writer_engine: 结果工作簿写出引擎（xlsxwriter / openpyxl），None时使用默认配置
+        output_format: 输出格式，xlsx / parquet / csv.gz（后两者为按工作表打包的zip）
+        op_fee: 出库订单SKU操作费映射，None时使用配置中的 sku_fees
+        low_memory: 低内存模式：只加载订单号/关键列/结算金额列，SKU和状态列使用分类类型，
+                    订单号使用pyarrow字符串（输出的订单表只包含这些列和计算列）
+        state_dir: 增量模式的状态目录。指定后只计算新增或变化的订单（状态变化、结算晚到），
+                   并在已保存的SKU聚合结果上增量更新；输出包含该目录累计的全部订单
+        sku_store: 本地分析数据库（SQLite）文件。指定后订单行、结算和成本数据作为一个批次写入数据库，
+                   SKU财务指标由SQL计算，历史批次可直接查询
+        profiler: 阶段统计（耗时、行数、RSS峰值），None时新建一个仅用于日志输出
+        settlement_policy: 同一订单多条 Order 类型结算记录的处理策略：latest（取最后一条）/
+                           sum（求和）/ exclude（不计结算金额）
+        summary: 传入字典时，分析完成后写入汇总指标（订单行数、SKU数、结算金额、人民币利润等）
+        scenario_dir: 保存场景测算数据的目录，之后可按新的汇率、操作费和SKU成本重算利润（见 scenarios.py）
+        chunk_rows: 分块模式每块的订单行数，订单表按块流式读取和计算（不输出订单表工作表，见 chunked_engine.py）
+        memory_limit_mb: 分块模式的内存上限（MB），指定后开启分块模式并按上限确定块大小
         
     Returns:
-        输出文件路径
+        输出文件路径，output_dir 为缓冲区时返回该缓冲区
     """
-    
-    print("🚀 开始马来跨境店财务数据分析...")
-    
-    # -------- 1) 读取订单表（跳过第 2 行注释） --------
-    order_df = merge_order_files_mal(order_files)
-    
-    # -------- 2) 读取结算表并合并结算金额 --------
-    sett_df = merge_settlement_files_mal(settlement_files)
-    
-    order_df = (order_df
-                .merge(sett_df[['Order/adjustment ID', 'Total settlement amount']],
-                       left_on='Order ID', right_on='Order/adjustment ID', how='left')
-                .drop(columns=['Order/adjustment ID']))
-    order_df['Total settlement amount'] = pd.to_numeric(order_df['Total settlement amount'],
-                                                       errors='coerce').fillna(0)
-    
-    # -------- 3) 标记出库 / 签收 / 取消 --------
-    order_df['is_shipped'] = order_df['Shipped Time'].notna() & \
-                             (order_df['Shipped Time'].astype(str).str.strip() != '')
-    status_lower = order_df['Order Status'].astype(str).str.lower()
-    order_df['is_signed']          = status_lower.isin(['completed', 'delivered'])
-    order_df['is_cancelled']       = status_lower == 'canceled'
-    order_df['cancel_before_ship'] = order_df['is_cancelled'] & ~order_df['is_shipped']
-    order_df['cancel_after_ship']  = order_df['is_cancelled'] &  order_df['is_shipped']
-    
-    # -------- 4) 计算操作费（未出库 = 0） --------
-    order_df['操作费'] = np.where(order_df['is_shipped'],
-                               order_df['Seller SKU'].map(OP_FEE).fillna(0), 0.0)
-    
-    order_df['shipped_qty'] = np.where(order_df['is_shipped'], order_df['Quantity'], 0)
-    order_df['signed_qty']  = np.where(order_df['is_signed'],  order_df['Quantity'], 0)
-    
-    # -------- 5) SKU 层汇总（基础指标） --------
-    sku = (order_df
-           .groupby('Seller SKU', as_index=False)
-           .agg(总结算金额      = ('Total settlement amount', 'sum'),
-                总操作费      = ('操作费', 'sum'),
-                订单数        = ('Order ID', 'count'),
-                出库订单数    = ('is_shipped', 'sum'),
-                签收订单数    = ('is_signed', 'sum'),
-                出库sku数    = ('shipped_qty', 'sum'),
-                签收sku数    = ('signed_qty', 'sum'),
-                出库前取消订单 = ('cancel_before_ship', 'sum'),
-                出库后取消订单 = ('cancel_after_ship', 'sum')))
-    sku['签收率']      = sku['签收订单数'] / sku['订单数']
-    sku['出库前取消率'] = sku['出库前取消订单'] / sku['订单数']
-    sku['出库后取消率'] = sku['出库后取消订单'] / sku['订单数']
-    
-    # -------- 6) 合并产品消耗成本表 --------
-    cost = pd.read_excel(consumption_file)
-    cost.columns = cost.columns.str.strip()
-    print(f"📊 已读取产品消耗文件: {Path(consumption_file).name} ({len(cost)} 行)")
-    
-    # 动态识别列名
-    sku_col   = 'Seller SKU' if 'Seller SKU' in cost.columns else 'seller sku'
-    unit_col  = '单sku马来币成本' if '单sku马来币成本' in cost.columns else '马来币单sku成本'
-    
-    cost_sub = (cost[[sku_col, unit_col, '马来币ads消耗', '马来币gmvmax消耗']]
-                .rename(columns={sku_col: 'Seller SKU', unit_col: '单sku马来币成本'}))
-    cost_sub[['单sku马来币成本', '马来币ads消耗', '马来币gmvmax消耗']] = \
-        cost_sub[['单sku马来币成本', '马来币ads消耗', '马来币gmvmax消耗']].apply(
-            pd.to_numeric, errors='coerce').fillna(0)
-    
-    sku = (sku.merge(cost_sub, on='Seller SKU', how='left')
-              .fillna({'单sku马来币成本': 0, '马来币ads消耗': 0, '马来币gmvmax消耗': 0}))
-    
-    # -------- 7) 利润相关指标 --------
-    sku['sku产品成本']   = sku['出库sku数'] * sku['单sku马来币成本']
-    sku['马来币操作费'] = sku['总操作费'] * 0.6
-    sku['利润']       = (sku['总结算金额'] - sku['马来币操作费'] - sku['sku产品成本']
-                       - sku['马来币ads消耗'] - sku['马来币gmvmax消耗'])
-    sku['人民币利润']  = sku['利润'] / 0.6
-    sku['毛利率']     = np.where(sku['总结算金额'] != 0, sku['利润'] / sku['总结算金额'], 0)
-    sku['每单利润']    = np.where(sku['签收订单数'] != 0, sku['人民币利润'] / sku['签收订单数'], 0)
-    
-    # -------- 8) 调整订单列顺序 --------
-    first_cols = ['Order ID', 'Total settlement amount', '操作费']
-    order_df = order_df[first_cols + [c for c in order_df.columns if c not in first_cols]]
-    
-    # -------- 9) 导出 --------
-    output_path = Path(output_dir) / '马来跨境店财务分析结果.xlsx'
-    
-    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-        order_df.to_excel(writer, sheet_name='订单表_含结算金额和操作费', index=False)
-        sku.to_excel(writer, sheet_name='sku总结算金额和操作费', index=False)
-        cost.to_excel(writer, sheet_name='产品消耗成本表', index=False)
-    
-    print(f'✔ 马来跨境店分析完成 → {output_path}')
-    return output_path
+    return run_region(MALAYSIA, order_files, settlement_files, consumption_file,
+                      output_dir=output_dir, workers=workers, progress=progress, writer_engine=writer_engine,
+                      output_format=output_format, fees=op_fee, low_memory=low_memory,
+                      state_dir=state_dir, sku_store=sku_store, profiler=profiler,
+                      settlement_policy=settlement_policy, summary=summary, scenario_dir=scenario_dir,
+                      chunk_rows=chunk_rows, memory_limit_mb=memory_limit_mb)
+
+if __name__ == "__main__":
+    # === 文件路径 ===
+    orders_path     = '马7-1.1至4.30订单.xlsx'          # 订单表（第 2 行为注释）
+    settlement_path = '马七 下 income_20250530073840.xlsx'  # 结算表
+    cost_path       = '产品成本消耗表.xlsx'              # 产品成本消耗表
+    
+    missing_files = [f for f in (orders_path, settlement_path, cost_path) if not Path(f).exists()]
+    if missing_files:
+        print(f"❌ 找不到测试文件: {missing_files}")
+        print("也可用 python benchmarks/synthetic_data.py --region malaysia 生成合成的测试数据")
+    else:
+        process_malaysia_financial_data(
+            order_files=[orders_path],
+            settlement_files=[settlement_path],
+            consumption_file=cost_path
+        )
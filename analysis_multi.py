@@ -3,336 +3,86 @@
 """
 analysis_multi.py
 ------------------------------------------------
-支持多文件处理的财务数据分析模块
+印尼本土店财务数据分析（入口）
 - 支持多个订单表文件合并
 - 支持多个结算表文件合并
 - 单个产品消耗表
 - 支持组合SKU预处理
+
+计算由统一的分析引擎 region_engine 按 regions.INDONESIA 配置执行，
+汇率、状态词表、操作费档位和组合SKU规则均在配置中修改。
 """
 
-import pandas as pd
 from pathlib import Path
-from typing import List, Union
-import re
-
-# 汇率设置
-IDR_PER_RMB, IDR_PER_USD = 2300, 16000
-
-def preprocess_combo_sku(df: pd.DataFrame, sku_col: str, qty_col: str) -> pd.DataFrame:
-    """
-    预处理组合SKU，将组合SKU转换为基础SKU并调整数量
-    
-    Args:
-        df: 包含订单数据的DataFrame
-        sku_col: SKU列名
-        qty_col: 数量列名
-    
-    Returns:
-        处理后的DataFrame
-    """
-    df = df.copy()
-    combo_count = 0
-    
-    # 组合SKU模式定义
-    # pattern: (正则表达式, 基础SKU提取函数, 倍数提取函数)
-    combo_patterns = [
-        # grease-2, grease-3 等模式
-        (r'^(.+)-(\d+)$', lambda m: f"{m.group(1)}-1", lambda m: int(m.group(2))),
-        # toothpaste*2, toothpaste*3 等模式  
-        (r'^(.+)\*(\d+)$', lambda m: f"{m.group(1)}*1", lambda m: int(m.group(2))),
-    ]
-    
-    for idx, sku in enumerate(df[sku_col]):
-        if pd.isna(sku):
-            continue
-            
-        sku_str = str(sku).strip()
-        original_qty = df.loc[idx, qty_col]
-        
-        # 检查每个组合SKU模式
-        for pattern, base_sku_func, multiplier_func in combo_patterns:
-            match = re.match(pattern, sku_str)
-            if match:
-                multiplier = multiplier_func(match)
-                # 只处理倍数大于1的情况
-                if multiplier > 1:
-                    base_sku = base_sku_func(match)
-                    new_qty = original_qty * multiplier
-                    
-                    df.loc[idx, sku_col] = base_sku
-                    df.loc[idx, qty_col] = new_qty
-                    combo_count += 1
-                    
-                    print(f"🔄 组合SKU转换: {sku_str} -> {base_sku}, 数量: {original_qty} -> {new_qty}")
-                break
-    
-    if combo_count > 0:
-        print(f"✅ 完成组合SKU预处理: 转换了 {combo_count} 个组合SKU")
-    else:
-        print("ℹ️  未发现需要处理的组合SKU")
-    
-    return df
+from typing import Callable, List, Optional, Union
 
-def merge_order_files(order_files: List[Union[str, Path]]) -> pd.DataFrame:
-    """合并多个订单表文件"""
-    all_orders = []
-    
-    for file_path in order_files:
-        try:
-            df = pd.read_excel(file_path, dtype=str)
-            # 标准化第一列为order_id
-            df = df.rename(columns={df.columns[0]: "order_id"})
-            all_orders.append(df)
-            print(f"✅ 已读取订单文件: {Path(file_path).name} ({len(df)} 行)")
-        except Exception as e:
-            print(f"❌ 读取订单文件失败 {file_path}: {e}")
-            raise
-    
-    if not all_orders:
-        raise ValueError("没有成功读取任何订单文件")
-    
-    # 合并所有订单数据
-    merged_orders = pd.concat(all_orders, ignore_index=True)
-    print(f"📋 订单数据合并完成: 总计 {len(merged_orders)} 行")
-    
-    return merged_orders
-
-def merge_settlement_files(settlement_files: List[Union[str, Path]]) -> pd.DataFrame:
-    """合并多个结算表文件"""
-    all_settlements = []
-    
-    for file_path in settlement_files:
-        try:
-            df = pd.read_excel(file_path, dtype=str)
-            # 标准化第一列为order_id
-            df = df.rename(columns={df.columns[0]: "order_id"})
-            
-            # 查找结算金额列
-            settlement_col = None
-            for col in df.columns:
-                if "settlement" in col.lower():
-                    settlement_col = col
-                    break
-            
-            if settlement_col and settlement_col != "Total settlement amount":
-                df = df.rename(columns={settlement_col: "Total settlement amount"})
-            
-            all_settlements.append(df)
-            print(f"✅ 已读取结算文件: {Path(file_path).name} ({len(df)} 行)")
-        except Exception as e:
-            print(f"❌ 读取结算文件失败 {file_path}: {e}")
-            raise
-    
-    if not all_settlements:
-        raise ValueError("没有成功读取任何结算文件")
-    
-    # 合并所有结算数据
-    merged_settlements = pd.concat(all_settlements, ignore_index=True)
-    print(f"💳 结算数据合并完成: 总计 {len(merged_settlements)} 行")
-    
-    return merged_settlements
+import pandas as pd
 
-def process_financial_data(order_files: List[Union[str, Path]], 
-                         settlement_files: List[Union[str, Path]], 
-                         consumption_file: Union[str, Path],
-                         output_dir: Union[str, Path] = ".") -> Path:
+from fee_rules import FeeTier
+from profiling import StageProfiler
+from region_engine import run_region
+from region_engine import read_consumption_file as read_region_consumption
+from regions import INDONESIA
+from table_io import ExcelSource, OutputTarget, TableSource
+
+
+def read_consumption_file(file_path: TableSource) -> pd.DataFrame:
+    """读取印尼产品消耗表（使用解析缓存）；传入已解析的表时复制一份，避免修改调用方的数据"""
+    return read_region_consumption(INDONESIA, file_path)
+
+def process_financial_data(order_files: List[ExcelSource], 
+                         settlement_files: List[ExcelSource], 
+                         consumption_file: TableSource,
+                         output_dir: OutputTarget = ".",
+                         workers: Optional[int] = None,
+                         progress: Optional[Callable[[str, int], None]] = None,
+                         writer_engine: Optional[str] = None,
+                         output_format: str = "xlsx",
+                         fee_tiers: Optional[List[FeeTier]] = None,
+                         low_memory: bool = False,
+                         state_dir: Optional[Union[str, Path]] = None,
+                         sku_store: Optional[Union[str, Path]] = None,
+                         profiler: Optional[StageProfiler] = None,
+                         settlement_policy: str = "exclude",
+                         summary: Optional[dict] = None,
+                         scenario_dir: Optional[Union[str, Path]] = None,
+                         chunk_rows: Optional[int] = None,
+                         memory_limit_mb: Optional[float] = None) -> OutputTarget:
     """
-    处理财务数据分析
+    处理印尼本土店财务数据分析
     
     Args:
-        order_files: 订单文件列表
+        order_files: 订单文件列表（文件路径或二进制文件对象，如上传流）
         settlement_files: 结算文件列表  
-        consumption_file: 产品消耗文件
-        output_dir: 输出目录
+        consumption_file: 产品消耗文件，或已解析的产品消耗表（DataFrame，多个店铺共用时只解析一次）
+        output_dir: 输出目录，或可写的二进制缓冲区（如 BytesIO，结果直接写入内存）
+        workers: 并行解析文件的进程数，None时使用默认配置
+        progress: 进度回调 progress(阶段名称, 百分比)，用于后台任务上报进度
+        writer_engine: 结果工作簿写出引擎（xlsxwriter / openpyxl），None时使用默认配置
+        output_format: 输出格式，xlsx / parquet / csv.gz（后两者为按工作表打包的zip）
+        fee_tiers: 订单操作费档位，None时使用配置中的 fee_tiers
+        low_memory: 低内存模式：只加载订单号/关键列/结算金额列，SKU和状态列使用分类类型，
+                    订单号使用pyarrow字符串（输出的订单表只包含这些列和计算列）
+        state_dir: 增量模式的状态目录。指定后只计算新增或变化的订单（状态变化、结算晚到），
+                   并在已保存的SKU聚合结果上增量更新；输出包含该目录累计的全部订单
+        sku_store: 本地分析数据库（SQLite）文件。指定后订单行、结算和消耗数据作为一个批次写入数据库，
+                   SKU财务指标由SQL计算，历史批次可直接查询
+        profiler: 阶段统计（耗时、行数、RSS峰值），None时新建一个仅用于日志输出
+        settlement_policy: 同一订单多行结算的处理策略：exclude（整单排除并单独列出）/ sum（求和）/
+                           latest（取最后一行）
+        summary: 传入字典时，分析完成后写入汇总指标（订单行数、SKU数、结算金额、人民币利润等）
+        scenario_dir: 保存场景测算数据的目录，之后可按新的汇率、操作费和SKU成本重算利润（见 scenarios.py）
+        chunk_rows: 分块模式每块的订单行数，订单表按块流式读取和计算（不输出订单表工作表，见 chunked_engine.py）
+        memory_limit_mb: 分块模式的内存上限（MB），指定后开启分块模式并按上限确定块大小
         
     Returns:
-        输出文件路径
+        输出文件路径，output_dir 为缓冲区时返回该缓冲区
     """
-    
-    print("🚀 开始财务数据分析...")
-    
-    # -------- 读取和合并文件 --------
-    order = merge_order_files(order_files)
-    settle = merge_settlement_files(settlement_files)
-    cons = pd.read_excel(consumption_file, dtype=str)
-    print(f"📊 已读取产品消耗文件: {Path(consumption_file).name} ({len(cons)} 行)")
-
-    # -------- 数据预处理 --------
-    # 处理结算金额
-    if "Total settlement amount" not in settle.columns:
-        settlement_cols = [c for c in settle.columns if "settlement" in c.lower()]
-        if settlement_cols:
-            settle = settle.rename(columns={settlement_cols[0]: "Total settlement amount"})
-        else:
-            raise ValueError("结算表中找不到结算金额列")
-    
-    settle["Total settlement amount"] = pd.to_numeric(settle["Total settlement amount"], errors="coerce")
-
-    # 处理重复订单
-    dup_settle = settle[settle.duplicated("order_id", keep=False)]
-    settle = settle.drop_duplicates("order_id", keep=False)
-    print(f"⚠️  排除重复结算订单: {len(dup_settle)} 行")
-
-    # 合并订单和结算数据
-    order = order.merge(settle[["order_id","Total settlement amount"]], on="order_id", how="left")
-
-    # 识别关键列
-    qty_col = None
-    sku_col = None
-    ship_col = None
-    status_col = None
-    
-    for col in order.columns:
-        if "数量" in col and qty_col is None:
-            qty_col = col
-        elif "sku" in col.lower() and sku_col is None:
-            sku_col = col
-        elif "是否出库" in col and ship_col is None:
-            ship_col = col
-        elif "平台状态" in col and status_col is None:
-            status_col = col
-    
-    if not all([qty_col, sku_col, ship_col, status_col]):
-        missing = []
-        if not qty_col: missing.append("数量列")
-        if not sku_col: missing.append("SKU列")
-        if not ship_col: missing.append("是否出库列")
-        if not status_col: missing.append("平台状态列")
-        raise ValueError(f"订单表中缺少必要列: {', '.join(missing)}")
-
-    print(f"📝 识别到关键列: 数量({qty_col}), SKU({sku_col}), 出库({ship_col}), 状态({status_col})")
-
-    # 数据类型转换（必须在组合SKU预处理之前进行）
-    order[qty_col] = pd.to_numeric(order[qty_col], errors="coerce").fillna(0).astype(int)
-
-    # -------- 组合SKU预处理 --------
-    print("🔧 开始组合SKU预处理...")
-    order = preprocess_combo_sku(order, sku_col, qty_col)
-
-    # 继续其他数据转换
-    order["_shipped"] = order[ship_col].str.strip().str.lower()
-    order["_status"] = order[status_col].str.strip().str.lower()
-
-    # 计算每行结算金额和操作费
-    lines = order.groupby("order_id")["order_id"].transform("size")
-    order["settlement_per_line"] = order["Total settlement amount"] / lines
-
-    # 运营费用计算
-    tot_qty = order.groupby("order_id")[qty_col].transform("sum")
-    order["order_fee_rmb"] = [
-        2.0 if (s=="yes" and q==1) else 2.5 if (s=="yes" and q>1) else 0.0
-        for s,q in zip(order["_shipped"], tot_qty)
-    ]
-    order["operation_fee_per_line_rmb"] = order.groupby("order_id")["order_fee_rmb"].transform("max") / lines
-
-    # -------- SKU级别聚合 --------
-    pair_df = order[[sku_col,"order_id","_shipped","_status"]].drop_duplicates([sku_col,"order_id"])
-
-    # 订单级计数
-    metrics = {
-        "订单数": pair_df.groupby(sku_col)["order_id"].nunique(),
-        "出库订单数数量": pair_df[pair_df["_shipped"]=="yes"].groupby(sku_col)["order_id"].nunique(),
-        "签收订单数": pair_df[pair_df["_status"].isin(["delivered","completed"])]\
-                     .groupby(sku_col)["order_id"].nunique(),
-        "取消订单数": pair_df[pair_df["_status"]=="cancelled"].groupby(sku_col)["order_id"].nunique(),
-        "出库前取消订单数": pair_df[(pair_df["_status"]=="cancelled") & (pair_df["_shipped"]=="no")]\
-                         .groupby(sku_col)["order_id"].nunique(),
-        "出库后取消订单数": pair_df[(pair_df["_status"]=="cancelled") & (pair_df["_shipped"]=="yes")]\
-                         .groupby(sku_col)["order_id"].nunique(),
-        "仍在途订单数": pair_df[pair_df["_status"]=="in transit"].groupby(sku_col)["order_id"].nunique(),
-    }
-
-    # 金额 & 数量聚合
-    shipped_order = order[order["_shipped"] == "yes"]
-    delivered_order = order[order["_status"].isin(["delivered","completed"])]
-    
-    base = order.groupby(sku_col).agg(
-        sku_total_settlement    = ("settlement_per_line", "sum"),
-        sku_total_operation_fee = ("operation_fee_per_line_rmb", "sum")
-    )
-    
-    # 出库数量
-    shipped_qty = shipped_order.groupby(sku_col)[qty_col].sum()
-    base = base.join(shipped_qty.rename("出库数量"), how="left")
-    
-    # 签收金额  
-    delivered_amount = delivered_order.groupby(sku_col)["settlement_per_line"].sum()
-    base = base.join(delivered_amount.rename("签收金额"), how="left")
-
-    sku = base
-    for k,v in metrics.items(): 
-        sku = sku.join(v.rename(k), how="left")
-    sku = sku.fillna(0)
-
-    # 运营率计算
-    sku["签收率"] = sku["签收订单数"] / sku["订单数"]
-    sku["取消率"] = sku["取消订单数"] / sku["订单数"]
-    sku["出库前取消率"] = sku["出库前取消订单数"] / sku["订单数"]
-    sku["出库后取消率"] = sku["出库后取消订单数"] / sku["订单数"]
-    sku["仍在途率"] = sku["仍在途订单数"] / sku["订单数"]
-    sku = sku.drop(columns=["取消订单数","出库前取消订单数","出库后取消订单数","仍在途订单数"])
-
-    # -------- 产品消耗数据处理 --------
-    if sku_col not in cons.columns:
-        cons = cons.rename(columns={cons.columns[0]: sku_col})
-    
-    # 数值列转换
-    for c in cons.columns:
-        if c != sku_col: 
-            cons[c] = pd.to_numeric(cons[c], errors="coerce")
-    
-    # 确保必要列存在
-    for col in ["印尼盾ads消耗","印尼盾gmvmax消耗","印尼盾单sku成本"]:
-        if col not in cons.columns: 
-            cons[col] = 0.0
-
-    # 货币转换
-    cons["美金ads消耗"] = cons["印尼盾ads消耗"] / IDR_PER_USD
-    cons["美金gmvmax消耗"] = cons["印尼盾gmvmax消耗"] / IDR_PER_USD
-    cons["人民币单sku成本"] = cons["印尼盾单sku成本"] / IDR_PER_RMB
-
-    # 合并消耗数据
-    keep = [sku_col,"印尼盾ads消耗","印尼盾gmvmax消耗","美金ads消耗",
-            "美金gmvmax消耗","印尼盾单sku成本","人民币单sku成本"]
-    sku = sku.merge(cons[keep], on=sku_col, how="left").fillna(0)
-
-    # -------- 财务指标计算 --------
-    sku["印尼盾操作费"] = sku["sku_total_operation_fee"] * IDR_PER_RMB
-    sku["印尼盾消耗"] = sku["印尼盾ads消耗"] + sku["印尼盾gmvmax消耗"]
-    sku["印尼盾产品成本"] = sku["印尼盾单sku成本"] * sku["出库数量"]
-
-    sku["利润"] = sku["sku_total_settlement"] - sku["印尼盾操作费"] - sku["印尼盾产品成本"] - sku["印尼盾消耗"]
-    sku["人民币利润"] = sku["利润"] / IDR_PER_RMB
-    sku["签收毛利率"] = sku["利润"] / sku["签收金额"].replace(0, pd.NA)
-    sku["每单利润"] = sku["人民币利润"] / sku["签收订单数"].replace(0, pd.NA)
-
-    # -------- 输出结果 --------
-    output_path = Path(output_dir) / "财务分析结果_多文件.xlsx"
-    
-    with pd.ExcelWriter(output_path, engine="openpyxl") as w:
-        # 订单表（含结算与操作费）
-        order.to_excel(w, sheet_name="订单表_含结算与操作费", index=False)
-        
-        # SKU汇总（结算与操作费）
-        sku[["sku_total_settlement","sku_total_operation_fee"]].reset_index()\
-           .to_excel(w, sheet_name="sku汇总_结算与操作费", index=False)
-        
-        # 排除的重复订单
-        if len(dup_settle) > 0:
-            dup_settle.to_excel(w, sheet_name="排除订单_多行结算", index=False)
-        
-        # SKU财务指标
-        cols = sku.columns.tolist()
-        if "印尼盾操作费" in cols:
-            # 将印尼盾操作费移到前面
-            cols.insert(3, cols.pop(cols.index("印尼盾操作费")))
-        sku[cols].reset_index().to_excel(w, sheet_name="sku财务指标", index=False)
-    
-    print(f"✅ 分析完成! 结果已保存到: {output_path}")
-    print(f"📈 处理了 {len(order_files)} 个订单文件, {len(settlement_files)} 个结算文件")
-    print(f"📊 总计订单: {len(order)} 行, SKU数量: {len(sku)} 个")
-    
-    return output_path
+    return run_region(INDONESIA, order_files, settlement_files, consumption_file,
+                      output_dir=output_dir, workers=workers, progress=progress, writer_engine=writer_engine,
+                      output_format=output_format, fees=fee_tiers, low_memory=low_memory, state_dir=state_dir,
+                      sku_store=sku_store, profiler=profiler, settlement_policy=settlement_policy, summary=summary,
+                      scenario_dir=scenario_dir, chunk_rows=chunk_rows, memory_limit_mb=memory_limit_mb)
 
 if __name__ == "__main__":
     # 测试用例
@@ -349,6 +99,7 @@ if __name__ == "__main__":
     if missing_files:
         print(f"❌ 找不到测试文件: {missing_files}")
         print("请确保测试文件存在或直接通过 Flask 应用使用此模块")
+        print("也可用 python benchmarks/synthetic_data.py 生成合成的测试数据")
     else:
         process_financial_data(
             order_files=test_order_files,
@@ -4,130 +4,555 @@
 Flask后端服务器 - 财务数据分析系统
 """
 
+import hashlib
+import importlib
+import io
+import json
 import os
 import tempfile
+import threading
+import time
 import traceback
+import uuid
 from pathlib import Path
-from flask import Flask, request, send_file, jsonify, render_template_string
+from flask import Flask, Request, Response, request, send_file, jsonify, render_template_string
 from werkzeug.utils import secure_filename
-import pandas as pd
 
-# 导入分析模块
-from analysis_multi import process_financial_data
-from analysis_mal import process_malaysia_financial_data
+# 分析模块（pandas / numpy / openpyxl）在首次分析或后台预加载时才导入，见 analysis_pipelines()
+from admission import MemoryEstimator, get_scheduler
+from jobs import FINISHED, JobManager
+from profiling import MetricsRegistry, StageProfiler, call_profiler, current_rss_mb
+from result_cache import copy_entry, get_result_cache, result_key
+
+# 上传文件在内存中缓冲的上限（字节），超过后才溢出到 UPLOAD_SPOOL_DIR（默认系统临时目录）
+UPLOAD_SPOOL_MAX_BYTES = int(os.environ.get('UPLOAD_SPOOL_MAX_BYTES', 32 * 1024 * 1024))
+UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or None
+
+class UploadRequest(Request):
+    """上传文件写入可配置上限的 SpooledTemporaryFile（werkzeug 默认超过500KB即落盘到临时目录）"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES, mode='rb+', dir=UPLOAD_SPOOL_DIR)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
 
+# 上传文件解析缓存目录（按文件内容哈希缓存解析结果，重复上传的文件跳过Excel解析）
+os.environ.setdefault('PARSE_CACHE_DIR', str(Path(__file__).resolve().parent / '.cache' / 'parse'))
+
+# 整次分析结果缓存目录（同一组文件和参数重复提交时直接返回之前的结果，相同请求同时到达时只计算一次）
+os.environ.setdefault('RESULT_CACHE_DIR', str(Path(__file__).resolve().parent / '.cache' / 'results'))
+result_cache = get_result_cache()
+
+# 各阶段耗时、行数、内存指标（/metrics）
+metrics = MetricsRegistry()
+
+# 内存准入控制：按上传文件估算每次分析的峰值内存，估算之和超过预算时排队（按用户/店铺公平轮转）
+memory_estimator = MemoryEstimator()
+admission_scheduler = get_scheduler(metrics)
+
+# 后台任务：工作目录、并发分析数、结果保留时间（秒）
+job_manager = JobManager(
+    root=os.environ.get('JOB_DIR', str(Path(__file__).resolve().parent / '.cache' / 'jobs')),
+    max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+    retention_seconds=int(os.environ.get('JOB_RETENTION_SECONDS', 3600)),
+    scheduler=admission_scheduler,
+)
+
+# 增量分析状态根目录，每个 state_key（如店铺名）一个子目录
+INCREMENTAL_STATE_DIR = Path(os.environ.get('INCREMENTAL_STATE_DIR', str(Path(__file__).resolve().parent / '.cache' / 'state')))
+
+# 本地分析数据库文件（SQLite），配置后每次分析的数据写入数据库、SKU指标由SQL计算
+SKU_STORE_PATH = os.environ.get('SKU_STORE_PATH') or None
+
+# 后台任务保存场景测算数据的子目录；单次场景测算的场景数上限
+SCENARIO_DIR_NAME = 'scenario'
+SCENARIO_MAX = int(os.environ.get('SCENARIO_MAX', 1000))
+
+# 同步接口（/process）开启函数级剖析时的结果目录；后台任务的剖析结果保存在任务目录
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', str(Path(__file__).resolve().parent / '.cache' / 'profiles')))
+
 # 允许的文件扩展名
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
 
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# 预加载的模块：分析流程及其按需导入的Excel/列式读写库（预加载后首个请求不再承担导入耗时）
+WARM_IMPORTS = ['analysis_multi', 'analysis_mal', 'openpyxl', 'xlsxwriter', 'python_calamine', 'pyarrow.parquet']
+
+# 分析模块预加载方式：background（默认，启动后在后台线程导入，首页无需等待）/ off（首次分析时导入）
+ANALYSIS_PRELOAD = os.environ.get('ANALYSIS_PRELOAD', 'background')
+
+STARTED_AT = time.time()
+
+def warm_up():
+    """预先导入分析流程和读写库，未安装的可选库直接跳过"""
+    for name in WARM_IMPORTS:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+def analysis_pipelines():
+    """返回 (印尼分析函数, 马来分析函数)；首次调用时导入分析模块"""
+    from analysis_multi import process_financial_data
+    from analysis_mal import process_malaysia_financial_data
+    return process_financial_data, process_malaysia_financial_data
+
+def output_formats():
+    """输出格式 -> 文件后缀"""
+    from table_io import OUTPUT_FORMATS
+    return OUTPUT_FORMATS
+
+if ANALYSIS_PRELOAD == 'background':
+    threading.Thread(target=warm_up, name='analysis-preload', daemon=True).start()
+
+# 首页内容（首次请求时读入内存，之后直接返回）
+INDEX_PATH = Path(__file__).resolve().parent / 'index.html'
+_index_page = None
+
+def state_dir_for(state_key):
+    """state_key 对应的状态目录：安全文件名 + 哈希（中文店铺名经 secure_filename 后可能相同）"""
+    digest = hashlib.sha256(state_key.encode('utf-8')).hexdigest()[:12]
+    return INCREMENTAL_STATE_DIR / f"{secure_filename(state_key) or 'state'}-{digest}"
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @app.route('/')
 def index():
-    """返回前端页面"""
+    """返回前端页面（内存缓存，支持 ETag 条件请求）"""
+    global _index_page
+    if _index_page is None:
+        try:
+            _index_page = INDEX_PATH.read_bytes()
+        except FileNotFoundError:
+            return """
+            <h1>错误</h1>
+            <p>找不到 index.html 文件。请确保前端文件存在。</p>
+            """, 404
+    response = Response(_index_page, mimetype='text/html')
+    response.set_etag(hashlib.sha256(_index_page).hexdigest()[:16])
+    return response.make_conditional(request)
+
+def validate_uploads():
+    """
+    校验上传请求
+    
+    Returns:
+        (上传内容字典, None) 或 (None, 错误响应)
+    """
+    # 获取分析模块类型
+    analysis_type = request.form.get('analysis_type', 'indonesia')
+    
+    # 检查是否有文件上传
+    if 'orders' not in request.files or 'settlements' not in request.files or 'consumption' not in request.files:
+        return None, (jsonify({'error': '缺少必要的文件。请确保上传了订单表、结算表和产品消耗表。'}), 400)
+
+    # 获取上传的文件
+    order_files = request.files.getlist('orders')
+    settlement_files = request.files.getlist('settlements')
+    consumption_file = request.files['consumption']
+
+    # 验证文件
+    if not order_files or not settlement_files or not consumption_file:
+        return None, (jsonify({'error': '请上传所有必要的文件'}), 400)
+
+    if request.form.get('output_format', 'xlsx') not in output_formats():
+        return None, (jsonify({'error': f"不支持的输出格式: {request.form.get('output_format')}"}), 400)
+
+    # 增量模式：只对印尼模块开放
+    state_key = request.form.get('state_key') or None
+    if state_key is not None and analysis_type != 'indonesia':
+        return None, (jsonify({'error': '增量分析仅支持印尼模块'}), 400)
+
+    # 检查文件类型
+    all_files = order_files + settlement_files + [consumption_file]
+    for file in all_files:
+        if file.filename == '' or not allowed_file(file.filename):
+            return None, (jsonify({'error': f'文件 {file.filename} 格式不正确，请上传Excel文件'}), 400)
+
+    return {
+        'analysis_type': analysis_type,
+        # 结果工作簿写出引擎（xlsxwriter / openpyxl），未指定时使用默认配置
+        'writer_engine': request.form.get('writer_engine') or None,
+        # 输出格式（xlsx / parquet / csv.gz）
+        'output_format': request.form.get('output_format') or 'xlsx',
+        # 增量分析状态目录（未指定 state_key 时为全量分析）
+        'state_dir': state_dir_for(state_key) if state_key else None,
+        # 是否做函数级剖析（cProfile，安装 pyinstrument 时输出火焰图）
+        'profile': request.form.get('profile', '').lower() in ('1', 'true', 'yes'),
+        # 准入调度的排队单位：店铺名（shop）或增量分析的 state_key，其次为登录用户、客户端地址
+        'owner': (request.form.get('shop') or state_key or request.remote_user or request.remote_addr
+                  or 'anonymous'),
+        'orders': order_files,
+        'settlements': settlement_files,
+        'consumption': consumption_file,
+    }, None
+
+def save_uploads(uploads, temp_path: Path):
+    """把上传文件保存到目录，返回 (订单文件路径列表, 结算文件路径列表, 消耗文件路径)"""
+    # 保存订单文件
+    order_paths = []
+    for i, file in enumerate(uploads['orders']):
+        filename = f"order_{i+1}_{secure_filename(file.filename)}"
+        file_path = temp_path / filename
+        file.save(str(file_path))
+        order_paths.append(file_path)
+
+    # 保存结算文件
+    settlement_paths = []
+    for i, file in enumerate(uploads['settlements']):
+        filename = f"settlement_{i+1}_{secure_filename(file.filename)}"
+        file_path = temp_path / filename
+        file.save(str(file_path))
+        settlement_paths.append(file_path)
+
+    # 保存消耗文件
+    consumption_filename = f"consumption_{secure_filename(uploads['consumption'].filename)}"
+    consumption_path = temp_path / consumption_filename
+    uploads['consumption'].save(str(consumption_path))
+
+    return order_paths, settlement_paths, consumption_path
+
+def result_cache_key(uploads, scenario=False):
+    """
+    上传内容对应的结果缓存键：各文件内容哈希 + 分析模块、地区配置和输出参数
+
+    增量模式（结果取决于之前的状态）和函数级剖析（需要实际运行）不使用缓存，返回None
+    """
+    if result_cache is None or uploads['state_dir'] is not None or uploads['profile']:
+        return None
+    from parse_cache import file_sha256
+    from regions import REGION_PROFILES
+    analysis_type = uploads['analysis_type'] if uploads['analysis_type'] == 'malaysia' else 'indonesia'
+    return result_key(
+        analysis_type,
+        [file_sha256(f) for f in uploads['orders']],
+        [file_sha256(f) for f in uploads['settlements']],
+        file_sha256(uploads['consumption']),
+        profile=REGION_PROFILES[analysis_type],
+        output_format=uploads['output_format'],
+        writer_engine=uploads['writer_engine'],
+        sku_store=SKU_STORE_PATH is not None,
+        scenario=scenario,
+    )
+
+def estimate_memory(analysis_type, order_files, settlement_files, consumption_file):
+    """按上传文件（路径或文件对象）估算一次分析的峰值内存（MB）"""
+    region = 'malaysia' if analysis_type == 'malaysia' else 'indonesia'
+    return memory_estimator.estimate(region, list(order_files) + list(settlement_files) + [consumption_file])
+
+def calibrate_memory(analysis_type, ticket, profiler, rss_start):
+    """运行期间没有其他分析并发时，按实测峰值增量校准内存估算"""
+    peak = profiler.to_dict()['peak_rss_mb']
+    if ticket is None or ticket.shared or peak is None:
+        return
+    region = 'malaysia' if analysis_type == 'malaysia' else 'indonesia'
+    memory_estimator.observe(region, ticket.estimate_mb, peak - rss_start)
+
+def record_cache_status(analysis_type, status):
+    metrics.inc('result_cache_requests_total', help='结果缓存查询次数（hit/coalesced/miss）',
+                analysis_type=analysis_type, status=status)
+
+def result_mimetype(filename):
+    """根据结果文件名返回下载的MIME类型"""
+    return XLSX_MIMETYPE if str(filename).endswith('.xlsx') else 'application/zip'
+
+def run_analysis(analysis_type, order_paths, settlement_paths, consumption_path, output_dir,
+                 progress=None, writer_engine=None, output_format='xlsx', state_dir=None, profiler=None,
+                 scenario_dir=None, ticket=None):
+    """
+    根据选择的模块执行数据分析，返回 (结果文件路径, 下载文件名)
+
+    输入文件可以是路径或上传文件对象；output_dir 为 BytesIO 时结果写入该缓冲区并原样返回；
+    state_dir 不为空时印尼模块使用增量模式；scenario_dir 不为空时保存场景测算数据；
+    各阶段统计记录到 profiler 并累计到 /metrics；ticket 为准入票据，用实测峰值校准内存估算
+    """
+    profiler = profiler or StageProfiler(analysis_type)
+    # 先导入分析模块，校准用的峰值增量不包含首次导入的内存
+    analysis_pipelines()
+    rss_start = current_rss_mb()
     try:
-        with open('index.html', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return """
-        <h1>错误</h1>
-        <p>找不到 index.html 文件。请确保前端文件存在。</p>
-        """, 404
+        result = _run_pipeline(analysis_type, order_paths, settlement_paths, consumption_path, output_dir,
+                               progress, writer_engine, output_format, state_dir, profiler, scenario_dir)
+    except Exception:
+        metrics.record_profile(profiler, status='failed')
+        raise
+    metrics.record_profile(profiler)
+    calibrate_memory(analysis_type, ticket, profiler, rss_start)
+    return result
+
+def _run_pipeline(analysis_type, order_paths, settlement_paths, consumption_path, output_dir,
+                  progress, writer_engine, output_format, state_dir, profiler, scenario_dir):
+    suffix = output_formats()[output_format]
+    process_financial_data, process_malaysia_financial_data = analysis_pipelines()
+    if analysis_type == 'malaysia':
+        output_path = process_malaysia_financial_data(
+            order_files=order_paths,
+            settlement_files=settlement_paths,
+            consumption_file=consumption_path,
+            output_dir=output_dir,
+            progress=progress,
+            writer_engine=writer_engine,
+            output_format=output_format,
+            sku_store=SKU_STORE_PATH,
+            profiler=profiler,
+            scenario_dir=scenario_dir
+        )
+        return output_path, f'马来跨境店财务分析结果{suffix}'
+
+    # indonesia (默认)
+    output_path = process_financial_data(
+        order_files=order_paths,
+        settlement_files=settlement_paths,
+        consumption_file=consumption_path,
+        output_dir=output_dir,
+        progress=progress,
+        writer_engine=writer_engine,
+        output_format=output_format,
+        state_dir=state_dir,
+        sku_store=SKU_STORE_PATH,
+        profiler=profiler,
+        scenario_dir=scenario_dir
+    )
+    return output_path, f'印尼财务分析结果{suffix}'
 
 @app.route('/process', methods=['POST'])
 def process_files():
-    """处理上传的文件并执行分析"""
+    """处理上传的文件并执行分析（同步返回结果文件）"""
     try:
-        # 获取分析模块类型
-        analysis_type = request.form.get('analysis_type', 'indonesia')
-        
-        # 检查是否有文件上传
-        if 'orders' not in request.files or 'settlements' not in request.files or 'consumption' not in request.files:
-            return jsonify({'error': '缺少必要的文件。请确保上传了订单表、结算表和产品消耗表。'}), 400
-
-        # 获取上传的文件
-        order_files = request.files.getlist('orders')
-        settlement_files = request.files.getlist('settlements')
-        consumption_file = request.files['consumption']
-
-        # 验证文件
-        if not order_files or not settlement_files or not consumption_file:
-            return jsonify({'error': '请上传所有必要的文件'}), 400
-
-        # 检查文件类型
-        all_files = order_files + settlement_files + [consumption_file]
-        for file in all_files:
-            if file.filename == '' or not allowed_file(file.filename):
-                return jsonify({'error': f'文件 {file.filename} 格式不正确，请上传Excel文件'}), 400
-
-        # 创建临时目录
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # 保存订单文件
-            order_paths = []
-            for i, file in enumerate(order_files):
-                filename = f"order_{i+1}_{secure_filename(file.filename)}"
-                file_path = temp_path / filename
-                file.save(str(file_path))
-                order_paths.append(file_path)
-
-            # 保存结算文件
-            settlement_paths = []
-            for i, file in enumerate(settlement_files):
-                filename = f"settlement_{i+1}_{secure_filename(file.filename)}"
-                file_path = temp_path / filename
-                file.save(str(file_path))
-                settlement_paths.append(file_path)
-
-            # 保存消耗文件
-            consumption_filename = f"consumption_{secure_filename(consumption_file.filename)}"
-            consumption_path = temp_path / consumption_filename
-            consumption_file.save(str(consumption_path))
-
-            # 根据选择的模块执行数据分析
-            try:
-                if analysis_type == 'malaysia':
-                    output_path = process_malaysia_financial_data(
-                        order_files=order_paths,
-                        settlement_files=settlement_paths,
-                        consumption_file=consumption_path,
-                        output_dir=temp_path
-                    )
-                    download_name = '马来跨境店财务分析结果.xlsx'
-                else:  # indonesia (默认)
-                    output_path = process_financial_data(
-                        order_files=order_paths,
-                        settlement_files=settlement_paths,
-                        consumption_file=consumption_path,
-                        output_dir=temp_path
-                    )
-                    download_name = '印尼财务分析结果.xlsx'
-                
-                # 返回结果文件
-                return send_file(
-                    output_path,
-                    as_attachment=True,
-                    download_name=download_name,
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        uploads, error = validate_uploads()
+        if error:
+            return error
+
+        # 相同文件和参数之前分析过时直接返回缓存的结果
+        key = result_cache_key(uploads)
+        profiler = StageProfiler(uploads['analysis_type'])
+        profile_path = PROFILE_DIR / uuid.uuid4().hex if uploads['profile'] else None
+        admission = {'wait_seconds': 0.0}
+
+        def produce(output_dir):
+            # 估算内存放得进预算时才开始分析，否则请求在此排队
+            estimate = estimate_memory(uploads['analysis_type'], uploads['orders'], uploads['settlements'],
+                                       uploads['consumption'])
+            with admission_scheduler.admit(uploads['owner'], estimate) as ticket, call_profiler(profile_path):
+                admission['wait_seconds'] = ticket.wait_seconds
+                return run_analysis(
+                    uploads['analysis_type'], uploads['orders'], uploads['settlements'], uploads['consumption'],
+                    output_dir,
+                    writer_engine=uploads['writer_engine'],
+                    output_format=uploads['output_format'],
+                    state_dir=uploads['state_dir'],
+                    profiler=profiler,
+                    ticket=ticket
                 )
 
-            except Exception as e:
-                app.logger.error(f"数据分析错误: {str(e)}")
-                app.logger.error(traceback.format_exc())
-                return jsonify({'error': f'数据分析失败: {str(e)}'}), 500
+        try:
+            if key is None:
+                # 上传流直接交给解析器，结果写入内存缓冲区后返回，不经过临时目录
+                output, download_name = produce(io.BytesIO())
+                output.seek(0)
+                cache_status = 'bypass'
+            else:
+                entry, cache_status = result_cache.get_or_compute(key, produce)
+                record_cache_status(uploads['analysis_type'], cache_status)
+                output, download_name = entry['result_path'], entry['download_name']
+        except Exception as e:
+            from region_engine import HeaderValidationError
+            if isinstance(e, HeaderValidationError):
+                # 上传的文件缺少关键列或放错位置（解析前按表头校验）
+                return jsonify({'error': f'文件校验失败: {str(e)}', 'problems': e.problems}), 400
+            app.logger.error(f"数据分析错误: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            return jsonify({'error': f'数据分析失败: {str(e)}'}), 500
+
+        # 返回结果文件，阶段统计（命中缓存时为空）和缓存状态放在响应头中
+        response = send_file(
+            output,
+            as_attachment=True,
+            download_name=download_name,
+            mimetype=result_mimetype(download_name)
+        )
+        response.headers['X-Analysis-Profile'] = json.dumps(profiler.to_dict())
+        response.headers['X-Result-Cache'] = cache_status
+        response.headers['X-Admission-Wait-Seconds'] = f"{admission['wait_seconds']:.3f}"
+        return response
 
     except Exception as e:
         app.logger.error(f"文件处理错误: {str(e)}")
         app.logger.error(traceback.format_exc())
         return jsonify({'error': f'文件处理失败: {str(e)}'}), 500
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """提交后台分析任务，立即返回任务ID"""
+    try:
+        uploads, error = validate_uploads()
+        if error:
+            return error
+
+        job = job_manager.create_job(uploads['analysis_type'])
+        job.profile = StageProfiler(job.analysis_type)
+        order_paths, settlement_paths, consumption_path = save_uploads(uploads, job.work_dir)
+
+        # 在请求线程中计算缓存键（上传文件已保存，按路径计算哈希）
+        key = result_cache_key({**uploads, 'orders': order_paths, 'settlements': settlement_paths,
+                                'consumption': consumption_path}, scenario=True)
+
+        def produce(job, output_dir):
+            with call_profiler(job.work_dir / 'profile' if uploads['profile'] else None) as profile_path:
+                job.profile_path = profile_path
+                return run_analysis(job.analysis_type, order_paths, settlement_paths, consumption_path,
+                                      output_dir, progress=job.update_progress,
+                                      writer_engine=uploads['writer_engine'],
+                                      output_format=uploads['output_format'],
+                                      state_dir=uploads['state_dir'],
+                                      profiler=job.profile,
+                                      scenario_dir=Path(output_dir) / SCENARIO_DIR_NAME,
+                                      ticket=job.ticket)
+
+        def runner(job):
+            if key is None:
+                return produce(job, job.work_dir)
+            # 结果（含场景测算数据）复制到任务目录，缓存条目之后被淘汰不影响任务下载
+            entry, cache_status = result_cache.get_or_compute(
+                key, lambda output_dir: produce(job, output_dir),
+                on_wait=lambda: job.update_progress('等待相同任务的分析结果', 1))
+            record_cache_status(job.analysis_type, cache_status)
+            return copy_entry(entry, job.work_dir), entry['download_name']
+
+        # 已有缓存结果、或相同请求正在计算（只等待其结果）的任务不占用内存预算
+        cached = key is not None and (result_cache.get(key) is not None or result_cache.computing(key))
+        estimate = 0.0 if cached else estimate_memory(job.analysis_type, order_paths, settlement_paths,
+                                                      consumption_path)
+        job_manager.submit(job, runner, owner=uploads['owner'], estimate_mb=estimate)
+        return jsonify({
+            'job_id': job.id,
+            'status_url': f'/jobs/{job.id}',
+            'result_url': f'/jobs/{job.id}/result',
+            'profile_url': f'/jobs/{job.id}/profile' if uploads['profile'] else None,
+            'scenarios_url': f'/jobs/{job.id}/scenarios',
+        }), 202
+
+    except Exception as e:
+        app.logger.error(f"任务提交错误: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': f'任务提交失败: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """查询任务状态和进度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """下载任务结果文件"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job.status != FINISHED:
+        return jsonify({'error': '任务尚未完成', 'status': job.status}), 409
+    return send_file(
+        job.result_path,
+        as_attachment=True,
+        download_name=job.download_name,
+        mimetype=result_mimetype(job.download_name)
+    )
+
+@app.route('/jobs/<job_id>/profile')
+def job_profile(job_id):
+    """下载任务的函数级剖析结果（提交时需带 profile=1）"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job.profile_path is None or not job.profile_path.exists():
+        return jsonify({'error': '该任务没有剖析结果', 'status': job.status}), 404
+    return send_file(job.profile_path, as_attachment=True, download_name=f'{job.id}{job.profile_path.suffix}')
+
+def json_records(frame):
+    """DataFrame -> JSON记录列表（NaN转为null）"""
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient='records')
+
+@app.route('/jobs/<job_id>/scenarios', methods=['POST'])
+def job_scenarios(job_id):
+    """
+    利润场景测算：在已完成任务的SKU中间结果上按新的汇率、操作费、SKU成本批量重算利润
+
+    请求体: {"scenarios": [{"name": ..., "local_per_rmb": ..., "fees": ..., "unit_cost": {...}}, ...],
+             "skus": [只返回这些SKU的明细], "detail": true}
+    ?format=xlsx 时返回 场景汇总 + SKU明细 工作簿，否则返回JSON
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job.status != FINISHED:
+        return jsonify({'error': '任务尚未完成', 'status': job.status}), 409
+
+    from scenarios import ScenarioBase
+    from table_io import write_result
+    scenario_dir = job.work_dir / SCENARIO_DIR_NAME
+    if not ScenarioBase.exists(scenario_dir):
+        return jsonify({'error': '该任务没有场景测算数据'}), 404
+
+    body = request.get_json(silent=True) or {}
+    scenarios = body.get('scenarios')
+    if not isinstance(scenarios, list) or not scenarios or not all(isinstance(s, dict) for s in scenarios):
+        return jsonify({'error': 'scenarios 应为非空的场景列表'}), 400
+    if len(scenarios) > SCENARIO_MAX:
+        return jsonify({'error': f'单次最多测算 {SCENARIO_MAX} 个场景'}), 400
+
+    start = time.perf_counter()
+    base = ScenarioBase.load(scenario_dir)
+    try:
+        result = base.evaluate(scenarios)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    totals = base.totals(scenarios, result)
+    details = base.sku_frame(scenarios, result, skus=body.get('skus')) if body.get('detail', True) else None
+
+    if request.args.get('format') == 'xlsx':
+        sheets = {'场景汇总': totals}
+        if details is not None:
+            sheets['SKU明细'] = details
+        output = write_result(sheets, io.BytesIO(), '场景测算', output_format='xlsx')
+        output.seek(0)
+        return send_file(output, as_attachment=True, download_name=f'{job.id}_场景测算.xlsx',
+                         mimetype=XLSX_MIMETYPE)
+    return jsonify({
+        'region': base.region,
+        'base': {'local_per_rmb': base.local_per_rmb, 'fees': base.fees},
+        'totals': json_records(totals),
+        'skus': json_records(details) if details is not None else None,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+    })
+
+@app.route('/healthz')
+def health():
+    """健康检查：进程存活、本worker的任务数和内存占用"""
+    return jsonify({
+        'status': 'ok',
+        'pid': os.getpid(),
+        'uptime_seconds': round(time.time() - STARTED_AT, 1),
+        'rss_mb': round(current_rss_mb(), 1),
+        'jobs': job_manager.counts(),
+        'admission': admission_scheduler.snapshot(),
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 格式的分析指标"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
-    print("🚀 启动财务数据分析系统...")
-    print("📊 访问地址: http://localhost:8080")
+    # 开发服务器：单进程，仅用于本地调试；生产环境使用 gunicorn / waitress（见 wsgi.py）
+    port = int(os.environ.get('PORT', 8080))
+    print("🚀 启动财务数据分析系统（开发模式）...")
+    print(f"📊 访问地址: http://localhost:{port}")
     print("💡 使用 Ctrl+C 停止服务器")
     
-    app.run(debug=True, host='0.0.0.0', port=8080) 
\ No newline at end of file
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=port, threaded=True) 
\ No newline at end of file
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+batch_runner.py
+------------------------------------------------
+多店铺批量分析（命令行）
+- 按清单（JSON）一次运行多个店铺：每个店铺指定地区（regions.REGION_PROFILES 中的名称，如 indonesia / malaysia）、
+  订单表、结算表、产品消耗表
+- 店铺之间用进程池并行，每个店铺内部的文件解析不再另开进程，避免进程数超过CPU核数
+- 多个店铺共用的产品消耗表只解析一次，解析结果传给各店铺；解析失败时只有用到该表的店铺记为失败
+- 每个店铺的结果和运行日志写入 输出目录/店铺名/，全部店铺的汇总指标写入 批量分析汇总.xlsx
+- 单个店铺失败不影响其他店铺，汇总中记录失败原因；有店铺失败时退出码为1
+
+清单格式（路径相对清单文件所在目录，支持通配符）:
+{
+  "output_dir": "批量结果",
+  "defaults": {"consumption": "产品消耗表.xlsx"},
+  "shops": [
+    {"name": "跑6", "region": "indonesia", "orders": ["跑6/订单*.xlsx"], "settlements": ["跑6/结算*.xlsx"]},
+    {"name": "马7", "region": "malaysia", "orders": ["马7/订单.xlsx"], "settlements": ["马7/结算.xlsx"],
+     "consumption": "马来产品消耗成本表.xlsx"}
+  ]
+}
+
+用法: python batch_runner.py 清单.json [-o 输出目录] [-j 并行店铺数] [--output-format xlsx] [--only 跑6,马7]
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from region_engine import read_consumption_file, run_region
+from regions import REGION_PROFILES
+from table_io import OUTPUT_FORMATS, write_result
+
+# 各店铺的运行日志文件名
+LOG_NAME = "运行日志.txt"
+
+
+# -------- 清单解析 --------
+def expand_paths(patterns: Union[str, List[str]], base_dir: Path, label: str, shop: str) -> List[str]:
+    """
+    展开清单中的文件路径（相对路径以清单所在目录为准，支持通配符）
+
+    Args:
+        patterns: 单个路径或路径列表
+        base_dir: 清单文件所在目录
+        label: 报错中使用的文件类别名称
+        shop: 店铺名
+
+    Returns:
+        按清单顺序展开后的文件路径列表（同一通配符匹配的文件按文件名排序）
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    paths = []
+    for pattern in patterns:
+        full = str(base_dir / pattern)
+        matches = sorted(glob.glob(full)) if glob.has_magic(full) else ([full] if Path(full).exists() else [])
+        if not matches:
+            raise FileNotFoundError(f"店铺 {shop} 的{label}不存在: {pattern}")
+        paths.extend(matches)
+    return paths
+
+
+def consumption_path(pattern: str, base_dir: Path, shop: str) -> str:
+    """展开店铺的产品消耗表路径（必须恰好对应一个文件）"""
+    paths = expand_paths(pattern, base_dir, "产品消耗表", shop)
+    if len(paths) != 1:
+        raise ValueError(f"店铺 {shop} 的产品消耗表匹配到多个文件: {pattern}")
+    return str(Path(paths[0]).resolve())
+
+
+def load_manifest(manifest_path: Union[str, Path], only: Optional[List[str]] = None) -> Tuple[List[dict], dict]:
+    """
+    读取批量分析清单
+
+    Args:
+        manifest_path: 清单JSON文件
+        only: 只运行这些店铺（None 时运行全部）
+
+    Returns:
+        (店铺列表, 清单中的其他设置)；店铺的 orders / settlements / consumption 已展开为绝对路径
+
+    Raises:
+        ValueError: 清单格式错误（缺少字段、地区不支持、店铺重名等）
+        FileNotFoundError: 店铺的订单表、结算表或产品消耗表不存在
+    """
+    manifest_path = Path(manifest_path).resolve()
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    base_dir = manifest_path.parent
+    defaults = manifest.get("defaults", {})
+
+    shops = []
+    seen = set()
+    for entry in manifest.get("shops", []):
+        shop = {**defaults, **entry}
+        name = shop.get("name")
+        if not name:
+            raise ValueError(f"清单中的店铺缺少 name: {entry}")
+        if name in seen:
+            raise ValueError(f"清单中店铺重名: {name}")
+        seen.add(name)
+        if only and name not in only:
+            continue
+        region = shop.get("region", "indonesia")
+        if region not in REGION_PROFILES:
+            raise ValueError(f"店铺 {name} 的地区不支持: {region}，可选 {', '.join(REGION_PROFILES)}")
+        missing = [key for key in ("orders", "settlements", "consumption") if not shop.get(key)]
+        if missing:
+            raise ValueError(f"店铺 {name} 缺少字段: {', '.join(missing)}")
+        shops.append({
+            "name": name,
+            "region": region,
+            "orders": expand_paths(shop["orders"], base_dir, "订单表", name),
+            "settlements": expand_paths(shop["settlements"], base_dir, "结算表", name),
+            "consumption": consumption_path(shop["consumption"], base_dir, name),
+            "options": shop.get("options", {}),
+        })
+
+    if only:
+        unknown = set(only) - seen
+        if unknown:
+            raise ValueError(f"清单中没有这些店铺: {', '.join(sorted(unknown))}")
+
+    output_dir = base_dir / manifest.get("output_dir", "批量结果")
+    return shops, {"output_dir": output_dir}
+
+
+# -------- 共用输入 --------
+def load_shared_consumption(shops: List[dict]) -> Tuple[Dict[Tuple[str, str], pd.DataFrame],
+                                                          Dict[Tuple[str, str], str]]:
+    """
+    解析各店铺用到的产品消耗表，同一地区的同一文件只解析一次
+
+    Returns:
+        (已解析的表, 解析失败的表)：
+        (地区, 文件路径) -> 产品消耗表（attrs["source_name"] 为文件名，用于日志）；
+        (地区, 文件路径) -> 错误信息（用到该表的店铺记为失败，不影响其他店铺）
+    """
+    tables, errors = {}, {}
+    for key in dict.fromkeys((shop["region"], shop["consumption"]) for shop in shops):
+        region, path = key
+        users = sum(1 for shop in shops if (shop["region"], shop["consumption"]) == key)
+        start = time.perf_counter()
+        try:
+            df = read_consumption_file(region, path)
+        except Exception as e:
+            print(f"❌ 共用产品消耗表解析失败: {Path(path).name} ({users} 个店铺使用): {e}")
+            errors[key] = f"{type(e).__name__}: {e}"
+            continue
+        df.attrs["source_name"] = Path(path).name
+        print(f"📦 已解析共用产品消耗表: {Path(path).name} ({len(df)} 行, {users} 个店铺使用, "
+              f"{time.perf_counter() - start:.2f} 秒)")
+        tables[key] = df
+    return tables, errors
+
+
+# -------- 单店铺运行 --------
+def run_shop(shop: dict, consumption: pd.DataFrame, output_dir: str, output_format: str) -> dict:
+    """
+    运行单个店铺的分析（在子进程中执行），标准输出写入店铺目录下的运行日志
+
+    Returns:
+        汇总行：店铺、地区、状态、耗时、结果文件及流程返回的汇总指标；失败时包含错误信息
+    """
+    shop_dir = Path(output_dir) / shop["name"]
+    shop_dir.mkdir(parents=True, exist_ok=True)
+    row = {"店铺": shop["name"], "地区": shop["region"], "订单文件数": len(shop["orders"]),
+           "结算文件数": len(shop["settlements"])}
+    summary = {}
+    start = time.perf_counter()
+    with open(shop_dir / LOG_NAME, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        try:
+            output_path = run_region(
+                shop["region"],
+                order_files=shop["orders"],
+                settlement_files=shop["settlements"],
+                consumption_file=consumption,
+                output_dir=shop_dir,
+                workers=1,
+                output_format=output_format,
+                summary=summary,
+                **shop["options"],
+            )
+            row.update(状态="成功", 结果文件=str(output_path))
+        except Exception as e:
+            print(f"❌ 分析失败: {e}")
+            row.update(状态="失败", 错误=f"{type(e).__name__}: {e}")
+    row["耗时(秒)"] = round(time.perf_counter() - start, 2)
+    row.update(summary)
+    return row
+
+
+def run_batch(shops: List[dict], output_dir: Union[str, Path], workers: Optional[int] = None,
+              output_format: str = "xlsx") -> pd.DataFrame:
+    """
+    并行运行多个店铺的分析并写出汇总
+
+    Args:
+        shops: load_manifest 返回的店铺列表
+        output_dir: 输出目录（每个店铺一个子目录）
+        workers: 同时运行的店铺数，None时使用CPU核数
+        output_format: 各店铺结果的输出格式，xlsx / parquet / csv.gz
+
+    Returns:
+        汇总表（每个店铺一行，按清单顺序）
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(shops)))
+
+    consumption, consumption_errors = load_shared_consumption(shops)
+    print(f"🚀 开始批量分析: {len(shops)} 个店铺, 并行数 {workers}")
+
+    start = time.perf_counter()
+    rows: List[Optional[dict]] = [None] * len(shops)
+    for i, shop in enumerate(shops):
+        error = consumption_errors.get((shop["region"], shop["consumption"]))
+        if error is not None:
+            rows[i] = {"店铺": shop["name"], "地区": shop["region"], "状态": "失败",
+                       "错误": f"产品消耗表解析失败: {error}"}
+            print(f"❌ {shop['name']} ({shop['region']}) 失败 {rows[i]['错误']}")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_shop, shop, consumption[(shop["region"], shop["consumption"])],
+                        str(output_dir), output_format): i
+            for i, shop in enumerate(shops) if rows[i] is None
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                rows[i] = future.result()
+            except Exception as e:
+                # 子进程异常退出（如内存不足被终止）
+                rows[i] = {"店铺": shops[i]["name"], "地区": shops[i]["region"], "状态": "失败",
+                           "错误": f"{type(e).__name__}: {e}"}
+            row = rows[i]
+            icon = "✅" if row["状态"] == "成功" else "❌"
+            print(f"{icon} {row['店铺']} ({row['地区']}) {row['状态']} {row.get('耗时(秒)', '')}"
+                  f"{' 秒' if '耗时(秒)' in row else ''} {row.get('错误', '')}".rstrip())
+
+    summary = pd.DataFrame(rows)
+    summary_path = write_result({"批量分析汇总": summary}, output_dir, "批量分析汇总", output_format="xlsx")
+    failed = int((summary["状态"] != "成功").sum())
+    print(f"📊 批量分析完成: 成功 {len(shops) - failed} 个, 失败 {failed} 个, "
+          f"共 {time.perf_counter() - start:.2f} 秒")
+    print(f"💾 汇总已保存到: {summary_path}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多店铺批量财务分析")
+    parser.add_argument("manifest", help="批量分析清单（JSON）")
+    parser.add_argument("-o", "--output-dir", help="输出目录，默认使用清单中的 output_dir")
+    parser.add_argument("-j", "--workers", type=int, help="同时运行的店铺数，默认CPU核数")
+    parser.add_argument("--output-format", default="xlsx", choices=list(OUTPUT_FORMATS))
+    parser.add_argument("--only", help="只运行这些店铺，逗号分隔")
+    args = parser.parse_args()
+
+    only = [name.strip() for name in args.only.split(",") if name.strip()] if args.only else None
+    try:
+        shops, settings = load_manifest(args.manifest, only)
+    except (ValueError, FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"❌ 清单错误: {e}")
+        sys.exit(2)
+    if not shops:
+        print("❌ 清单中没有店铺")
+        sys.exit(2)
+
+    summary = run_batch(shops, args.output_dir or settings["output_dir"], args.workers, args.output_format)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(summary.drop(columns=["结果文件"], errors="ignore").to_string(index=False))
+    if (summary["状态"] != "成功").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_combo_sku.py
+------------------------------------------------
+组合SKU预处理性能对比（逐行正则循环 vs 查找表映射）
+- 输出 10k / 100k / 1M 行下的 rows/sec
+- 同时校验两种实现结果一致
+
+用法: python benchmarks/bench_combo_sku.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import contextlib
+import io
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from region_engine import preprocess_combo_sku  # noqa: E402
+from regions import INDONESIA  # noqa: E402
+
+
+def legacy_preprocess_combo_sku(df: pd.DataFrame, sku_col: str, qty_col: str) -> pd.DataFrame:
+    """优化前的逐行实现（仅用于对比）"""
+    df = df.copy()
+    combo_patterns = [
+        (r'^(.+)-(\d+)$', lambda m: f"{m.group(1)}-1", lambda m: int(m.group(2))),
+        (r'^(.+)\*(\d+)$', lambda m: f"{m.group(1)}*1", lambda m: int(m.group(2))),
+    ]
+    for idx, sku in enumerate(df[sku_col]):
+        if pd.isna(sku):
+            continue
+        sku_str = str(sku).strip()
+        original_qty = df.loc[idx, qty_col]
+        for pattern, base_sku_func, multiplier_func in combo_patterns:
+            match = re.match(pattern, sku_str)
+            if match:
+                multiplier = multiplier_func(match)
+                if multiplier > 1:
+                    df.loc[idx, sku_col] = base_sku_func(match)
+                    df.loc[idx, qty_col] = original_qty * multiplier
+                    print(f"🔄 组合SKU转换: {sku_str} -> {base_sku_func(match)}")
+                break
+    return df
+
+
+def make_orders(rows: int, n_skus: int = 2000, combo_ratio: float = 0.2, seed: int = 0) -> pd.DataFrame:
+    """生成带组合SKU的订单数据"""
+    rng = np.random.default_rng(seed)
+    base = np.array([f"sku{i}-1" if i % 2 else f"item{i}*1" for i in range(n_skus)], dtype=object)
+    combos = np.array([s[:-1] + str(rng.integers(2, 5)) for s in base], dtype=object)
+    pick = rng.integers(0, n_skus, rows)
+    is_combo = rng.random(rows) < combo_ratio
+    skus = np.where(is_combo, combos[pick], base[pick])
+    return pd.DataFrame({
+        "order_id": np.arange(rows).astype(str),
+        "sku": skus,
+        "数量": rng.integers(1, 4, rows),
+    })
+
+
+def timed(func, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="组合SKU预处理性能对比")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max-rows", type=int, default=100_000,
+                        help="超过该行数时跳过逐行实现（耗时过长）")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} | {'legacy rows/s':>14} | {'vectorized rows/s':>18} | {'speedup':>8}")
+    for rows in args.sizes:
+        df = make_orders(rows)
+        new_df, new_t = timed(preprocess_combo_sku, df, "sku", "数量", INDONESIA["combo_sku_patterns"])
+
+        if rows <= args.legacy_max_rows:
+            old_df, old_t = timed(legacy_preprocess_combo_sku, df, "sku", "数量")
+            pd.testing.assert_frame_equal(old_df, new_df, check_dtype=False)
+            old_rate = f"{rows / old_t:14,.0f}"
+            speedup = f"{old_t / new_t:7.1f}x"
+        else:
+            old_rate, speedup = f"{'skipped':>14}", f"{'-':>8}"
+
+        print(f"{rows:>10,} | {old_rate} | {rows / new_t:18,.0f} | {speedup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_memory.py
+------------------------------------------------
+印尼流程峰值内存对比（标准模式 vs 低内存模式 low_memory=True vs 分块模式 memory_limit_mb）
+- 用 synthetic_data 生成带多余宽列的订单表 / 结算表 / 产品消耗表
+- 每种模式在独立子进程中运行完整流程，统计耗时和峰值RSS
+
+用法: python benchmarks/bench_memory.py [--rows 200000] [--output-format xlsx] [--memory-limit-mb 300]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synthetic_data import make_inputs  # noqa: E402
+
+
+def run_child(mode: str, inputs: dict, output_format: str, memory_limit_mb: float) -> None:
+    from analysis_multi import process_financial_data
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), tempfile.TemporaryDirectory() as out:
+        process_financial_data(inputs["orders"], inputs["settlements"], inputs["consumption"],
+                               output_dir=out, workers=1, output_format=output_format,
+                               low_memory=(mode == "low_memory"),
+                               memory_limit_mb=memory_limit_mb if mode == "chunked" else None)
+    elapsed = time.perf_counter() - start
+    # Linux 下 ru_maxrss 单位为 KB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"seconds": elapsed, "peak_rss_mb": peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="印尼流程峰值内存对比")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--output-format", default="xlsx", choices=["xlsx", "parquet", "csv.gz"])
+    parser.add_argument("--memory-limit-mb", type=float, default=300, help="分块模式的内存上限")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "INPUTS_JSON"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], json.loads(args.child[1]), args.output_format, args.memory_limit_mb)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"📦 生成 {args.rows:,} 行订单输入...")
+        inputs = make_inputs("indonesia", args.rows, tmp, n_skus=3000, wide_columns=True)
+        print(f"{'mode':>12} | {'seconds':>8} | {'peak RSS MB':>11}")
+        for mode in ["standard", "low_memory", "chunked"]:
+            result = subprocess.run(
+                [sys.executable, __file__, "--output-format", args.output_format,
+                 "--memory-limit-mb", str(args.memory_limit_mb),
+                 "--child", mode, json.dumps(inputs)],
+                check=True, capture_output=True, text=True,
+                env={**os.environ, "PARSE_CACHE_DIR": ""},
+            )
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"{mode:>12} | {stats['seconds']:8.2f} | {stats['peak_rss_mb']:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_scenarios.py
+------------------------------------------------
+利润场景测算性能对比（每个场景重新运行完整流程 vs 在SKU中间结果上批量重算）
+- 合成订单数据运行一次完整流程并保存场景测算数据
+- 批量计算 1 / 100 / 1000 个场景（汇率、操作费档位、SKU成本各不相同）
+- 校验：不覆盖参数的场景与原分析一致；新汇率+新操作费的场景与按新参数重新运行完整流程一致
+
+用法: python benchmarks/bench_scenarios.py [--rows 200000] [--scenarios 1 100 1000]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+os.environ["PARSE_CACHE_DIR"] = ""
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from region_engine import run_region  # noqa: E402
+from regions import INDONESIA  # noqa: E402
+from scenarios import ScenarioBase  # noqa: E402
+from synthetic_data import make_inputs  # noqa: E402
+
+
+def run_full(profile, data, output_dir: Path, scenario_dir: Path, fees=None) -> float:
+    """运行一次完整流程（含Excel解析），返回耗时"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_region(profile, data["orders"], data["settlements"], data["consumption"], output_dir=output_dir,
+                   workers=1, fees=fees, scenario_dir=scenario_dir)
+    return time.perf_counter() - start
+
+
+def make_scenarios(base: ScenarioBase, count: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    skus = base.sku.index.to_numpy()
+    return [{
+        "name": f"场景{i + 1}",
+        "local_per_rmb": float(rng.uniform(2100, 2500)),
+        "fees": [[1, 1, round(float(rng.uniform(1.5, 2.5)), 2)], [2, None, round(float(rng.uniform(2.0, 3.5)), 2)]],
+        "unit_cost": {str(rng.choice(skus)): float(rng.uniform(1000, 9000))},
+    } for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="利润场景测算性能对比")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[1, 100, 1000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        data = make_inputs("indonesia", args.rows, tmp / "input", seed=0)
+        full_t = run_full(INDONESIA, data, tmp, tmp / "base")
+        base = ScenarioBase.load(tmp / "base")
+        print(f"📊 {args.rows:,} 行订单, {len(base.sku):,} 个SKU, 完整流程 {full_t:.2f} s/场景")
+
+        # 不覆盖参数的场景与原分析一致
+        unchanged = base.evaluate([{}])["profit_rmb"][:, 0]
+        np.testing.assert_allclose(unchanged, base.sku["profit_rmb"].to_numpy(), rtol=1e-12)
+
+        # 新汇率 + 新操作费档位与重新运行完整流程一致
+        tiers = [(1, 1, 1.8), (2, 3, 2.8), (4, None, 4.0)]
+        run_full({**INDONESIA, "local_per_rmb": 2250}, data, tmp, tmp / "rerun", fees=tiers)
+        rerun = ScenarioBase.load(tmp / "rerun")
+        what_if = base.evaluate([{"local_per_rmb": 2250, "fees": [list(t) for t in tiers]}])["profit_rmb"][:, 0]
+        np.testing.assert_allclose(what_if, rerun.sku["profit_rmb"].to_numpy(), rtol=1e-9)
+        print("✅ 场景测算与重新运行完整流程结果一致")
+
+        print(f"{'scenarios':>10} | {'batched':>10} | {'per scenario':>13} | {'vs full run':>12}")
+        for count in args.scenarios:
+            scenarios = make_scenarios(base, count)
+            start = time.perf_counter()
+            base.evaluate(scenarios)
+            elapsed = time.perf_counter() - start
+            print(f"{count:>10,} | {elapsed * 1000:8.1f}ms | {elapsed / count * 1000:11.3f}ms | "
+                  f"{full_t * count / elapsed:11.0f}x")
+
+
+if __name__ == "__main__":
+    main()
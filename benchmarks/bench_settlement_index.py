@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_settlement_index.py
+------------------------------------------------
+结算去重 + 合并性能对比（duplicated/drop_duplicates + merge vs SettlementIndex 查找）
+- 订单表含6列（merge 会复制整张订单表），结算行数约为订单行数的 0.6，约 2% 的订单有多行结算
+- 校验 exclude 策略下两种实现得到的每行结算金额和排除行完全一致
+
+用法: python benchmarks/bench_settlement_index.py [--sizes 100000 1000000 3000000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from settlement_index import SettlementIndex  # noqa: E402
+
+
+def legacy_join(order: pd.DataFrame, settle: pd.DataFrame):
+    dup_settle = settle[settle.duplicated("order_id", keep=False)]
+    unique_settle = settle.drop_duplicates("order_id", keep=False)
+    merged = order.merge(unique_settle[["order_id", "Total settlement amount"]], on="order_id", how="left")
+    return merged["Total settlement amount"].to_numpy(), dup_settle
+
+
+def index_join(order: pd.DataFrame, settle: pd.DataFrame):
+    index = SettlementIndex.from_frame(settle, policy="exclude")
+    return index.lookup(order["order_id"]), settle[index.duplicate_mask]
+
+
+def make_tables(rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n_orders = int(rows / 1.5)
+    order_ids = np.char.add("58", (rng.choice(10 ** 15, n_orders, replace=False) + 10 ** 15).astype(str))
+    order = pd.DataFrame({
+        "order_id": order_ids[np.sort(rng.integers(0, n_orders, rows))],
+        "sku": np.char.add("sku", rng.integers(0, 500, rows).astype(str)),
+        "数量": rng.integers(1, 4, rows),
+        "是否出库": rng.choice(["yes", "no"], rows),
+        "平台状态": rng.choice(["Delivered", "Completed", "Cancelled", "In transit"], rows),
+        "商品名称": np.char.add("Product ", rng.integers(0, 500, rows).astype(str)),
+    })
+    settled = order_ids[rng.random(n_orders) < 0.9]
+    settle_ids = np.concatenate([settled, settled[rng.random(len(settled)) < 0.02]])
+    settle = pd.DataFrame({
+        "order_id": settle_ids,
+        "Total settlement amount": rng.uniform(1e4, 2e5, len(settle_ids)).round(2),
+    })
+    return order, settle
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="结算去重与合并性能对比")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000])
+    args = parser.parse_args()
+
+    print(f"{'order rows':>10} | {'settle rows':>11} | {'merge s':>8} | {'index s':>8} | {'speedup':>8}")
+    for rows in args.sizes:
+        order, settle = make_tables(rows)
+        (old_amounts, old_dup), old_t = timed(legacy_join, order, settle)
+        (new_amounts, new_dup), new_t = timed(index_join, order, settle)
+        np.testing.assert_array_equal(old_amounts, new_amounts)
+        pd.testing.assert_frame_equal(old_dup, new_dup)
+        print(f"{rows:>10,} | {len(settle):>11,} | {old_t:8.3f} | {new_t:8.3f} | {old_t / new_t:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
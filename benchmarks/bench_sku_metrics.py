@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_sku_metrics.py
+------------------------------------------------
+SKU级别聚合性能对比（多次过滤 groupby/nunique vs 单次groupby）
+- 默认 1M 行订单、50k 个SKU
+- 校验两种实现得到的 sku财务指标 基础列完全一致
+
+用法: python benchmarks/bench_sku_metrics.py [--rows 1000000] [--skus 50000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from region_engine import aggregate_sku_metrics  # noqa: E402
+from regions import INDONESIA  # noqa: E402
+
+
+def legacy_aggregate_sku_metrics(order: pd.DataFrame, sku_col: str, qty_col: str) -> pd.DataFrame:
+    """优化前的实现（仅用于对比）"""
+    pair_df = order[[sku_col, "order_id", "_shipped", "_status"]].drop_duplicates([sku_col, "order_id"])
+    metrics = {
+        "订单数": pair_df.groupby(sku_col)["order_id"].nunique(),
+        "出库订单数数量": pair_df[pair_df["_shipped"] == "yes"].groupby(sku_col)["order_id"].nunique(),
+        "签收订单数": pair_df[pair_df["_status"].isin(["delivered", "completed"])]
+                     .groupby(sku_col)["order_id"].nunique(),
+        "取消订单数": pair_df[pair_df["_status"] == "cancelled"].groupby(sku_col)["order_id"].nunique(),
+        "出库前取消订单数": pair_df[(pair_df["_status"] == "cancelled") & (pair_df["_shipped"] == "no")]
+                         .groupby(sku_col)["order_id"].nunique(),
+        "出库后取消订单数": pair_df[(pair_df["_status"] == "cancelled") & (pair_df["_shipped"] == "yes")]
+                         .groupby(sku_col)["order_id"].nunique(),
+        "仍在途订单数": pair_df[pair_df["_status"] == "in transit"].groupby(sku_col)["order_id"].nunique(),
+    }
+    shipped_order = order[order["_shipped"] == "yes"]
+    delivered_order = order[order["_status"].isin(["delivered", "completed"])]
+    base = order.groupby(sku_col).agg(
+        sku_total_settlement=("_settlement_line", "sum"),
+        sku_total_operation_fee=("_fee_line", "sum"),
+    )
+    base = base.join(shipped_order.groupby(sku_col)[qty_col].sum().rename("出库数量"), how="left")
+    base = base.join(delivered_order.groupby(sku_col)["_settlement_line"].sum().rename("签收金额"), how="left")
+    sku = base
+    for k, v in metrics.items():
+        sku = sku.join(v.rename(k), how="left")
+    return sku.fillna(0)
+
+
+# 优化前实现的列名 -> 引擎SKU指标名
+LEGACY_NAMES = {
+    "sku_total_settlement": "settlement",
+    "sku_total_operation_fee": "operation_fee",
+    "出库数量": "shipped_qty",
+    "签收金额": "signed_amount",
+    "订单数": "orders",
+    "出库订单数数量": "shipped_orders",
+    "签收订单数": "signed_orders",
+    "取消订单数": "cancelled_orders",
+    "出库前取消订单数": "cancel_before_ship",
+    "出库后取消订单数": "cancel_after_ship",
+    "仍在途订单数": "in_transit_orders",
+}
+
+
+def make_order_lines(rows: int, n_skus: int, seed: int = 0) -> pd.DataFrame:
+    """生成已完成结算/操作费计算的订单行（平均每单约1.5行，含少量缺失订单号）"""
+    rng = np.random.default_rng(seed)
+    order_id = rng.integers(0, int(rows / 1.5), rows).astype(str).astype(object)
+    order_id[rng.random(rows) < 0.001] = np.nan
+    return pd.DataFrame({
+        "order_id": order_id,
+        "sku": np.char.add("sku", rng.integers(0, n_skus, rows).astype(str)),
+        "数量": rng.integers(1, 4, rows),
+        "_shipped": rng.choice(["yes", "no"], rows, p=[0.8, 0.2]),
+        "_status": rng.choice(["delivered", "completed", "cancelled", "in transit", "unpaid"], rows),
+        "_settlement_line": np.where(rng.random(rows) < 0.1, np.nan, rng.uniform(1e4, 9e4, rows)),
+        "_fee_line": rng.choice([0.0, 1.0, 2.0, 2.5], rows),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SKU级别聚合性能对比")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--skus", type=int, default=50_000)
+    args = parser.parse_args()
+
+    order = make_order_lines(args.rows, args.skus)
+    print(f"📊 {len(order):,} 行订单, {order['sku'].nunique():,} 个SKU")
+
+    start = time.perf_counter()
+    legacy = legacy_aggregate_sku_metrics(order, "sku", "数量")
+    legacy_t = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = aggregate_sku_metrics(INDONESIA, order, "sku", "数量")
+    single_t = time.perf_counter() - start
+
+    legacy = legacy.rename(columns=LEGACY_NAMES)
+    pd.testing.assert_frame_equal(legacy, single[legacy.columns], check_dtype=False)
+    print(f"legacy      : {legacy_t:7.2f} s")
+    print(f"single-pass : {single_t:7.2f} s  ({legacy_t / single_t:.1f}x)")
+    print("✅ 两种实现结果一致")
+
+
+if __name__ == "__main__":
+    main()
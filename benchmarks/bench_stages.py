@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_stages.py
+------------------------------------------------
+两个分析流程的分阶段基准测试（合成数据，多个规模）
+- 每个规模用 synthetic_data 生成输入文件，完整流程运行 --repeat 次，取各阶段耗时中位数
+- 阶段划分与 profiling.StageProfiler 一致（读取、结算去重、组合SKU预处理、SKU聚合、导出等）
+- --save 保存结果为基线JSON；--compare 与基线对比，阶段耗时变慢超过阈值时退出码为1
+
+用法:
+    python benchmarks/bench_stages.py --scales 10000,50000 --save baseline.json
+    python benchmarks/bench_stages.py --scales 10000,50000 --compare baseline.json [--threshold 0.25]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+# 基准测试不使用解析缓存，每次都计入Excel解析耗时
+os.environ["PARSE_CACHE_DIR"] = ""
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from analysis_mal import process_malaysia_financial_data  # noqa: E402
+from analysis_multi import process_financial_data  # noqa: E402
+from profiling import StageProfiler  # noqa: E402
+from synthetic_data import make_inputs  # noqa: E402
+
+PIPELINES = {
+    "indonesia": process_financial_data,
+    "malaysia": process_malaysia_financial_data,
+}
+
+# 基线耗时低于该值（秒）的阶段不做回归判断，避免计时噪声误报
+MIN_COMPARE_SECONDS = 0.05
+
+
+def run_once(region: str, inputs: dict, output_format: str) -> dict:
+    """运行一次完整流程，返回 {阶段: 秒数, "总耗时": 秒数, "峰值RSS(MB)": 数值}"""
+    profiler = StageProfiler(region)
+    with contextlib.redirect_stdout(io.StringIO()), tempfile.TemporaryDirectory() as out:
+        PIPELINES[region](inputs["orders"], inputs["settlements"], inputs["consumption"],
+                          output_dir=out, workers=1, output_format=output_format, profiler=profiler)
+    profile = profiler.to_dict()
+    timings = {}
+    for stage in profile["stages"]:
+        timings[stage["stage"]] = timings.get(stage["stage"], 0) + stage["seconds"]
+    timings["总耗时"] = profile["seconds"]
+    timings["峰值RSS(MB)"] = profile["peak_rss_mb"]
+    return timings
+
+
+def bench_region(region: str, rows: int, repeat: int, options: dict, order_files: int, output_format: str) -> dict:
+    """生成指定规模的输入并多次运行，返回各阶段耗时中位数"""
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = make_inputs(region, rows, tmp, order_files=order_files, **options)
+        runs = [run_once(region, inputs, output_format) for _ in range(repeat)]
+    return {key: round(statistics.median(run[key] for run in runs), 4) for key in runs[0]}
+
+
+def print_table(region: str, results: dict) -> None:
+    scales = list(results)
+    stages = list(dict.fromkeys(stage for scale in scales for stage in results[scale]))
+    print(f"\n📊 {region}")
+    print(f"{'阶段':<14}" + "".join(f"{int(scale):>12,}" for scale in scales))
+    for stage in stages:
+        values = [results[scale].get(stage) for scale in scales]
+        print(f"{stage:<14}" + "".join(f"{'' if v is None else f'{v:.3f}':>12}" for v in values))
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """与基线对比，返回变慢超过阈值的 (地区, 规模, 阶段, 基线秒数, 当前秒数)"""
+    regressions = []
+    for region, scales in results.items():
+        for scale, timings in scales.items():
+            base = baseline.get(region, {}).get(scale, {})
+            for stage, seconds in timings.items():
+                if stage == "峰值RSS(MB)" or stage not in base or base[stage] < MIN_COMPARE_SECONDS:
+                    continue
+                if seconds > base[stage] * (1 + threshold):
+                    regressions.append((region, scale, stage, base[stage], seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析流程分阶段基准测试")
+    parser.add_argument("--region", default="all", choices=["all", "indonesia", "malaysia"])
+    parser.add_argument("--scales", default="10000,50000,200000", help="订单行数，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skus", type=int, default=500)
+    parser.add_argument("--combo-ratio", type=float, default=0.1)
+    parser.add_argument("--dup-ratio", type=float, default=0.02)
+    parser.add_argument("--order-files", type=int, default=2)
+    parser.add_argument("--output-format", default="xlsx", choices=["xlsx", "parquet", "csv.gz"])
+    parser.add_argument("--save", help="保存结果为基线JSON")
+    parser.add_argument("--compare", help="与基线JSON对比")
+    parser.add_argument("--threshold", type=float, default=0.25, help="判定回归的变慢比例")
+    args = parser.parse_args()
+
+    regions = list(PIPELINES) if args.region == "all" else [args.region]
+    scales = [int(s) for s in args.scales.split(",")]
+    options = {"n_skus": args.skus, "combo_ratio": args.combo_ratio, "dup_settlement_ratio": args.dup_ratio}
+
+    results = {}
+    for region in regions:
+        results[region] = {}
+        for rows in scales:
+            print(f"⏱️  {region} {rows:,} 行 × {args.repeat} 次...")
+            results[region][str(rows)] = bench_region(region, rows, args.repeat, options,
+                                                      args.order_files, args.output_format)
+        print_table(region, results[region])
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n💾 基线已保存: {args.save}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 个阶段变慢超过 {args.threshold:.0%}:")
+            for region, scale, stage, before, after in regressions:
+                print(f"   {region} {int(scale):,} 行 {stage}: {before:.3f}s → {after:.3f}s")
+            sys.exit(1)
+        print(f"\n✅ 与基线相比没有超过 {args.threshold:.0%} 的变慢")
+
+
+if __name__ == "__main__":
+    main()
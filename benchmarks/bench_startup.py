@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_startup.py
+------------------------------------------------
+Web服务冷启动耗时
+- 每次在全新子进程中导入 app，统计: 导入耗时、首个 / 请求完成耗时、分析模块可用耗时
+- 分别测试 ANALYSIS_PRELOAD=off（首次分析时导入）和 background（后台线程预加载）
+
+用法: python benchmarks/bench_startup.py [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+index_done = time.perf_counter()
+app.analysis_pipelines()
+ready = time.perf_counter()
+print(json.dumps({"导入app": imported - start, "首页响应": index_done - start, "分析模块可用": ready - start}))
+"""
+
+
+def run_child(preload: str) -> dict:
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, check=True, capture_output=True, text=True,
+                            env={**os.environ, "ANALYSIS_PRELOAD": preload, "PARSE_CACHE_DIR": ""})
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web服务冷启动耗时")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'预加载':>12} | {'导入app':>8} | {'首页响应':>8} | {'分析模块可用':>10}  （秒，{args.repeat} 次中位数）")
+    for preload in ["off", "background"]:
+        runs = [run_child(preload) for _ in range(args.repeat)]
+        median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        print(f"{preload:>12} | {median['导入app']:8.3f} | {median['首页响应']:8.3f} | {median['分析模块可用']:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
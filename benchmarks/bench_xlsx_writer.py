@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_xlsx_writer.py
+------------------------------------------------
+结果工作簿写出引擎对比（openpyxl vs xlsxwriter constant_memory）
+- 每个引擎在独立子进程中运行，分别统计写出耗时和峰值RSS
+- 写出后读回校验两种引擎的单元格内容一致
+
+用法: python benchmarks/bench_xlsx_writer.py [--rows 100000 500000]
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from table_io import write_excel_sheets  # noqa: E402
+
+ENGINES = ["openpyxl", "xlsxwriter"]
+
+
+def make_order_table(rows: int, seed: int = 0) -> pd.DataFrame:
+    """生成与印尼订单表结构相近的宽表"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "order_id": (rng.integers(0, rows // 2 + 1, rows)).astype(str),
+        "sku": np.char.add("sku", rng.integers(0, 5000, rows).astype(str)),
+        "数量": rng.integers(1, 5, rows),
+        "是否出库": rng.choice(["yes", "no"], rows),
+        "平台状态": rng.choice(["delivered", "completed", "cancelled", "in transit"], rows),
+        "Total settlement amount": np.where(rng.random(rows) < 0.1, np.nan, rng.uniform(1e4, 9e4, rows)),
+        "settlement_per_line": rng.uniform(1e4, 9e4, rows),
+        "order_fee_rmb": rng.choice([0.0, 2.0, 2.5], rows),
+        "operation_fee_per_line_rmb": rng.uniform(0, 2.5, rows),
+    })
+
+
+def max_rss_mb() -> float:
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(engine: str, rows: int, output: str) -> None:
+    df = make_order_table(rows)
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    write_excel_sheets({"订单表_含结算与操作费": df}, output, engine=engine)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "rss_before_mb": rss_before, "peak_rss_mb": max_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel写出引擎对比")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 500_000])
+    parser.add_argument("--no-verify", action="store_true", help="跳过读回校验")
+    parser.add_argument("--child", nargs=3, metavar=("ENGINE", "ROWS", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]), args.child[2])
+        return
+
+    print(f"{'rows':>9} | {'engine':>10} | {'write s':>8} | {'peak RSS MB':>11} | {'Δ RSS MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            outputs = {}
+            for engine in ENGINES:
+                output = str(Path(tmp) / f"{engine}_{rows}.xlsx")
+                result = subprocess.run([sys.executable, __file__, "--child", engine, str(rows), output],
+                                        check=True, capture_output=True, text=True)
+                stats = json.loads(result.stdout.strip().splitlines()[-1])
+                outputs[engine] = output
+                print(f"{rows:>9,} | {engine:>10} | {stats['seconds']:8.2f} | "
+                      f"{stats['peak_rss_mb']:11.0f} | {stats['peak_rss_mb'] - stats['rss_before_mb']:9.0f}")
+
+            if not args.no_verify:
+                frames = [pd.read_excel(outputs[engine], engine="openpyxl") for engine in ENGINES]
+                pd.testing.assert_frame_equal(frames[0], frames[1])
+                print(f"{'':>9}   ✅ {rows:,} 行两种引擎写出内容一致")
+
+
+if __name__ == "__main__":
+    main()
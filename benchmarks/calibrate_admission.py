@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+calibrate_admission.py
+------------------------------------------------
+准入控制内存模型的实测校准（admission.MEMORY_MODEL）
+- 每个地区、每个规模生成合成输入，在独立子进程中运行完整流程
+- 峰值增量 = 运行期间的RSS峰值 - 导入分析模块后的RSS（与服务中按任务计量的口径一致）
+- 按输入单元格数（工作表声明的行数 * 列数）最小二乘拟合 base_mb 和 bytes_per_cell，并对比当前模型的估算
+
+用法: python benchmarks/calibrate_admission.py [--rows 20000 100000 200000]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from admission import MemoryEstimator, input_cells  # noqa: E402
+from synthetic_data import make_inputs  # noqa: E402
+
+
+def run_child(region: str, inputs: dict) -> None:
+    from profiling import StageProfiler, current_rss_mb
+    from region_engine import run_region
+
+    baseline = current_rss_mb()
+    profiler = StageProfiler(region)
+    with contextlib.redirect_stdout(io.StringIO()), tempfile.TemporaryDirectory() as out:
+        run_region(region, inputs["orders"], inputs["settlements"], inputs["consumption"],
+                   output_dir=out, workers=1, profiler=profiler)
+    print(json.dumps({"peak_delta_mb": profiler.to_dict()["peak_rss_mb"] - baseline}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="准入控制内存模型校准")
+    parser.add_argument("--rows", type=int, nargs="+", default=[20_000, 100_000, 200_000])
+    parser.add_argument("--child", nargs=2, metavar=("REGION", "INPUTS_JSON"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], json.loads(args.child[1]))
+        return
+
+    estimator = MemoryEstimator()
+    fitted = {}
+    print(f"{'region':>10} | {'rows':>8} | {'cells':>10} | {'peak MB':>8} | {'model MB':>8}")
+    for region in ["indonesia", "malaysia"]:
+        cells, peaks = [], []
+        for rows in args.rows:
+            with tempfile.TemporaryDirectory() as tmp:
+                inputs = make_inputs(region, rows, tmp, wide_columns=True)
+                files = inputs["orders"] + inputs["settlements"] + [inputs["consumption"]]
+                result = subprocess.run(
+                    [sys.executable, __file__, "--child", region, json.dumps(inputs)],
+                    check=True, capture_output=True, text=True,
+                    env={**os.environ, "PARSE_CACHE_DIR": ""},
+                )
+                cells.append(input_cells(files))
+            peaks.append(json.loads(result.stdout.strip().splitlines()[-1])["peak_delta_mb"])
+            print(f"{region:>10} | {rows:>8,} | {cells[-1]:>10,} | {peaks[-1]:8.0f} | "
+                  f"{estimator.raw_estimate(region, cells[-1]):8.0f}")
+        slope, intercept = np.polyfit(np.array(cells, dtype=float), np.array(peaks), 1)
+        fitted[region] = {"base_mb": round(float(intercept), 1),
+                          "bytes_per_cell": round(float(slope) * 1024 * 1024, 1)}
+    print("📐 拟合结果（更新 admission.MEMORY_MODEL）:")
+    print(json.dumps(fitted, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+check_outputs.py
+------------------------------------------------
+分析结果一致性检查（合成数据，固定随机种子）
+- 两个流程按多种配置运行：多行结算策略（exclude / sum / latest）、低内存模式、本地分析数据库、
+  自定义操作费，覆盖组合SKU、大小写/空白不一致的状态、未结算订单和多行结算
+- --save 保存各配置的结果工作簿作为参考；--compare 与参考结果逐个工作表对比
+  （列名和行数必须一致，数值按相对误差 --rtol 比较），有差异时退出码为1
+- 用于重构前后的输出对齐：先在重构前的版本上 --save，重构后 --compare
+
+用法:
+    python benchmarks/check_outputs.py --save reference/
+    python benchmarks/check_outputs.py --compare reference/ [--rtol 1e-9]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+# 不使用解析缓存，保证每次都完整解析输入
+os.environ["PARSE_CACHE_DIR"] = ""
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from analysis_mal import process_malaysia_financial_data  # noqa: E402
+from analysis_multi import process_financial_data  # noqa: E402
+from synthetic_data import make_inputs  # noqa: E402
+
+PIPELINES = {
+    "indonesia": process_financial_data,
+    "malaysia": process_malaysia_financial_data,
+}
+
+# 配置名称 -> (地区, 流程参数)；sku_store 参数在运行时替换为临时数据库文件
+CASES = {
+    "indonesia_exclude": ("indonesia", {}),
+    "indonesia_sum": ("indonesia", {"settlement_policy": "sum"}),
+    "indonesia_latest": ("indonesia", {"settlement_policy": "latest"}),
+    "indonesia_low_memory": ("indonesia", {"low_memory": True}),
+    "indonesia_sku_store": ("indonesia", {"sku_store": True}),
+    "indonesia_fee_tiers": ("indonesia", {"fee_tiers": [(1, 2, 1.5), (3, None, 4.0)]}),
+    "malaysia_latest": ("malaysia", {}),
+    "malaysia_sum": ("malaysia", {"settlement_policy": "sum"}),
+    "malaysia_exclude": ("malaysia", {"settlement_policy": "exclude"}),
+    "malaysia_sku_store": ("malaysia", {"sku_store": True}),
+    "malaysia_op_fee": ("malaysia", {"op_fee": {"xifashui": 1.0, "kingstick": 3.0}}),
+}
+
+
+def run_cases(output_dir: Path, rows: int, cases: dict) -> None:
+    """生成合成输入并按各配置运行，结果写入 output_dir/配置名称/"""
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = {region: make_inputs(region, rows, Path(tmp) / region, order_files=2, seed=7)
+                  for region in PIPELINES}
+        for name, (region, options) in cases.items():
+            target = output_dir / name
+            target.mkdir(parents=True, exist_ok=True)
+            options = dict(options)
+            if options.get("sku_store"):
+                options["sku_store"] = Path(tmp) / f"{name}.db"
+            data = inputs[region]
+            with contextlib.redirect_stdout(io.StringIO()):
+                PIPELINES[region](data["orders"], data["settlements"], data["consumption"],
+                                  output_dir=target, workers=1, **options)
+            print(f"✅ {name}")
+
+
+def compare_dirs(reference: Path, current: Path, cases: dict, rtol: float) -> list:
+    """逐个工作表对比两个结果目录中各配置的结果，返回差异说明列表"""
+    problems = []
+    for ref_file in sorted(path for name in cases for path in (reference / name).glob("*.xlsx")):
+        relative = ref_file.relative_to(reference)
+        cur_file = current / relative
+        if not cur_file.exists():
+            problems.append(f"{relative}: 缺少结果文件")
+            continue
+        expected = pd.read_excel(ref_file, sheet_name=None)
+        actual = pd.read_excel(cur_file, sheet_name=None)
+        if list(expected) != list(actual):
+            problems.append(f"{relative}: 工作表不一致 {list(expected)} != {list(actual)}")
+            continue
+        for sheet, frame in expected.items():
+            try:
+                pd.testing.assert_frame_equal(frame, actual[sheet], check_dtype=False, rtol=rtol)
+            except AssertionError as e:
+                problems.append(f"{relative} [{sheet}]: {str(e).strip().splitlines()[0]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析结果一致性检查")
+    parser.add_argument("--rows", type=int, default=20_000, help="合成订单行数")
+    parser.add_argument("--only", help="只运行这些配置，逗号分隔")
+    parser.add_argument("--save", help="保存结果作为参考的目录")
+    parser.add_argument("--compare", help="参考结果目录")
+    parser.add_argument("--rtol", type=float, default=1e-9, help="数值比较的相对误差")
+    args = parser.parse_args()
+    if not args.save and not args.compare:
+        parser.error("需要指定 --save 或 --compare")
+
+    cases = CASES
+    if args.only:
+        cases = {name: CASES[name] for name in args.only.split(",")}
+
+    if args.save:
+        run_cases(Path(args.save), args.rows, cases)
+        print(f"💾 参考结果已保存: {args.save}")
+
+    if args.compare:
+        with tempfile.TemporaryDirectory() as current:
+            run_cases(Path(current), args.rows, cases)
+            problems = compare_dirs(Path(args.compare), Path(current), cases, args.rtol)
+        if problems:
+            print(f"❌ 发现 {len(problems)} 处差异:")
+            for problem in problems:
+                print(f"   {problem}")
+            sys.exit(1)
+        print("✅ 结果与参考一致")
+
+
+if __name__ == "__main__":
+    main()
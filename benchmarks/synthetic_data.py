@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+synthetic_data.py
+------------------------------------------------
+合成的 BigSeller / TikTok 导出数据，用于基准测试和本地试运行（不依赖真实店铺文件）
+- 印尼：订单表（订单号/sku/数量/是否出库/平台状态）、结算表、产品消耗表
+- 马来：订单表（第2行为注释行）、结算表（Order/adjustment ID）、产品消耗成本表
+- 可配置行数、SKU数量、组合SKU比例、多行结算比例、订单文件数
+
+用法: python benchmarks/synthetic_data.py --region indonesia --rows 100000 -o data/
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from table_io import write_excel_sheets  # noqa: E402
+
+# 每个订单的平均订单行数
+LINES_PER_ORDER = 1.5
+
+# 导出中常见的大小写/空白差异，流程需要统一处理
+INDONESIA_SHIPPED = ["yes", "no", "Yes", " yes"]
+INDONESIA_SHIPPED_P = [0.75, 0.15, 0.05, 0.05]
+INDONESIA_STATUSES = ["Delivered", "Completed", "Cancelled", "In transit", "delivered ", "Unpaid"]
+INDONESIA_STATUSES_P = [0.45, 0.2, 0.12, 0.15, 0.05, 0.03]
+
+MALAYSIA_STATUSES = ["Completed", "Delivered", "Canceled", "Shipped", "To ship"]
+MALAYSIA_STATUSES_P = [0.5, 0.15, 0.12, 0.15, 0.08]
+
+# 马来操作费表中的SKU（OP_FEE），保证合成数据覆盖收费SKU
+MALAYSIA_FEE_SKUS = ["xifashui", "kingstick"]
+
+
+def _order_ids(rng: np.random.Generator, n_orders: int, prefix: str) -> np.ndarray:
+    ids = rng.choice(10 ** 15, size=n_orders, replace=False) + 10 ** 15
+    return np.char.add(prefix, ids.astype(str))
+
+
+def _assign_orders(rng: np.random.Generator, rows: int, n_orders: int) -> np.ndarray:
+    """每行所属订单的序号：每个订单至少一行，同一订单的行相邻（与导出顺序一致）"""
+    extra = rng.integers(0, n_orders, max(rows - n_orders, 0))
+    return np.sort(np.concatenate([np.arange(min(n_orders, rows)), extra]))
+
+
+def _settlement_rows(rng: np.random.Generator, order_ids: np.ndarray,
+                     settled_ratio: float, dup_settlement_ratio: float) -> np.ndarray:
+    """已结算订单的结算行订单号：部分订单未结算，部分订单出现多行结算"""
+    settled = order_ids[rng.random(len(order_ids)) < settled_ratio]
+    duplicated = settled[rng.random(len(settled)) < dup_settlement_ratio]
+    return np.concatenate([settled, duplicated])
+
+
+def make_indonesia_tables(rows: int = 10_000,
+                          n_skus: int = 500,
+                          combo_ratio: float = 0.1,
+                          dup_settlement_ratio: float = 0.02,
+                          settled_ratio: float = 0.9,
+                          wide_columns: bool = False,
+                          seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """
+    生成印尼流程的输入表
+
+    Args:
+        rows: 订单行数
+        n_skus: 基础SKU数量（一半为 xxx-1 形式，一半为 xxx*1 形式）
+        combo_ratio: 组合SKU（xxx-2、xxx*3 等）订单行的比例
+        dup_settlement_ratio: 已结算订单中出现多行结算的比例
+        settled_ratio: 已结算订单的比例
+        wide_columns: 是否附带BigSeller导出中常见的无关宽列（商品名称、收件人地址等）
+        seed: 随机种子
+
+    Returns:
+        {"orders": 订单表, "settlements": 结算表, "consumption": 产品消耗表}
+    """
+    rng = np.random.default_rng(seed)
+    n_orders = max(int(rows / LINES_PER_ORDER), 1)
+    order_ids = _order_ids(rng, n_orders, "58")
+
+    stems = np.array([f"sku{i}" for i in range(n_skus)])
+    dash_style = np.arange(n_skus) % 2 == 0
+    base_skus = np.where(dash_style, np.char.add(stems, "-1"), np.char.add(stems, "*1"))
+
+    picked = rng.integers(0, n_skus, rows)
+    skus = base_skus[picked].astype(object)
+    combo = rng.random(rows) < combo_ratio
+    multiplier = rng.integers(2, 5, rows).astype(str)
+    separator = np.where(dash_style[picked], "-", "*")
+    skus[combo] = np.char.add(np.char.add(stems[picked], separator), multiplier)[combo]
+
+    orders = pd.DataFrame({
+        "订单号": order_ids[_assign_orders(rng, rows, n_orders)],
+        "sku": skus,
+        "数量": rng.integers(1, 4, rows).astype(str),
+        "是否出库": rng.choice(INDONESIA_SHIPPED, rows, p=INDONESIA_SHIPPED_P),
+        "平台状态": rng.choice(INDONESIA_STATUSES, rows, p=INDONESIA_STATUSES_P),
+    })
+    if wide_columns:
+        orders.insert(1, "店铺", "跑6")
+        orders["商品名称"] = np.char.add("Product name with a fairly long description ",
+                                     rng.integers(0, n_skus, rows).astype(str))
+        orders["收件人地址"] = np.char.add("Jl. Example street no. ", rng.integers(0, 10 ** 6, rows).astype(str))
+        orders["买家备注"] = ""
+
+    settle_ids = _settlement_rows(rng, order_ids, settled_ratio, dup_settlement_ratio)
+    settlements = pd.DataFrame({
+        "Order ID": settle_ids,
+        "Type": "Order",
+        "Total settlement amount": rng.uniform(1e4, 2e5, len(settle_ids)).round(2).astype(str),
+        "Settlement time": "2025-03-01",
+    })
+
+    # 约八成基础SKU有消耗/成本记录
+    with_cost = base_skus[rng.random(n_skus) < 0.8]
+    consumption = pd.DataFrame({
+        "sku": with_cost,
+        "印尼盾ads消耗": rng.uniform(0, 1e6, len(with_cost)).round(0),
+        "印尼盾gmvmax消耗": rng.uniform(0, 1e6, len(with_cost)).round(0),
+        "印尼盾单sku成本": rng.uniform(1e4, 5e4, len(with_cost)).round(0),
+    })
+    return {"orders": orders, "settlements": settlements, "consumption": consumption}
+
+
+def make_malaysia_tables(rows: int = 10_000,
+                         n_skus: int = 200,
+                         dup_settlement_ratio: float = 0.02,
+                         settled_ratio: float = 0.9,
+                         seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """
+    生成马来流程的输入表（订单表不含注释行，写出时由 write_inputs 插入）
+
+    Args:
+        rows: 订单行数
+        n_skus: SKU数量（包含 OP_FEE 中的收费SKU）
+        dup_settlement_ratio: 已结算订单中出现多条 Order 类型结算记录的比例
+        settled_ratio: 已结算订单的比例
+        seed: 随机种子
+
+    Returns:
+        {"orders": 订单表, "settlements": 结算表, "consumption": 产品消耗成本表}
+    """
+    rng = np.random.default_rng(seed)
+    n_orders = max(int(rows / LINES_PER_ORDER), 1)
+    order_ids = _order_ids(rng, n_orders, "57")
+
+    sku_names = np.array(MALAYSIA_FEE_SKUS + [f"msku{i}" for i in range(max(n_skus - len(MALAYSIA_FEE_SKUS), 0))])
+    shipped = rng.random(rows) < 0.8
+    orders = pd.DataFrame({
+        "Order ID": order_ids[_assign_orders(rng, rows, n_orders)],
+        "Order Status": rng.choice(MALAYSIA_STATUSES, rows, p=MALAYSIA_STATUSES_P),
+        "Seller SKU": sku_names[rng.integers(0, len(sku_names), rows)],
+        "Quantity": rng.integers(1, 4, rows),
+        "Shipped Time": np.where(shipped, "01/03/2025 10:00:00", ""),
+        "Product Name": np.char.add("Product ", rng.integers(0, len(sku_names), rows).astype(str)),
+    })
+
+    settle_ids = _settlement_rows(rng, order_ids, settled_ratio, dup_settlement_ratio)
+    n_adjust = max(len(settle_ids) // 50, 1)
+    settlements = pd.DataFrame({
+        "Type": ["Order"] * len(settle_ids) + ["Adjustment"] * n_adjust,
+        "Order/adjustment ID": np.concatenate([settle_ids, rng.choice(order_ids, n_adjust)]),
+        "Total settlement amount": rng.uniform(5, 150, len(settle_ids) + n_adjust).round(2),
+        "Statement date": "2025/03/01",
+    })
+
+    consumption = pd.DataFrame({
+        "Seller SKU": sku_names,
+        "单sku马来币成本": rng.uniform(1, 20, len(sku_names)).round(2),
+        "马来币ads消耗": rng.uniform(0, 500, len(sku_names)).round(2),
+        "马来币gmvmax消耗": rng.uniform(0, 200, len(sku_names)).round(2),
+    })
+    return {"orders": orders, "settlements": settlements, "consumption": consumption}
+
+
+def write_inputs(tables: Dict[str, pd.DataFrame],
+                 directory: Union[str, Path],
+                 region: str = "indonesia",
+                 order_files: int = 1) -> Dict[str, Union[List[str], str]]:
+    """
+    把合成表写成Excel输入文件
+
+    Args:
+        tables: make_indonesia_tables / make_malaysia_tables 的结果
+        directory: 输出目录
+        region: indonesia / malaysia（马来订单表在表头后插入注释行）
+        order_files: 订单表拆分成的文件数（按订单顺序切分，同一订单的行在同一文件中）
+
+    Returns:
+        {"orders": [订单文件路径], "settlements": [结算文件路径], "consumption": 消耗文件路径}
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    orders = tables["orders"]
+    id_col = orders.columns[0]
+
+    # 在订单边界处切分，避免同一订单跨文件
+    bounds = np.linspace(0, len(orders), order_files + 1).astype(int)
+    ids = orders[id_col].to_numpy()
+    for i in range(1, order_files):
+        while 0 < bounds[i] < len(orders) and ids[bounds[i]] == ids[bounds[i] - 1]:
+            bounds[i] += 1
+
+    order_paths = []
+    for i in range(order_files):
+        part = orders.iloc[bounds[i]:bounds[i + 1]]
+        if region == "malaysia":
+            comment = pd.DataFrame([["注释行（导出说明）"] * len(part.columns)], columns=part.columns)
+            part = pd.concat([comment, part.astype(object)], ignore_index=True)
+        path = directory / f"{region}_orders_{i + 1}.xlsx"
+        write_excel_sheets({"Sheet1": part}, path)
+        order_paths.append(str(path))
+
+    settlement_path = directory / f"{region}_settlements.xlsx"
+    consumption_path = directory / f"{region}_consumption.xlsx"
+    write_excel_sheets({"Sheet1": tables["settlements"]}, settlement_path)
+    write_excel_sheets({"Sheet1": tables["consumption"]}, consumption_path)
+    return {"orders": order_paths, "settlements": [str(settlement_path)], "consumption": str(consumption_path)}
+
+
+def make_inputs(region: str, rows: int, directory: Union[str, Path], order_files: int = 1,
+                **options) -> Dict[str, Union[List[str], str]]:
+    """生成并写出一组输入文件，options 透传给对应地区的生成函数"""
+    if region == "malaysia":
+        options.pop("combo_ratio", None)
+        options.pop("wide_columns", None)
+        tables = make_malaysia_tables(rows, **options)
+    else:
+        tables = make_indonesia_tables(rows, **options)
+    return write_inputs(tables, directory, region, order_files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成的订单/结算/消耗表")
+    parser.add_argument("--region", default="indonesia", choices=["indonesia", "malaysia"])
+    parser.add_argument("--rows", type=int, default=10_000, help="订单行数")
+    parser.add_argument("--skus", type=int, default=500, help="SKU数量")
+    parser.add_argument("--combo-ratio", type=float, default=0.1, help="组合SKU订单行比例（仅印尼）")
+    parser.add_argument("--dup-ratio", type=float, default=0.02, help="多行结算订单比例")
+    parser.add_argument("--order-files", type=int, default=1, help="订单表文件数")
+    parser.add_argument("--wide", action="store_true", help="附带无关宽列（仅印尼）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output-dir", default="synthetic_data")
+    args = parser.parse_args()
+
+    paths = make_inputs(args.region, args.rows, args.output_dir, order_files=args.order_files,
+                        n_skus=args.skus, combo_ratio=args.combo_ratio, dup_settlement_ratio=args.dup_ratio,
+                        wide_columns=args.wide, seed=args.seed)
+    print(f"✅ 已生成{args.region}输入文件 ({args.rows:,} 行订单):")
+    for kind, value in paths.items():
+        for path in ([value] if isinstance(value, str) else value):
+            print(f"   {kind}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+chunked_engine.py
+------------------------------------------------
+分块 map-reduce 计算（订单历史超出内存时使用，由 run_region 的 chunk_rows / memory_limit_mb 开启）
+- 订单表按行分块流式读取（table_io.ExcelChunkReader），内存中只保留当前块和订单级统计
+- 第一遍：每块标准化（数量、组合SKU、出库/状态标记）后按订单计算部分统计（行数、总件数、出库行数），
+  归约为每个订单的完整统计；标准化后的块暂存为Parquet供第二遍读取（未安装pyarrow时重新读取Excel；
+  SKU等列混有数字和文本、无法转为Parquet的块用pickle暂存，保留原始取值以便与产品消耗表按原值匹配）
+- 第二遍：按订单的完整统计计算每行结算金额和操作费（跨块的订单同样按整单的行数、总件数和
+  订单内最大费用计算），每块得到可合并的SKU部分聚合（金额、数量、计数）后求和归约
+- 按 (SKU, 订单) 去重的订单数：已计入的 (SKU, 订单) 组合编码为 int64 键保存在有序数组中，跨块去重
+- 配置了本地分析数据库时，第二遍每块计算完即写入数据库（line_sink），订单行不在内存中累积
+- 内存上限：按第一块的实际内存确定块大小，进程内存超过上限时缩小后续的块；
+  订单级统计本身超过上限时报错（分块无法再降低内存）
+
+结果与整表计算一致（金额按块求和，浮点误差在末位）；分块模式不输出逐行的订单表工作表。
+"""
+
+import gc
+import tempfile
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from fee_rules import order_max_fees, sku_line_fees, tier_fee
+from parse_cache import parquet_available
+from profiling import current_rss_mb
+from region_engine import (COUNT_COLUMNS, LINE_COLUMNS, aggregate_sku_metrics, allocate_settlement,
+                           category_mask, normalize_labels, normalize_order_frame, order_id_column,
+                           preprocess_combo_sku, require_order_columns, settlement_amounts, shipped_labels)
+from settlement_index import SettlementIndex
+from table_io import READ_CHUNK_ROWS, ExcelChunkReader, ExcelSource, UseCols, read_header, source_name
+
+# 一块可使用的内存占剩余内存（上限 - 当前进程内存）的比例，以及块的工作副本数（读取缓冲、标准化、计算列）
+CHUNK_MEMORY_SHARE = 0.5
+CHUNK_WORKING_COPIES = 2
+MIN_CHUNK_ROWS = 1_000
+
+# 读取缓冲中每个单元格（Python对象 + 列表指针 + 解析时的对象数组）的内存估算（字节）
+BUFFER_CELL_BYTES = 120
+
+# 配置了内存上限时先读取的行数，按其实际内存确定后续块的大小
+PROBE_CHUNK_ROWS = 10_000
+
+# 累计的SKU部分聚合达到此数量时先归约一次
+PARTIAL_REDUCE_EVERY = 16
+
+
+class MemoryLimitError(ValueError):
+    """分块计算的订单级状态超过内存上限"""
+
+
+def chunk_rows_for(available_mb: float, bytes_per_row: float) -> int:
+    """按剩余可用内存和每行内存估算块大小"""
+    budget = max(available_mb, 0.0) * 1024 * 1024 * CHUNK_MEMORY_SHARE / CHUNK_WORKING_COPIES
+    return max(MIN_CHUNK_ROWS, int(budget / max(bytes_per_row, 1.0)))
+
+
+def _order_read_dtype(profile: dict, file_path: ExcelSource):
+    """分块读取的列类型：订单号按文本读取（各块自行推断类型时，含空值的块会变成浮点数）"""
+    options = profile["order_read"]
+    if options["dtype"] == "str":
+        return str
+    id_col = profile["order_id_column"]
+    if id_col is None:
+        return None
+    return {c: str for c in read_header(file_path) if c.strip() == id_col}
+
+
+def _spill(chunk: pd.DataFrame, stem: Path) -> None:
+    """
+    暂存标准化后的块：Parquet；混合类型的object列（如数字和文本SKU）pyarrow无法转换时用pickle，
+    不转为字符串（整表计算保留原始取值，数字SKU按原值与产品消耗表匹配）
+    """
+    import pyarrow as pa
+
+    try:
+        chunk.to_parquet(stem.with_suffix(".parquet"))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        stem.with_suffix(".parquet").unlink(missing_ok=True)
+        chunk.to_pickle(stem.with_suffix(".pkl"))
+
+
+def _load_spilled(path: Path) -> pd.DataFrame:
+    return pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_pickle(path)
+
+
+class ChunkedOrderAggregator:
+    """
+    订单表分块计算SKU聚合
+
+    Args:
+        profile: 地区配置
+        settlements: 结算金额索引（结算表按订单一行，整体加载）
+        fees: 操作费规则，None时使用配置
+        chunk_rows: 每块行数，None时为默认值（配置了内存上限时按上限估算）
+        memory_limit_mb: 内存上限（MB），None为不限
+        with_fee_basis: 是否同时计算场景测算用的操作费基数
+        report: 进度回调
+        line_sink: 第二遍每块计算完后调用 line_sink(块, 数量列, SKU列)（如写入本地分析数据库），
+                   块中已有每行结算金额、操作费和出库/状态标记
+    """
+
+    def __init__(self, profile: dict, settlements: SettlementIndex, fees=None,
+                 chunk_rows: Optional[int] = None, memory_limit_mb: Optional[float] = None,
+                 with_fee_basis: bool = False, report: Optional[Callable[[str, int], None]] = None,
+                 line_sink: Optional[Callable[[pd.DataFrame, str, str], None]] = None):
+        self.profile = profile
+        self.settlements = settlements
+        self.fees = fees or (profile["fee_tiers"] if profile["fee_rule"] == "order_tiers" else profile["sku_fees"])
+        self.chunk_rows = chunk_rows or (PROBE_CHUNK_ROWS if memory_limit_mb is not None else READ_CHUNK_ROWS)
+        self.sized = chunk_rows is not None
+        self.memory_limit_mb = memory_limit_mb
+        self.with_fee_basis = with_fee_basis
+        self.report = report or (lambda stage, percent: None)
+        self.line_sink = line_sink
+        self.id_col = order_id_column(profile)
+        self.columns: Optional[List[str]] = None
+        self.lines = 0
+        self.chunks = 0
+
+    # -------- 读取与标准化 --------
+    def _raw_chunks(self, order_files: List[ExcelSource], usecols: UseCols) -> Iterator[pd.DataFrame]:
+        options = self.profile["order_read"]
+        for file_path in order_files:
+            reader = ExcelChunkReader(file_path, chunk_rows=self.chunk_rows,
+                                      dtype=_order_read_dtype(self.profile, file_path),
+                                      usecols=usecols, skiprows=options["skiprows"])
+            for chunk in reader:
+                self._resize(chunk)
+                yield normalize_order_frame(self.profile, chunk)
+                reader.chunk_rows = self.chunk_rows
+            print(f"📂 已分块读取订单文件: {source_name(file_path)}")
+
+    def _prepare(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """块标准化（与 compute_order_lines 相同的处理）：订单号、SKU、数量、出库/状态标记"""
+        columns = require_order_columns(self.profile, chunk.columns)
+        if self.columns is None:
+            self.columns = columns
+        qty_col, sku_col, ship_col, status_col = columns
+        out = pd.DataFrame({
+            self.id_col: chunk[self.id_col],
+            sku_col: chunk[sku_col],
+            qty_col: pd.to_numeric(chunk[qty_col], errors="coerce").fillna(0).astype(int),
+        })
+        if self.profile["combo_sku_patterns"]:
+            out = preprocess_combo_sku(out, sku_col, qty_col, self.profile["combo_sku_patterns"],
+                                       copy=False, verbose=False)
+        out[LINE_COLUMNS["shipped_label"]] = shipped_labels(self.profile, chunk[ship_col], categorical=True)
+        out[LINE_COLUMNS["status_label"]] = normalize_labels(chunk[status_col], categorical=True)
+        return out
+
+    def _resize(self, chunk: pd.DataFrame) -> None:
+        """按内存上限调整后续块的大小（按读取的原始块估算）"""
+        if self.memory_limit_mb is None:
+            return
+        if not self.sized and len(chunk) > 0:
+            bytes_per_row = chunk.memory_usage(deep=True).sum() / len(chunk) + BUFFER_CELL_BYTES * chunk.shape[1]
+            self.chunk_rows = chunk_rows_for(self.memory_limit_mb - current_rss_mb(), bytes_per_row)
+            self.sized = True
+            print(f"🧮 按内存上限 {self.memory_limit_mb:.0f} MB 分块: 每块 {self.chunk_rows:,} 行")
+        if current_rss_mb() > self.memory_limit_mb:
+            gc.collect()
+            if current_rss_mb() > self.memory_limit_mb and self.chunk_rows > MIN_CHUNK_ROWS:
+                self.chunk_rows = max(MIN_CHUNK_ROWS, self.chunk_rows // 2)
+                print(f"⚠️  内存超过上限，后续每块缩小为 {self.chunk_rows:,} 行")
+
+    def _check_state(self, state_bytes: float) -> None:
+        """订单级统计本身超过内存上限时报错"""
+        if self.memory_limit_mb is not None and state_bytes / 1024 / 1024 > self.memory_limit_mb:
+            raise MemoryLimitError(
+                f"分块计算的订单级统计（{state_bytes / 1024 / 1024:.0f} MB）超过内存上限 "
+                f"{self.memory_limit_mb:.0f} MB，请提高上限或按时间段拆分订单文件")
+
+    # -------- 第一遍：订单级统计 --------
+    def _order_partial(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """块内每个订单的行数、总件数、出库行数（可跨块求和）"""
+        qty_col = self.columns[0]
+        codes, uniques = pd.factorize(chunk[self.id_col])
+        valid = codes >= 0
+        n = len(uniques)
+        shipped = category_mask(chunk[LINE_COLUMNS["shipped_label"]], self.profile["shipped_labels"])
+        return pd.DataFrame({
+            "lines": np.bincount(codes[valid], minlength=n),
+            "qty": np.bincount(codes[valid], weights=chunk[qty_col].to_numpy(dtype=float)[valid], minlength=n),
+            "shipped": np.bincount(codes[valid], weights=shipped[valid], minlength=n),
+        }, index=pd.Index(uniques, name=self.id_col))
+
+    def _first_pass(self, order_files: List[ExcelSource], usecols: UseCols, spill_dir: Optional[Path]) -> None:
+        partials = []
+        for chunk in self._raw_chunks(order_files, usecols):
+            chunk = self._prepare(chunk)
+            partials.append(self._order_partial(chunk))
+            self.lines += len(chunk)
+            self.chunks += 1
+            if spill_dir is not None:
+                _spill(chunk, spill_dir / f"chunk_{self.chunks:06d}")
+            self.report("分块统计订单", min(40, 20 + self.chunks))
+        if self.columns is None:
+            raise ValueError("订单文件中没有数据")
+
+        stats = pd.concat(partials).groupby(level=0, sort=False).sum()
+        del partials
+        self._check_state(stats.memory_usage(deep=True, index=True).sum())
+        self.order_index = stats.index
+        self.order_lines = stats["lines"].to_numpy(dtype=float)
+        self.order_qty = stats["qty"].to_numpy(dtype=float)
+        self.order_shipped = stats["shipped"].to_numpy(dtype=float)
+        if self.profile["fee_rule"] == "order_tiers":
+            self.order_max_fee = order_max_fees(self.order_lines, self.order_qty, self.order_shipped, self.fees)
+        print(f"📋 第一遍完成: {self.lines:,} 行, {self.chunks} 块, {len(stats):,} 个订单")
+
+    # -------- 第二遍：订单行计算与SKU部分聚合 --------
+    def _sku_codes(self, skus: pd.Series) -> np.ndarray:
+        """SKU的全局编码（空值也是一个取值，与 duplicated 的语义一致）"""
+        local, uniques = pd.factorize(skus, use_na_sentinel=False)
+        found = self.sku_index.get_indexer(uniques)
+        if (found < 0).any():
+            self.sku_index = self.sku_index.append(pd.Index(uniques[found < 0], dtype=object))
+            found = self.sku_index.get_indexer(uniques)
+        return found[local].astype(np.int64)
+
+    def _first_rows(self, chunk: pd.DataFrame, codes: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """计入订单数的行：distinct 规则下为 (SKU, 订单) 在全部数据中第一次出现的行"""
+        if self.profile["order_count"] != "distinct":
+            return valid
+        keys = self._sku_codes(chunk[self.columns[1]]) * len(self.order_index) + codes
+        # 订单号缺失的行不计入，给不会重复的负数键，避免与有效组合冲突
+        keys = np.where(valid, keys, -1 - np.arange(len(keys)))
+        first = valid & ~pd.Series(keys).duplicated().to_numpy()
+        if len(self.seen):
+            pos = np.minimum(np.searchsorted(self.seen, keys), len(self.seen) - 1)
+            first &= self.seen[pos] != keys
+        new = np.sort(keys[first])
+        # 两段有序数组合并（timsort 识别有序段，线性时间）
+        self.seen = np.concatenate([self.seen, new])
+        self.seen.sort(kind="stable")
+        return first
+
+    def _compute_chunk(self, chunk: pd.DataFrame):
+        """块内每行结算金额和操作费（按订单的完整统计），返回 (SKU部分聚合, 操作费基数部分)"""
+        qty_col, sku_col = self.columns[0], self.columns[1]
+        ids = chunk[self.id_col]
+        codes = self.order_index.get_indexer(ids)
+        valid = (codes >= 0) & ids.notna().to_numpy()
+        codes = np.where(valid, codes, 0)
+        lines = np.where(valid, self.order_lines[codes], np.nan)
+        shipped = category_mask(chunk[LINE_COLUMNS["shipped_label"]], self.profile["shipped_labels"])
+
+        if self.profile["fee_rule"] == "order_tiers":
+            total_qty = np.where(valid, self.order_qty[codes], np.nan)
+            chunk[LINE_COLUMNS["order_fee"]] = np.where(shipped & valid, tier_fee(total_qty, self.fees), 0.0)
+            chunk[LINE_COLUMNS["fee_line"]] = np.where(valid, self.order_max_fee[codes], np.nan) / lines
+        else:
+            line_fees = sku_line_fees(chunk[sku_col], shipped, self.fees)
+            chunk[LINE_COLUMNS["order_fee"]] = line_fees
+            chunk[LINE_COLUMNS["fee_line"]] = line_fees
+        settlement = pd.Series(settlement_amounts(self.profile, self.settlements, ids), index=chunk.index)
+        chunk[LINE_COLUMNS["settlement"]] = settlement
+        chunk[LINE_COLUMNS["settlement_line"]] = allocate_settlement(self.profile, settlement, lines)
+
+        first = self._first_rows(chunk, codes, valid)
+        sku = aggregate_sku_metrics(self.profile, chunk, sku_col, qty_col, first=first)
+        if self.line_sink is not None:
+            self.line_sink(chunk, qty_col, sku_col)
+
+        basis = None
+        if self.with_fee_basis:
+            skus = chunk[sku_col].astype(object)
+            if self.profile["fee_rule"] != "order_tiers":
+                basis = pd.DataFrame({"sku": skus, "weight": shipped.astype(float)}).groupby("sku").sum()
+            else:
+                charged = valid & (self.order_shipped[codes] > 0)
+                weight = np.where(charged, 1 / np.where(valid, lines, 1.0), 0.0)
+                order_qty = np.where(valid, self.order_qty[codes], 0.0)
+                basis = (pd.DataFrame({"sku": skus, "order_qty": order_qty, "weight": weight})[weight > 0]
+                         .groupby(["sku", "order_qty"]).sum())
+        return sku, basis
+
+    @staticmethod
+    def _reduce(partials: List[pd.DataFrame]) -> List[pd.DataFrame]:
+        """部分聚合求和归约（按索引对齐）"""
+        if not partials:
+            return partials
+        return [pd.concat(partials).groupby(level=list(range(partials[0].index.nlevels)), sort=True).sum()]
+
+    def _second_pass(self, chunks: Iterator[pd.DataFrame]) -> None:
+        self.sku_index = pd.Index([], dtype=object)
+        self.seen = np.empty(0, dtype=np.int64)
+        sku_parts: List[pd.DataFrame] = []
+        basis_parts: List[pd.DataFrame] = []
+        for done, chunk in enumerate(chunks, start=1):
+            sku, basis = self._compute_chunk(chunk)
+            sku_parts.append(sku)
+            if basis is not None:
+                basis_parts.append(basis)
+            if len(sku_parts) >= PARTIAL_REDUCE_EVERY:
+                sku_parts, basis_parts = self._reduce(sku_parts), self._reduce(basis_parts)
+                self._check_state(self.seen.nbytes + self.order_index.memory_usage(deep=True))
+            self.report("分块计算SKU指标", 40 + int(25 * done / max(self.chunks, 1)))
+
+        sku = self._reduce(sku_parts)[0]
+        sku[COUNT_COLUMNS] = sku[COUNT_COLUMNS].astype("int64")
+        sku.index.name = self.columns[1]
+        self.sku = sku.fillna(0)
+        self.fee_basis = self._reduce(basis_parts)[0].reset_index() if self.with_fee_basis else None
+
+    def run(self, order_files: List[ExcelSource], usecols: UseCols = None) -> "ChunkedOrderAggregator":
+        """
+        两遍分块计算
+
+        Args:
+            order_files: 订单文件列表
+            usecols: 订单表只需加载的列（表头校验得到的订单号 + 关键列）
+
+        Returns:
+            self：sku（SKU聚合结果，同 aggregate_sku_metrics）、fee_basis（操作费基数）、
+            columns（[数量列, SKU列, 出库列, 状态列]）、lines（订单行数）
+        """
+        if parquet_available():
+            with tempfile.TemporaryDirectory(prefix="chunked-") as tmp:
+                spill_dir = Path(tmp)
+                self._first_pass(order_files, usecols, spill_dir)
+                self._second_pass(_load_spilled(path) for path in sorted(spill_dir.glob("chunk_*")))
+        else:
+            self._first_pass(order_files, usecols, None)
+            self._second_pass(self._prepare(chunk) for chunk in self._raw_chunks(order_files, usecols))
+        print(f"✅ 分块计算完成: {self.lines:,} 行, {self.chunks} 块, {len(self.sku):,} 个SKU")
+        return self
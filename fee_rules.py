@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fee_rules.py
+------------------------------------------------
+操作费规则引擎（印尼 / 马来模块共用）
+- 按订单总件数分档的订单操作费：订单只分组一次，行数、总件数、出库行数用
+  bincount 一次算出后广播回订单行，费用用 np.select 按档位计算
+- 按SKU固定的单行操作费：SKU -> 费用映射，只对出库行收取
+
+档位规则为数据而非代码：[(最小件数, 最大件数(含，None表示不限), 费用), ...]，
+按顺序匹配，命中第一个档位即停止，未命中任何档位的费用为0。
+"""
+
+from typing import Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+FeeTier = Tuple[float, Optional[float], float]
+
+
+def tier_fee(total_qty: np.ndarray, tiers: Sequence[FeeTier]) -> np.ndarray:
+    """按档位规则计算订单操作费"""
+    total_qty = np.asarray(total_qty, dtype=float)
+    conditions = []
+    for lower, upper, _ in tiers:
+        cond = total_qty >= lower
+        if upper is not None:
+            cond &= total_qty <= upper
+        conditions.append(cond)
+    return np.select(conditions, [fee for _, _, fee in tiers], default=0.0)
+
+
+def order_max_fees(order_lines: np.ndarray, order_qty: np.ndarray, order_shipped: np.ndarray,
+                   tiers: Sequence[FeeTier]) -> np.ndarray:
+    """
+    订单内各行操作费的最大值（按订单的行数、总件数、出库行数计算）：
+    全部出库时为档位费用，部分出库时与未出库行的0取较大值，没有出库行时为0
+    """
+    fee = tier_fee(order_qty, tiers)
+    return np.where(order_shipped == order_lines, fee, np.where(order_shipped > 0, np.maximum(fee, 0.0), 0.0))
+
+
+def order_fee_table(order_ids: pd.Series,
+                    qty: pd.Series,
+                    shipped: pd.Series,
+                    tiers: Sequence[FeeTier]) -> pd.DataFrame:
+    """
+    计算订单级操作费并广播回每一行
+
+    Args:
+        order_ids: 订单号列（缺失订单号的行不参与分组）
+        qty: 数量列
+        shipped: 是否出库（布尔）
+        tiers: 按订单总件数分档的费用规则
+
+    Returns:
+        与输入同索引的DataFrame：
+        - lines: 订单行数
+        - total_qty: 订单总件数
+        - order_fee: 该行的订单操作费（行已出库时按订单总件数取档位费用，否则为0）
+        - fee_per_line: 订单内各行 order_fee 的最大值均摊到每一行
+    """
+    codes, uniques = pd.factorize(order_ids)
+    valid = codes >= 0
+    n_orders = len(uniques)
+    valid_codes = codes[valid]
+
+    qty_values = pd.to_numeric(qty, errors="coerce").fillna(0).to_numpy(dtype=float)
+    shipped_values = np.asarray(shipped, dtype=bool)
+
+    # 一次分组得到订单级的行数、总件数、出库行数
+    order_lines = np.bincount(valid_codes, minlength=n_orders).astype(float)
+    order_qty = np.bincount(valid_codes, weights=qty_values[valid], minlength=n_orders)
+    order_shipped = np.bincount(valid_codes, weights=shipped_values[valid], minlength=n_orders)
+
+    order_max_fee = order_max_fees(order_lines, order_qty, order_shipped, tiers)
+
+    # 广播回订单行；缺失订单号的行按 groupby 语义为 NaN
+    lines = np.full(len(codes), np.nan)
+    total_qty = np.full(len(codes), np.nan)
+    fee_per_line = np.full(len(codes), np.nan)
+    lines[valid] = order_lines[valid_codes]
+    total_qty[valid] = order_qty[valid_codes]
+    fee_per_line[valid] = order_max_fee[valid_codes] / order_lines[valid_codes]
+
+    line_fee = np.where(shipped_values & valid, tier_fee(total_qty, tiers), 0.0)
+
+    return pd.DataFrame({
+        "lines": lines,
+        "total_qty": total_qty,
+        "order_fee": line_fee,
+        "fee_per_line": fee_per_line,
+    }, index=order_ids.index)
+
+
+def sku_line_fees(skus: pd.Series, shipped: pd.Series, fee_map: Mapping[str, float]) -> np.ndarray:
+    """
+    按SKU固定费用计算每行操作费，未出库或不在映射中的SKU费用为0
+
+    Args:
+        skus: SKU列
+        shipped: 是否出库（布尔）
+        fee_map: SKU -> 单行操作费
+
+    Returns:
+        每行操作费
+    """
+    return np.where(np.asarray(shipped, dtype=bool), skus.map(fee_map).fillna(0).to_numpy(dtype=float), 0.0)
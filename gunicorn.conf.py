@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 配置 - 生产环境部署
+
+用法: gunicorn -c gunicorn.conf.py wsgi:app
+
+所有参数都可通过环境变量覆盖，见 README「生产部署」
+"""
+
+import os
+
+# 监听地址
+bind = os.environ.get("BIND", f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8080')}")
+
+# worker进程数和每个worker的线程数：大文件上传/同步分析只占用一个线程，不会阻塞其他请求
+workers = int(os.environ.get("WEB_WORKERS", 2))
+# 内存准入按 worker 数平均分配整个服务的预算（admission.get_scheduler，preload_app 下在主进程读取）
+os.environ["WEB_WORKERS"] = str(workers)
+threads = int(os.environ.get("WEB_THREADS", 4))
+worker_class = "gthread"
+
+# 同步分析（/process）可能持续数分钟；关闭/重启worker时等待正在执行的分析完成
+timeout = int(os.environ.get("WEB_TIMEOUT", 600))
+graceful_timeout = timeout
+keepalive = 5
+
+# 主进程预先导入应用和 pandas/openpyxl 等依赖，fork 出的worker直接共享，无需各自导入
+preload_app = True
+
+# worker内存上限（MB，0为不限）：超过后在没有进行中的任务时平滑重启该worker
+worker_max_rss_mb = int(os.environ.get("WEB_WORKER_MAX_RSS_MB", 0))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_request(worker, req, environ, resp):
+    """请求结束后检查worker内存，超过上限且没有排队/运行中的后台任务时退出，由主进程拉起新worker"""
+    if not worker_max_rss_mb:
+        return
+    from app import job_manager
+    from profiling import current_rss_mb
+
+    rss = current_rss_mb()
+    counts = job_manager.counts()
+    if rss > worker_max_rss_mb and counts["queued"] == 0 and counts["running"] == 0:
+        worker.log.info("worker %s RSS %.0fMB 超过上限 %sMB，平滑重启", worker.pid, rss, worker_max_rss_mb)
+        worker.alive = False
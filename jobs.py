@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+jobs.py
+------------------------------------------------
+后台分析任务队列
+- 有界线程池执行分析任务，请求线程只负责保存上传文件并立即返回任务ID
+- 配置了准入调度器（admission.AdmissionScheduler）时，任务先按估算内存和用户/店铺公平排队，准入后才进入线程池；
+  同时准入的后台任务数不超过线程数，准入的任务不会在线程池中占着内存预算排队
+- 本地任务存储：内存中的任务状态 + 每个任务一个工作目录
+- 任务进度（阶段 + 百分比）由分析流程的 progress 回调上报
+- 已结束任务的工作目录和结果文件超过保留时间后自动清理
+- 任务状态同时写入工作目录下的 job.json，多进程部署（gunicorn 多worker）时
+  任意worker都能查询其他worker上任务的状态和结果
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from admission import AdmissionScheduler, Ticket
+
+# 任务状态
+QUEUED, RUNNING, FINISHED, FAILED = "queued", "running", "finished", "failed"
+
+# 准入调度中后台任务线程池对应的执行池
+JOB_POOL = "jobs"
+
+# 任务状态文件（位于任务工作目录）
+JOB_STATE_FILE = "job.json"
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Job:
+    """单个分析任务的状态"""
+
+    def __init__(self, job_id: str, analysis_type: str, work_dir: Path):
+        self.id = job_id
+        self.analysis_type = analysis_type
+        self.work_dir = work_dir
+        self.status = QUEUED
+        self.stage = "排队中"
+        self.percent = 0
+        self.error: Optional[str] = None
+        self.result_path: Optional[Path] = None
+        self.download_name: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 阶段统计（profiling.StageProfiler），运行中即可查询已完成的阶段
+        self.profile = None
+        # 函数级剖析结果文件（请求开启剖析时）
+        self.profile_path: Optional[Path] = None
+        # 准入调度的票据（估算内存、等待时间、运行期间是否与其他任务并发）
+        self.ticket: Optional[Ticket] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (FINISHED, FAILED)
+
+    def update_progress(self, stage: str, percent: int) -> None:
+        """分析流程的进度回调"""
+        self.stage = stage
+        self.percent = max(self.percent, min(int(percent), 100))
+        self.save()
+
+    def save(self) -> None:
+        """把任务状态写入工作目录（先写临时文件再替换，读取方不会读到半个文件）"""
+        state = {**self.to_dict(),
+                 "result_path": str(self.result_path) if self.result_path else None,
+                 "profile_path": str(self.profile_path) if self.profile_path else None}
+        tmp = self.work_dir / f"{JOB_STATE_FILE}.tmp"
+        try:
+            tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.work_dir / JOB_STATE_FILE)
+        except OSError:
+            # 任务目录已被清理
+            pass
+
+    @classmethod
+    def load(cls, work_dir: Path) -> Optional["Job"]:
+        """从工作目录读取任务状态（其他进程中的任务），不存在时返回None"""
+        try:
+            state = json.loads((work_dir / JOB_STATE_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        job = cls(state["job_id"], state["analysis_type"], work_dir)
+        for key in ("status", "stage", "percent", "error", "download_name",
+                    "created_at", "started_at", "finished_at", "profile"):
+            setattr(job, key, state.get(key))
+        job.result_path = Path(state["result_path"]) if state.get("result_path") else None
+        job.profile_path = Path(state["profile_path"]) if state.get("profile_path") else None
+        return job
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "analysis_type": self.analysis_type,
+            "status": self.status,
+            "stage": self.stage,
+            "percent": self.percent,
+            "error": self.error,
+            "download_name": self.download_name,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            # 本进程中的任务为 StageProfiler，从状态文件读取的任务为已序列化的字典
+            "profile": self.profile.to_dict() if hasattr(self.profile, "to_dict") else self.profile,
+        }
+
+
+# 任务执行函数: runner(job) -> (结果文件路径, 下载文件名)
+JobRunner = Callable[[Job], tuple]
+
+
+class JobManager:
+    """任务存储与调度"""
+
+    def __init__(self, root: Union[str, Path], max_workers: int = 2, retention_seconds: int = 3600,
+                 scheduler: Optional[AdmissionScheduler] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.retention_seconds = retention_seconds
+        self.scheduler = scheduler
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        if scheduler is not None:
+            scheduler.set_pool_limit(JOB_POOL, max_workers)
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self._remove_stale_dirs()
+
+    def _remove_stale_dirs(self) -> None:
+        """清理上次进程或其他worker遗留的过期任务目录（运行中的任务会持续更新 job.json）"""
+        now = time.time()
+        for path in self.root.iterdir():
+            try:
+                stale = path.is_dir() and now - path.stat().st_mtime > self.retention_seconds
+            except FileNotFoundError:
+                continue
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def create_job(self, analysis_type: str) -> Job:
+        """创建任务及其工作目录（提交前用于保存上传文件）"""
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        work_dir = self.root / job_id
+        work_dir.mkdir(parents=True)
+        job = Job(job_id, analysis_type, work_dir)
+        job.save()
+        with self.lock:
+            self.jobs[job_id] = job
+        return job
+
+    def submit(self, job: Job, runner: JobRunner, owner: Optional[str] = None, estimate_mb: float = 0.0) -> None:
+        """
+        把任务放入线程池排队执行
+
+        Args:
+            owner: 提交任务的用户/店铺（准入调度按此公平排队）
+            estimate_mb: 任务的估算峰值内存（MB），0 表示不占用预算（如命中结果缓存、等待正在进行的相同计算）
+        """
+        if self.scheduler is None:
+            self.executor.submit(self._run, job, runner)
+            return
+        ticket = self.scheduler.submit(owner or job.analysis_type, estimate_mb,
+                                       lambda ticket: self.executor.submit(self._run, job, runner, ticket),
+                                       label=job.id, pool=JOB_POOL)
+        if ticket.admitted_at is None:
+            job.update_progress("等待内存配额", 0)
+
+    def _run(self, job: Job, runner: JobRunner, ticket: Optional[Ticket] = None) -> None:
+        job.ticket = ticket
+        try:
+            self._execute(job, runner)
+        finally:
+            if ticket is not None:
+                self.scheduler.release(ticket)
+
+    def _execute(self, job: Job, runner: JobRunner) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.update_progress("开始分析", 1)
+        try:
+            job.result_path, job.download_name = runner(job)
+            job.finished_at = time.time()
+            job.status = FINISHED
+            job.update_progress("完成", 100)
+        except Exception as e:
+            print(f"❌ 任务 {job.id} 失败: {e}")
+            traceback.print_exc()
+            job.error = str(e)
+            job.finished_at = time.time()
+            job.status = FAILED
+            job.save()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """查询任务：本进程中的任务直接返回，否则从任务目录读取（其他worker提交的任务）"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None and JOB_ID_PATTERN.match(job_id):
+            job = Job.load(self.root / job_id)
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        """本进程中各状态的任务数"""
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, FINISHED, FAILED)}
+
+    def cleanup(self) -> int:
+        """删除超过保留时间的已结束任务及其文件，返回清理的任务数"""
+        now = time.time()
+        with self.lock:
+            expired = [job for job in self.jobs.values()
+                       if job.done and now - job.finished_at > self.retention_seconds]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+        # 其他worker留下的过期任务目录
+        self._remove_stale_dirs()
+        return len(expired)
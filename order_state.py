@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+order_state.py
+------------------------------------------------
+增量分析的本地状态存储（印尼模块）
+- 按订单保存计算后的订单行（每行结算金额、操作费、出库/状态标记）
+- 保存每个订单原始订单行的指纹，用于识别新增或内容变化（如状态变化）的订单
+- 保存所有已上传的结算行（按行内容去重，重复上传同一结算表不会重复计入）
+- 保存SKU级别聚合结果，新上传只对受影响的订单做增量更新
+
+每次更新写入新的版本目录（gen-<n>），写完后原子替换 CURRENT 指针，
+中途失败不会留下半新半旧的状态；同一状态目录的更新通过文件锁串行执行。
+"""
+
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from parse_cache import parquet_available
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 状态结构或计算逻辑变化时递增，旧版本状态目录需要重建
+ORDER_STATE_VERSION = 2
+
+STATE_TABLES = ("lines", "orders", "settlements", "sku")
+
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    逐行计算内容哈希：只计入非空单元格的 (列名, 值)，与列顺序无关，
+    不同文件列集合不同（合并后补出的空列）不影响结果
+    """
+    combined = np.zeros(len(df), dtype=np.uint64)
+    for col in df.columns:
+        values = df[col]
+        name_hash = pd.util.hash_array(np.array([str(col)], dtype=object))[0]
+        cell = pd.util.hash_array(values.astype(str).to_numpy(dtype=object)) ^ name_hash
+        combined += np.where(values.notna().to_numpy(), cell, np.uint64(0))
+    # 再哈希一次，避免不同行之间的单元格互换后求和结果不变
+    return pd.util.hash_array(combined)
+
+
+def order_fingerprints(order: pd.DataFrame, id_col: str = "order_id") -> pd.DataFrame:
+    """
+    按订单计算原始订单行的指纹（订单内各行哈希之和，与行顺序无关）
+
+    Args:
+        order: 原始订单行
+        id_col: 订单号列名
+
+    Returns:
+        DataFrame[订单号列, fingerprint(十六进制字符串)]
+    """
+    codes, uniques = pd.factorize(order[id_col])
+    total = np.zeros(len(uniques), dtype=np.uint64)
+    np.add.at(total, codes, _row_hashes(order))
+    return pd.DataFrame({
+        id_col: uniques,
+        "fingerprint": [format(int(v), "016x") for v in total],
+    })
+
+
+def settlement_row_keys(settle: pd.DataFrame) -> pd.Series:
+    """
+    结算行的去重键：行内容哈希 + 同一次上传中相同内容出现的序号
+    （同一次上传内的重复行仍按多行结算处理，重复上传同一文件则不会再次追加）
+    """
+    hashes = pd.Series([format(int(v), "016x") for v in _row_hashes(settle)], index=settle.index)
+    occurrence = hashes.groupby(hashes).cumcount().astype(str)
+    return hashes + "-" + occurrence
+
+
+class OrderStateStore:
+    """基于目录的增量分析状态，每个版本一个子目录，表以Parquet保存"""
+
+    def __init__(self, root: Union[str, Path]):
+        if not parquet_available():
+            raise ValueError("增量模式需要安装 pyarrow")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _current_dir(self) -> Optional[Path]:
+        try:
+            name = (self.root / "CURRENT").read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        return self.root / name
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """独占锁，保证同一状态目录同时只有一个更新"""
+        with open(self.root / ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_meta(self) -> Optional[dict]:
+        """读取状态元数据，尚无状态时返回None"""
+        current = self._current_dir()
+        if current is None:
+            return None
+        meta = json.loads((current / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("version") != ORDER_STATE_VERSION:
+            raise ValueError(f"增量状态版本不兼容（{meta.get('version')}），请使用新的状态目录")
+        return meta
+
+    def read(self, name: str) -> Optional[pd.DataFrame]:
+        """读取状态表，尚无状态时返回None"""
+        current = self._current_dir()
+        if current is None:
+            return None
+        return pd.read_parquet(current / f"{name}.parquet")
+
+    def write(self, tables: Dict[str, pd.DataFrame], meta: dict) -> None:
+        """写入新版本并切换 CURRENT 指针，随后删除旧版本"""
+        current = self._current_dir()
+        generation = int(current.name.split("-")[1]) + 1 if current is not None else 1
+        target = self.root / f"gen-{generation}"
+        shutil.rmtree(target, ignore_errors=True)
+        target.mkdir()
+
+        for name in STATE_TABLES:
+            tables[name].to_parquet(target / f"{name}.parquet", index=False)
+        (target / "meta.json").write_text(
+            json.dumps({**meta, "version": ORDER_STATE_VERSION}, ensure_ascii=False), encoding="utf-8")
+
+        pointer = self.root / "CURRENT.tmp"
+        pointer.write_text(target.name, encoding="utf-8")
+        os.replace(pointer, self.root / "CURRENT")
+
+        for path in self.root.glob("gen-*"):
+            if path != target:
+                shutil.rmtree(path, ignore_errors=True)
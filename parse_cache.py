@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+parse_cache.py
+------------------------------------------------
+上传文件解析缓存（按文件内容 SHA-256 寻址）
+- 缓存每个文件标准化后的DataFrame（order_id重命名、结算列识别之后），Parquet格式
+- 同一文件再次上传时只需计算哈希 + 列式加载，跳过Excel解析
+- 缓存键包含读取配置的指纹（加载的列、读取引擎、地区配置中的解析选项），配置不同时分开缓存
+- 按缓存总大小做LRU淘汰（以文件修改时间作为最近使用时间）
+
+通过环境变量配置：
+- PARSE_CACHE_DIR: 缓存目录，未设置时不启用缓存
+- PARSE_CACHE_MAX_BYTES: 缓存总大小上限（字节），默认 2GB
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+import pandas as pd
+
+from table_io import ExcelSource, is_path, resolve_read_engine, rewind, source_name
+
+# 解析逻辑变化时递增，使旧缓存自动失效
+PARSE_CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _update_digest(digest, f) -> None:
+    for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+
+
+def file_sha256(source: ExcelSource) -> str:
+    """分块计算文件（路径或二进制文件对象）内容的 SHA-256"""
+    digest = hashlib.sha256()
+    if is_path(source):
+        with open(source, "rb") as f:
+            _update_digest(digest, f)
+    else:
+        _update_digest(digest, rewind(source))
+        rewind(source)
+    return digest.hexdigest()
+
+
+def _canonical(value: Any) -> str:
+    """配置转为与字典/集合顺序无关的规范文本；函数按模块和名称描述，partial 同时描述绑定的参数"""
+    if isinstance(value, dict):
+        items = sorted((repr(k), _canonical(v)) for k, v in value.items())
+        return "{" + ",".join(f"{k}:{v}" for k, v in items) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_canonical(v) for v in value) + "]"
+    if isinstance(value, (set, frozenset)):
+        return "{" + ",".join(sorted(_canonical(v) for v in value)) + "}"
+    if isinstance(value, partial):
+        return f"{_canonical(value.func)}({_canonical(list(value.args))},{_canonical(value.keywords)})"
+    if callable(value):
+        return f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', repr(value))}"
+    return repr(value)
+
+
+def config_fingerprint(config: Any) -> str:
+    """读取配置的指纹（规范文本的 SHA-256 前16位）"""
+    return hashlib.sha256(_canonical(config).encode("utf-8")).hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def parquet_available() -> bool:
+    """是否安装了 pyarrow（Parquet读写依赖）"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ParseCache:
+    """基于目录的解析结果缓存，每个条目一个Parquet文件"""
+
+    def __init__(self, root: Union[str, Path], max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def entry_path(self, key: str) -> Path:
+        return self.root / f"{key}.parquet"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """读取缓存条目，未命中返回None；命中时刷新其最近使用时间"""
+        path = self.entry_path(key)
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> bool:
+        """
+        写入缓存条目（先写临时文件再原子替换），写入后按总大小淘汰
+
+        Returns:
+            是否写入成功；无法转换为Parquet的表（如重复列名、混合类型列）不缓存
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        try:
+            df.to_parquet(tmp_name)
+            os.replace(tmp_name, self.entry_path(key))
+        except Exception as e:
+            Path(tmp_name).unlink(missing_ok=True)
+            print(f"⚠️  解析缓存写入失败，跳过缓存: {e}")
+            return False
+        self.evict()
+        return True
+
+    def evict(self) -> None:
+        """按最近使用时间从旧到新删除条目，直到总大小不超过上限"""
+        entries = []
+        for path in self.root.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+        # 清理异常退出遗留的临时文件
+        for path in self.root.glob("*.tmp"):
+            try:
+                if time.time() - path.stat().st_mtime > 3600:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+
+
+def get_parse_cache() -> Optional[ParseCache]:
+    """按环境变量构建缓存实例；未配置目录或缺少 pyarrow 时返回None"""
+    root = os.environ.get("PARSE_CACHE_DIR")
+    if not root or not parquet_available():
+        return None
+    max_bytes = int(os.environ.get("PARSE_CACHE_MAX_BYTES") or DEFAULT_MAX_BYTES)
+    return ParseCache(root, max_bytes)
+
+
+def cached_parse(reader: Callable[[ExcelSource], pd.DataFrame],
+                 source: ExcelSource,
+                 kind: str,
+                 config: Any = None) -> pd.DataFrame:
+    """
+    带缓存地解析单个文件
+
+    Args:
+        reader: 实际的解析函数（含标准化步骤）
+        source: 文件路径或二进制文件对象
+        kind: 解析方式标识（如 order / settlement），同一文件不同解析方式分开缓存
+        config: 影响解析结果的读取配置（加载的列、地区配置中的解析选项等），与读取引擎一起计入缓存键
+
+    Returns:
+        解析后的DataFrame
+    """
+    cache = get_parse_cache()
+    if cache is None:
+        return reader(source)
+
+    fingerprint = config_fingerprint({"engine": resolve_read_engine(), "config": config})
+    key = f"{kind}-v{PARSE_CACHE_VERSION}-{fingerprint}-{file_sha256(source)}"
+    df = cache.get(key)
+    if df is not None:
+        print(f"⚡ 解析缓存命中: {source_name(source)}")
+        return df
+
+    df = reader(source)
+    cache.put(key, df)
+    return df
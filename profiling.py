@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+profiling.py
+------------------------------------------------
+分析流程的阶段级性能统计
+- StageProfiler：按阶段记录耗时、输入/输出行数、阶段内RSS峰值，两个分析模块共用
+- MetricsRegistry：累计各阶段的计数器和耗时直方图，输出 Prometheus 文本格式（/metrics）
+- call_profiler：可选的单次请求 cProfile / pyinstrument 剖析，结果写入文件
+
+RSS为整个进程的内存占用，并发执行多个任务时阶段峰值会包含其他任务的内存。
+"""
+
+import cProfile
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# 阶段内RSS采样间隔（秒）
+RSS_SAMPLE_INTERVAL = 0.05
+
+# 阶段耗时直方图的桶上限（秒）
+STAGE_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def current_rss_mb() -> float:
+    """当前进程的常驻内存（MB）；无 /proc 的系统退回到进程峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """进程启动以来的RSS峰值（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下 ru_maxrss 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if os.uname().sysname == "Darwin" else peak / 1024
+
+
+class _RssSampler:
+    """后台线程周期性采样RSS，记录阶段内的峰值"""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return max(self.peak, current_rss_mb())
+
+
+class StageProfiler:
+    """
+    记录一次分析的各阶段统计
+
+    用法:
+        with profiler.stage("SKU聚合", rows_in=len(order)) as stage:
+            sku = ...
+            stage["rows_out"] = len(sku)
+    """
+
+    def __init__(self, analysis_type: str = ""):
+        self.analysis_type = analysis_type
+        self.stages: List[dict] = []
+        self.started_at = time.time()
+        self.seconds: Optional[float] = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[dict]:
+        """计时一个阶段；阶段内可设置 rows_in / rows_out"""
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+        sampler = _RssSampler()
+        rss_start = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            record["peak_rss_mb"] = round(sampler.stop(), 1)
+            record["rss_delta_mb"] = round(current_rss_mb() - rss_start, 1)
+            with self.lock:
+                self.stages.append(record)
+
+    def finish(self) -> None:
+        """标记整个分析结束"""
+        self.seconds = round(time.time() - self.started_at, 4)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            stages = [dict(s) for s in self.stages]
+        return {
+            "analysis_type": self.analysis_type,
+            "seconds": self.seconds,
+            "peak_rss_mb": max((s["peak_rss_mb"] for s in stages), default=None),
+            "stages": stages,
+        }
+
+    def summary(self) -> str:
+        """各阶段统计的文本表格，用于控制台日志"""
+        lines = [f"{'阶段':<12} {'耗时(秒)':>9} {'输入行':>9} {'输出行':>9} {'峰值RSS(MB)':>12}"]
+        with self.lock:
+            for s in self.stages:
+                rows_in = "" if s["rows_in"] is None else s["rows_in"]
+                rows_out = "" if s["rows_out"] is None else s["rows_out"]
+                lines.append(f"{s['stage']:<12} {s['seconds']:>9.3f} {rows_in:>9} {rows_out:>9} "
+                             f"{s['peak_rss_mb']:>12.1f}")
+        return "\n".join(lines)
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels) + "}"
+
+
+class MetricsRegistry:
+    """进程内的分析指标，按 Prometheus 文本格式输出（不依赖 prometheus_client）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = STAGE_SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # 名称 -> {标签元组: 值}
+        self.counters: Dict[str, Dict[tuple, float]] = {}
+        # 名称 -> {标签元组: [各桶计数..., 总和, 总数]}
+        self.histograms: Dict[str, Dict[tuple, list]] = {}
+        self.gauges: Dict[str, Dict[tuple, float]] = {}
+        self.help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help)
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, help: str = "", **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help)
+            self.gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, help: str = "", **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.help.setdefault(name, help)
+            series = self.histograms.setdefault(name, {})
+            state = series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def record_profile(self, profile: StageProfiler, status: str = "success") -> None:
+        """把一次分析的阶段统计累计到指标中"""
+        analysis_type = profile.analysis_type or "unknown"
+        self.inc("analysis_runs_total", help="分析执行次数", analysis_type=analysis_type, status=status)
+        if profile.seconds is not None:
+            self.observe("analysis_duration_seconds", profile.seconds, help="单次分析总耗时（秒）",
+                         analysis_type=analysis_type)
+        for s in profile.to_dict()["stages"]:
+            labels = {"analysis_type": analysis_type, "stage": s["stage"]}
+            self.observe("analysis_stage_duration_seconds", s["seconds"], help="分析阶段耗时（秒）", **labels)
+            if s["rows_in"] is not None:
+                self.inc("analysis_stage_rows_in_total", s["rows_in"], help="分析阶段输入行数", **labels)
+            if s["rows_out"] is not None:
+                self.inc("analysis_stage_rows_out_total", s["rows_out"], help="分析阶段输出行数", **labels)
+            self.set_gauge("analysis_stage_peak_rss_megabytes", s["peak_rss_mb"],
+                           help="最近一次执行该阶段时的进程RSS峰值（MB）", **labels)
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        out = []
+        with self.lock:
+            for name, series in self.counters.items():
+                out += [f"# HELP {name} {self.help[name]}", f"# TYPE {name} counter"]
+                out += [f"{name}{_format_labels(k)} {v}" for k, v in series.items()]
+            for name, series in self.gauges.items():
+                out += [f"# HELP {name} {self.help[name]}", f"# TYPE {name} gauge"]
+                out += [f"{name}{_format_labels(k)} {v}" for k, v in series.items()]
+            for name, series in self.histograms.items():
+                out += [f"# HELP {name} {self.help[name]}", f"# TYPE {name} histogram"]
+                for key, state in series.items():
+                    for bound, count in zip(self.buckets, state):
+                        out.append(f"{name}_bucket{_format_labels(key + (('le', str(bound)),))} {count}")
+                    out.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {state[-1]}")
+                    out.append(f"{name}_sum{_format_labels(key)} {state[-2]}")
+                    out.append(f"{name}_count{_format_labels(key)} {state[-1]}")
+            out += ["# HELP process_resident_memory_megabytes 进程当前RSS（MB）",
+                    "# TYPE process_resident_memory_megabytes gauge",
+                    f"process_resident_memory_megabytes {current_rss_mb():.1f}"]
+        return "\n".join(out) + "\n"
+
+
+@contextmanager
+def call_profiler(output_path: Optional[Union[str, Path]]) -> Iterator[Optional[Path]]:
+    """
+    对代码块做函数级剖析（仅统计当前线程）
+
+    Args:
+        output_path: 结果文件路径（不含扩展名）；为None时不剖析。安装了 pyinstrument 时
+                     输出 .html 火焰图，否则输出 cProfile 的 .prof（可用 snakeviz / pstats 查看）
+
+    Yields:
+        实际写出的结果文件路径（代码块结束后才存在）
+    """
+    if output_path is None:
+        yield None
+        return
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if pyinstrument is not None:
+        target = output_path.with_suffix(".html")
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        try:
+            yield target
+        finally:
+            profiler.stop()
+            target.write_text(profiler.output_html(), encoding="utf-8")
+    else:
+        target = output_path.with_suffix(".prof")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield target
+        finally:
+            profiler.disable()
+            profiler.dump_stats(str(target))
+    print(f"🔬 剖析结果已保存: {target}")
@@ -0,0 +1,1304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+region_engine.py
+------------------------------------------------
+统一的财务分析引擎（各地区共用，按 regions 中的地区配置执行）
+读取 → 结算合并 → 出库/状态标记 → 操作费 → SKU聚合 → 合并产品成本 → 利润 → 导出
+
+- 订单表、结算表按配置识别列；多个文件用进程池并行解析，解析结果按文件缓存
+- 结算金额按订单号建索引查找（settlement_index），多行结算按策略处理，不复制订单表
+- 组合SKU先对去重后的SKU做一次正则提取，再整列映射回订单行
+- 出库/状态标记只在去重后的取值上做字符串处理；操作费按规则向量化计算
+- SKU指标一次groupby得到全部计数和金额；也可写入本地分析数据库由SQL计算
+- 支持低内存模式和增量模式（只计算新增或变化的订单）
+
+订单行上的计算列统一使用下划线开头的引擎列名（LINE_COLUMNS），SKU指标使用引擎指标名，
+输出时按地区配置转换为各地区的列名和工作表。
+"""
+
+from contextlib import nullcontext
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from fee_rules import order_fee_table, sku_line_fees
+from order_state import OrderStateStore, order_fingerprints, settlement_row_keys
+from parse_cache import cached_parse, parquet_available
+from profiling import StageProfiler
+from regions import get_profile
+from scenarios import ScenarioBase
+from settlement_index import SettlementIndex, normalize_order_ids
+from table_io import (ExcelSource, OutputTarget, TableSource, UseCols, read_excel, read_files, read_header,
+                      source_name, target_name, write_result)
+
+Profile = Union[str, dict]
+
+# 订单表关键列（按此顺序识别，每一列只归入第一个匹配的角色）
+ORDER_ROLES = ("qty", "sku", "shipped", "status")
+ROLE_LABELS = {"qty": "数量列", "sku": "SKU列", "shipped": "出库列", "status": "状态列"}
+
+# 结算金额列的统一列名
+SETTLEMENT_AMOUNT = "Total settlement amount"
+
+# 订单行计算列：引擎列 -> 订单表中的列名
+LINE_COLUMNS = {
+    "settlement": "_settlement",            # 订单结算金额
+    "shipped_label": "_shipped",            # 出库标记（去空白、小写）
+    "status_label": "_status",              # 平台状态（去空白、小写）
+    "settlement_line": "_settlement_line",  # 分摊到订单行的结算金额
+    "order_fee": "_order_fee",              # 订单行操作费（分摊前，人民币）
+    "fee_line": "_fee_line",                # 分摊到订单行的操作费（人民币）
+}
+
+# SKU指标中的计数列
+COUNT_COLUMNS = ["orders", "shipped_orders", "signed_orders", "cancelled_orders",
+                 "cancel_before_ship", "cancel_after_ship", "in_transit_orders"]
+
+# 运营率 -> 分子计数列（分母为订单数）
+RATE_COLUMNS = {
+    "signed_rate": "signed_orders",
+    "cancel_rate": "cancelled_orders",
+    "cancel_before_ship_rate": "cancel_before_ship",
+    "cancel_after_ship_rate": "cancel_after_ship",
+    "in_transit_rate": "in_transit_orders",
+}
+
+
+# 各类文件解析用到的地区配置项（计入解析缓存的键，修改后对应的缓存自动失效）
+READ_CONFIG_KEYS = {
+    "order": ["order_read", "order_id_column"],
+    # 低内存模式按关键列识别规则只加载部分列
+    "order_lean": ["order_read", "order_id_column", "order_columns", "column_match"],
+    "settlement": ["settlement_read", "settlement_id_column", "settlement_amount_keyword"],
+    "settlement_lean": ["settlement_read", "settlement_id_column", "settlement_amount_keyword"],
+    "consumption": ["consumption_read"],
+}
+
+
+def resolve_profile(profile: Profile) -> dict:
+    """地区名称或配置字典 -> 配置字典"""
+    return get_profile(profile) if isinstance(profile, str) else profile
+
+
+def order_id_column(profile: dict) -> str:
+    """订单表订单号列名（未配置时第一列统一命名为 order_id）"""
+    return profile["order_id_column"] or "order_id"
+
+
+def settlement_id_column(profile: dict) -> str:
+    """结算表订单号列名（未配置时第一列统一命名为 order_id）"""
+    return profile["settlement_id_column"] or "order_id"
+
+
+# -------- 列识别 --------
+def match_column(column, name: str, mode: str) -> bool:
+    """列名匹配：exact 为去除首尾空白后完全相同，contains 为包含关键字（不区分大小写）"""
+    if mode == "exact":
+        return str(column).strip() == name
+    return name.lower() in str(column).lower()
+
+
+def first_present(columns, candidates: Sequence[str]) -> Optional[str]:
+    """候选列名中第一个存在的列（去除首尾空白后比较）"""
+    stripped = {str(c).strip(): c for c in reversed(list(columns))}
+    for name in candidates:
+        if name in stripped:
+            return stripped[name]
+    return None
+
+
+def resolve_order_columns(profile: dict, columns) -> List[Optional[str]]:
+    """
+    按配置识别订单表关键列
+
+    Returns:
+        [数量列, SKU列, 出库列, 状态列]，未找到的为None
+    """
+    names = profile["order_columns"]
+    found = dict.fromkeys(ORDER_ROLES)
+    for col in columns:
+        for role in ORDER_ROLES:
+            if found[role] is None and match_column(col, names[role], profile["column_match"]):
+                found[role] = col
+                break
+    return [found[role] for role in ORDER_ROLES]
+
+
+def require_order_columns(profile: dict, columns) -> List[str]:
+    """识别订单表关键列，缺少任一列时报错"""
+    resolved = resolve_order_columns(profile, columns)
+    missing = [f"{ROLE_LABELS[role]}「{profile['order_columns'][role]}」"
+               for role, col in zip(ORDER_ROLES, resolved) if col is None]
+    if missing:
+        raise ValueError(f"订单表中缺少必要列: {', '.join(missing)}")
+    return resolved
+
+
+# -------- 文件解析 --------
+def _read_dtype(options: dict):
+    return str if options.get("dtype") == "str" else None
+
+
+def _strip_headers(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def _parse_order_file(profile: dict, file_path: ExcelSource, usecols: UseCols = None) -> pd.DataFrame:
+    """解析单个订单表文件：标准化订单号列（未配置订单号列名时第一列命名为 order_id）"""
+    options = profile["order_read"]
+    df = read_excel(file_path, dtype=_read_dtype(options), usecols=usecols, skiprows=options["skiprows"])
+    return normalize_order_frame(profile, df)
+
+
+def normalize_order_frame(profile: dict, df: pd.DataFrame) -> pd.DataFrame:
+    """订单表（整个文件或分块读取的一块）标准化：表头去空白、订单号列统一命名、去掉订单号缺失的行"""
+    options = profile["order_read"]
+    if options["strip_headers"]:
+        df = _strip_headers(df)
+    id_col = profile["order_id_column"]
+    if id_col is None:
+        return df.rename(columns={df.columns[0]: "order_id"})
+    if options["drop_missing_id"]:
+        df = df.dropna(subset=[id_col])
+    df[id_col] = df[id_col].astype(str)
+    return df
+
+
+def _settlement_usecols(profile: dict) -> UseCols:
+    wanted = profile["settlement_read"]["usecols"]
+    if not wanted:
+        return None
+    return partial(_column_in, frozenset(wanted))
+
+
+def _column_in(names: frozenset, col) -> bool:
+    return str(col).strip() in names
+
+
+def _parse_settlement_file(profile: dict, file_path: ExcelSource, usecols: UseCols = None) -> pd.DataFrame:
+    """解析单个结算表文件：按配置过滤记录类型，标准化订单号列和结算金额列名"""
+    options = profile["settlement_read"]
+    df = read_excel(file_path, dtype=_read_dtype(options), usecols=usecols or _settlement_usecols(profile))
+    if options["strip_headers"]:
+        df = _strip_headers(df)
+
+    type_col = options["type_column"]
+    if type_col and type_col in df.columns:
+        df = df[df[type_col].astype(str).str.lower() == options["type_value"]]
+
+    id_col = profile["settlement_id_column"]
+    if id_col is None:
+        df = df.rename(columns={df.columns[0]: "order_id"})
+    else:
+        df[id_col] = df[id_col].astype(str)
+
+    # 结算金额列统一命名
+    keyword = profile["settlement_amount_keyword"].lower()
+    amount_col = next((c for c in df.columns if keyword in str(c).lower()), None)
+    if amount_col and amount_col != SETTLEMENT_AMOUNT:
+        df = df.rename(columns={amount_col: SETTLEMENT_AMOUNT})
+    return df
+
+
+def _id_and_rest(profile_id: Optional[str], header: List[str]) -> Tuple[List[str], List[str]]:
+    """表头拆分为 (订单号列, 其余列)：未配置订单号列名时为第一列"""
+    if profile_id is None:
+        return header[:1], header[1:]
+    return [c for c in header if c.strip() == profile_id][:1], header
+
+
+def _order_key_columns(profile: dict, header: List[str]) -> Tuple[List[str], List[Optional[str]]]:
+    """订单表表头中的 (订单号列, [数量列, SKU列, 出库列, 状态列])"""
+    id_cols, rest = _id_and_rest(profile["order_id_column"], header)
+    return id_cols, resolve_order_columns(profile, rest)
+
+
+def _settlement_key_columns(profile: dict, header: List[str]) -> Tuple[List[str], List[str], List[str]]:
+    """结算表表头中的 (订单号列, 结算金额列, 记录类型列)，未找到的为空列表"""
+    id_cols, rest = _id_and_rest(profile["settlement_id_column"], header)
+    keyword = profile["settlement_amount_keyword"].lower()
+    type_col = profile["settlement_read"]["type_column"]
+    type_cols = [c for c in header if type_col and c.strip() == type_col][:1]
+    return id_cols, [c for c in rest if keyword in c.lower()][:1], type_cols
+
+
+def _lean_order_usecols(profile: dict, file_path: ExcelSource) -> List[str]:
+    """低内存模式下订单表只加载的列：订单号 + 识别到的关键列"""
+    id_cols, resolved = _order_key_columns(profile, read_header(file_path))
+    return id_cols + [c for c in resolved if c]
+
+
+def _lean_settlement_usecols(profile: dict, file_path: ExcelSource) -> List[str]:
+    """低内存模式下结算表只加载的列：订单号 + 结算金额列（+ 记录类型列）"""
+    id_cols, amount_cols, type_cols = _settlement_key_columns(profile, read_header(file_path))
+    return id_cols + amount_cols + type_cols
+
+
+def _parse_order_file_lean(profile: dict, file_path: ExcelSource) -> pd.DataFrame:
+    return _parse_order_file(profile, file_path, _lean_order_usecols(profile, file_path))
+
+
+def _parse_settlement_file_lean(profile: dict, file_path: ExcelSource) -> pd.DataFrame:
+    return _parse_settlement_file(profile, file_path, _lean_settlement_usecols(profile, file_path))
+
+
+def _parse_consumption_file(profile: dict, file_path: ExcelSource) -> pd.DataFrame:
+    options = profile["consumption_read"]
+    cons = read_excel(file_path, dtype=_read_dtype(options))
+    if options["strip_headers"]:
+        cons = _strip_headers(cons)
+    return cons
+
+
+def read_config(profile: dict, kind: str, usecols: UseCols = None) -> dict:
+    """解析缓存键使用的读取配置：该类文件用到的地区配置项 + 加载的列（列名列表与顺序无关）"""
+    config = {key: profile[key] for key in READ_CONFIG_KEYS[kind]}
+    config["usecols"] = sorted(map(str, usecols)) if isinstance(usecols, (list, tuple)) else usecols
+    return config
+
+
+def read_order_file(profile: dict, file_path: ExcelSource, usecols: UseCols = None,
+                    low_memory: bool = False, lean_usecols: UseCols = None) -> pd.DataFrame:
+    """
+    读取单个订单表文件（读取全部列或低内存模式时使用解析缓存）
+
+    lean_usecols 为表头校验已识别的关键列（sniff_input_headers），低内存模式下直接按此加载，不再重新读取表头
+    """
+    prefix = profile["cache_prefix"]
+    if usecols is not None:
+        return _parse_order_file(profile, file_path, usecols)
+    if low_memory:
+        reader = (partial(_parse_order_file, profile, usecols=lean_usecols) if lean_usecols is not None
+                  else partial(_parse_order_file_lean, profile))
+        return cached_parse(reader, file_path, kind=f"{prefix}order_lean",
+                            config=read_config(profile, "order_lean", lean_usecols))
+    return cached_parse(partial(_parse_order_file, profile), file_path, kind=f"{prefix}order",
+                        config=read_config(profile, "order"))
+
+
+def read_settlement_file(profile: dict, file_path: ExcelSource, usecols: UseCols = None,
+                         low_memory: bool = False, lean_usecols: UseCols = None) -> pd.DataFrame:
+    """
+    读取单个结算表文件（读取全部列或只读取关键列时使用解析缓存）
+
+    lean_usecols 为表头校验已识别的关键列（sniff_input_headers），只读取关键列时直接按此加载
+    """
+    prefix = profile["cache_prefix"]
+    if usecols is not None:
+        return _parse_settlement_file(profile, file_path, usecols)
+    if low_memory:
+        reader = (partial(_parse_settlement_file, profile, usecols=lean_usecols) if lean_usecols is not None
+                  else partial(_parse_settlement_file_lean, profile))
+        return cached_parse(reader, file_path, kind=f"{prefix}settlement_lean",
+                            config=read_config(profile, "settlement_lean", lean_usecols))
+    return cached_parse(partial(_parse_settlement_file, profile), file_path, kind=f"{prefix}settlement",
+                        config=read_config(profile, "settlement"))
+
+
+def read_consumption_file(profile: Profile, file_path: TableSource) -> pd.DataFrame:
+    """读取产品消耗表（使用解析缓存）；传入已解析的表时复制一份，避免修改调用方的数据"""
+    profile = resolve_profile(profile)
+    if isinstance(file_path, pd.DataFrame):
+        return file_path.copy()
+    return cached_parse(partial(_parse_consumption_file, profile), file_path,
+                        kind=f"{profile['cache_prefix']}consumption", config=read_config(profile, "consumption"))
+
+
+def merge_order_files(profile: dict, order_files: List[ExcelSource], usecols: UseCols = None,
+                      workers: Optional[int] = None, low_memory: bool = False,
+                      lean_usecols: UseCols = None) -> pd.DataFrame:
+    """
+    合并多个订单表文件（usecols 可限定只加载部分列，workers 为并行解析进程数，
+    low_memory 为True时只加载订单号和关键列，lean_usecols 为表头校验识别的关键列）
+    """
+    all_orders = read_files(partial(read_order_file, profile, usecols=usecols, low_memory=low_memory,
+                                    lean_usecols=lean_usecols),
+                            order_files, workers=workers, label=f"{profile['label']}订单文件")
+    if not all_orders:
+        raise ValueError("没有成功读取任何订单文件")
+
+    # 合并所有订单数据（按上传顺序）
+    merged_orders = pd.concat(all_orders, ignore_index=True)
+    print(f"📋 订单数据合并完成: 总计 {len(merged_orders)} 行")
+    return merged_orders
+
+
+def merge_settlement_files(profile: dict, settlement_files: List[ExcelSource], usecols: UseCols = None,
+                           workers: Optional[int] = None, low_memory: bool = False,
+                           lean_usecols: UseCols = None) -> pd.DataFrame:
+    """
+    合并多个结算表文件（usecols 可限定只加载部分列，workers 为并行解析进程数，
+    low_memory 为True时只加载订单号和结算金额列，lean_usecols 为表头校验识别的关键列）
+    """
+    all_settlements = read_files(partial(read_settlement_file, profile, usecols=usecols, low_memory=low_memory,
+                                         lean_usecols=lean_usecols),
+                                 settlement_files, workers=workers, label=f"{profile['label']}结算文件")
+    if not all_settlements:
+        raise ValueError("没有成功读取任何结算文件")
+
+    # 合并所有结算数据（按上传顺序）
+    merged_settlements = pd.concat(all_settlements, ignore_index=True)
+    print(f"💳 结算数据合并完成: 总计 {len(merged_settlements)} 行")
+    return merged_settlements
+
+
+# -------- 表头校验 --------
+class HeaderValidationError(ValueError):
+    """输入文件表头校验未通过，problems 为每个有问题文件的说明"""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__(f"{len(problems)} 个文件表头校验未通过（未解析任何文件）- " + "; ".join(problems))
+
+
+def sniff_input_headers(profile: dict, order_files: List[ExcelSource],
+                        settlement_files: List[ExcelSource]) -> dict:
+    """
+    解析前只读取每个订单表、结算表的表头行，识别关键列并校验
+    （放错位置或缺列的文件在解析任何文件之前报错，一次列出全部有问题的文件）
+
+    Returns:
+        {"order_columns": [数量列, SKU列, 出库列, 状态列],
+         "order_usecols": 订单表只需加载的列（订单号 + 关键列）,
+         "settlement_usecols": 结算表只需加载的列（订单号 + 结算金额列 + 记录类型列）}
+
+    Raises:
+        HeaderValidationError: 任一文件无法读取表头、缺少关键列，或订单表关键列与第一个订单文件不一致
+    """
+    problems = []
+    strip = profile["order_read"]["strip_headers"]
+    order_columns = None
+    order_names, settlement_names = set(), set()
+
+    for file_path in order_files:
+        name = source_name(file_path)
+        try:
+            id_cols, resolved = _order_key_columns(profile, read_header(file_path))
+        except Exception as e:
+            problems.append(f"订单文件 {name}: 无法读取表头（{e}）")
+            continue
+        missing = [f"{ROLE_LABELS[role]}「{profile['order_columns'][role]}」"
+                   for role, col in zip(ORDER_ROLES, resolved) if col is None]
+        if not id_cols:
+            missing.insert(0, f"订单号列「{order_id_column(profile)}」")
+        if missing:
+            problems.append(f"订单文件 {name}: 缺少 {', '.join(missing)}")
+            continue
+        # 合并后各文件的关键列必须同名，否则合并出的关键列会有空值
+        key = [c.strip() for c in resolved] if strip else resolved
+        if order_columns is None:
+            order_columns = key
+        elif key != order_columns:
+            problems.append(f"订单文件 {name}: 关键列 {key} 与第一个订单文件 {order_columns} 不一致")
+            continue
+        order_names.update(id_cols + resolved)
+
+    for file_path in settlement_files:
+        name = source_name(file_path)
+        try:
+            id_cols, amount_cols, type_cols = _settlement_key_columns(profile, read_header(file_path))
+        except Exception as e:
+            problems.append(f"结算文件 {name}: 无法读取表头（{e}）")
+            continue
+        missing = []
+        if not id_cols:
+            missing.append(f"订单号列「{settlement_id_column(profile)}」")
+        if not amount_cols:
+            missing.append(f"结算金额列（列名包含 {profile['settlement_amount_keyword']}）")
+        if missing:
+            problems.append(f"结算文件 {name}: 缺少 {', '.join(missing)}")
+            continue
+        settlement_names.update(id_cols + amount_cols + type_cols)
+
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        raise HeaderValidationError(problems)
+
+    print(f"✅ 表头校验通过: {len(order_files)} 个订单文件, {len(settlement_files)} 个结算文件")
+    return {
+        "order_columns": order_columns,
+        "order_usecols": partial(_column_in, frozenset(c.strip() for c in order_names)),
+        "settlement_usecols": partial(_column_in, frozenset(c.strip() for c in settlement_names)),
+    }
+
+
+def settlement_needs_all_columns(profile: dict, policy: str, incremental: bool = False) -> bool:
+    """结算表是否需要加载全部列：输出被排除的多行结算明细，或增量模式（按整行内容识别已处理的结算行）"""
+    has_duplicates_sheet = any(spec["kind"] == "duplicates" for spec in profile["sheets"])
+    return incremental or (policy == "exclude" and has_duplicates_sheet)
+
+
+# -------- 组合SKU --------
+def build_combo_sku_table(skus: pd.Series, patterns: Sequence[Tuple[str, str]]) -> pd.DataFrame:
+    """
+    针对去重后的SKU取值构建组合SKU查找表
+
+    Args:
+        skus: SKU列
+        patterns: [(正则, 基础SKU后缀)]，正则的两个分组为基础SKU和倍数，按顺序匹配，命中第一个即停止
+
+    Returns:
+        以原始SKU为索引的DataFrame，包含 base_sku / multiplier 两列，
+        只保留倍数大于1（需要转换）的SKU
+    """
+    uniques = pd.Series(skus.dropna().unique(), dtype=object)
+    stripped = uniques.astype(str).str.strip()
+
+    base_sku = pd.Series(None, index=uniques.index, dtype=object)
+    multiplier = pd.Series(0, index=uniques.index, dtype=object)
+    matched = pd.Series(False, index=uniques.index)
+
+    for pattern, suffix in patterns:
+        parts = stripped[~matched].str.extract(pattern)
+        hit = parts.index[parts[0].notna()]
+        base_sku[hit] = parts.loc[hit, 0] + suffix
+        multiplier[hit] = parts.loc[hit, 1].map(int)
+        matched[hit] = True
+
+    convert = (multiplier > 1).to_numpy(dtype=bool)
+    return pd.DataFrame(
+        {"base_sku": base_sku[convert].to_numpy(), "multiplier": multiplier[convert].to_numpy()},
+        index=pd.Index(uniques[convert].to_numpy(), dtype=object),
+    )
+
+
+def preprocess_combo_sku(df: pd.DataFrame, sku_col: str, qty_col: str,
+                         patterns: Sequence[Tuple[str, str]],
+                         return_summary: bool = False, copy: bool = True, verbose: bool = True):
+    """
+    预处理组合SKU，将组合SKU转换为基础SKU并调整数量
+
+    先对去重后的SKU做一次正则提取得到查找表，再整列映射回订单行，
+    避免逐行匹配和逐单元格写入。分类类型的SKU列只改写类别，不展开成字符串。
+
+    Args:
+        df: 包含订单数据的DataFrame
+        sku_col: SKU列名
+        qty_col: 数量列名
+        patterns: 组合SKU模式，见 build_combo_sku_table
+        return_summary: 为True时同时返回转换统计
+        copy: 为False时直接在传入的DataFrame上修改，避免复制整张订单表
+        verbose: 是否打印转换日志（分块计算时每块都会调用，不打印）
+
+    Returns:
+        处理后的DataFrame；return_summary为True时返回 (DataFrame, 统计字典)，
+        统计字典包含 rows（转换行数）和 skus（涉及的组合SKU种类数）
+    """
+    if copy:
+        df = df.copy()
+    table = build_combo_sku_table(df[sku_col], patterns)
+    skus = df[sku_col]
+
+    if isinstance(skus.dtype, pd.CategoricalDtype):
+        categories = pd.Series(skus.cat.categories)
+        codes = skus.cat.codes.to_numpy()
+        in_table = categories.isin(table.index).to_numpy()
+        hit = np.append(in_table, False)[codes]
+    else:
+        hit = skus.isin(table.index).to_numpy(dtype=bool)
+    summary = {"rows": int(hit.sum()), "skus": 0}
+
+    if summary["rows"] > 0:
+        combo_skus = skus[hit]
+        summary["skus"] = int(combo_skus.nunique())
+        multiplier = combo_skus.map(table["multiplier"]).astype(int)
+        df.loc[hit, qty_col] = df.loc[hit, qty_col] * multiplier
+        if isinstance(skus.dtype, pd.CategoricalDtype):
+            # 组合SKU类别替换为基础SKU后重新去重排序，按新类别重映射编码
+            renamed = categories.where(~in_table, categories.map(table["base_sku"]))
+            new_categories, inverse = np.unique(renamed.to_numpy(dtype=object), return_inverse=True)
+            new_codes = np.where(codes >= 0, inverse[codes], -1)
+            df[sku_col] = pd.Categorical.from_codes(new_codes, categories=new_categories)
+        else:
+            df.loc[hit, sku_col] = combo_skus.map(table["base_sku"])
+        if verbose:
+            print(f"✅ 完成组合SKU预处理: 转换了 {summary['rows']} 行（{summary['skus']} 种组合SKU）")
+    elif verbose:
+        print("ℹ️  未发现需要处理的组合SKU")
+
+    if return_summary:
+        return df, summary
+    return df
+
+
+# -------- 标记与操作费 --------
+def normalize_labels(values: pd.Series, categorical: bool = False) -> pd.Series:
+    """
+    去除首尾空格并转小写
+
+    categorical 为True时结果以分类类型存储，字符串处理只在去重后的类别上做一次
+    """
+    if not categorical:
+        return values.str.strip().str.lower()
+    cat = values.astype("category")
+    labels = pd.Series(cat.cat.categories).astype(str).str.strip().str.lower()
+    new_categories, inverse = np.unique(labels.to_numpy(dtype=object), return_inverse=True)
+    codes = cat.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, inverse[codes] if len(inverse) else codes, -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=new_categories), index=values.index)
+
+
+def shipped_labels(profile: dict, values: pd.Series, categorical: bool = False) -> pd.Series:
+    """
+    出库标记：label 规则为出库列取值（去空白、小写）；time 规则按出库时间是否为空
+    转换为配置中的已出库 / 未出库标记
+    """
+    if profile["shipped_rule"] == "time":
+        shipped = values.notna() & (values.astype(str).str.strip() != "")
+        labels = pd.Series(np.where(shipped, profile["shipped_labels"][0], profile["not_shipped_labels"][0]),
+                           index=values.index)
+        return labels.astype("category") if categorical else labels
+    return normalize_labels(values, categorical)
+
+
+def category_mask(values: pd.Series, targets: List[str]) -> np.ndarray:
+    """按分类编码判断取值是否属于 targets：字符串比较只在去重后的类别上做一次"""
+    return label_masks(values, {"hit": targets})["hit"]
+
+
+def label_masks(values: pd.Series, groups: Dict[str, List[str]]) -> Dict[str, np.ndarray]:
+    """一次分类编码得到多组取值的布尔掩码：{名称: 取值是否属于该组}"""
+    cat = values.astype("category")
+    codes = cat.cat.codes.to_numpy()
+    # 编码 -1（缺失值）映射到末尾的False
+    return {name: np.append(cat.cat.categories.isin(targets), False)[codes] for name, targets in groups.items()}
+
+
+def line_flags(profile: dict, order: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """订单行的出库 / 未出库 / 签收 / 取消 / 在途标记（布尔数组）"""
+    flags = label_masks(order[LINE_COLUMNS["shipped_label"]], {
+        "shipped": profile["shipped_labels"],
+        "not_shipped": profile["not_shipped_labels"],
+    })
+    flags.update(label_masks(order[LINE_COLUMNS["status_label"]], {
+        "signed": profile["signed_statuses"],
+        "cancelled": profile["cancelled_statuses"],
+        "in_transit": profile["in_transit_statuses"],
+    }))
+    return flags
+
+
+def optimize_order_dtypes(order: pd.DataFrame, id_col: str, categorical_cols: List[str]) -> pd.DataFrame:
+    """
+    低内存模式下压缩订单表列类型（原地修改）
+
+    - 订单号: pyarrow字符串（未安装pyarrow时保持原类型）
+    - SKU / 出库 / 状态等低基数字符串列: 分类类型
+    """
+    if parquet_available():
+        order[id_col] = order[id_col].astype("string[pyarrow]")
+    for col in categorical_cols:
+        order[col] = order[col].astype("category")
+    return order
+
+
+def order_line_counts(order_ids: pd.Series) -> np.ndarray:
+    """每行所属订单的行数（订单号缺失的行为NaN）"""
+    codes, uniques = pd.factorize(order_ids)
+    valid = codes >= 0
+    counts = np.bincount(codes[valid], minlength=len(uniques)).astype(float)
+    lines = np.full(len(codes), np.nan)
+    lines[valid] = counts[codes[valid]]
+    return lines
+
+
+# -------- 结算 --------
+def normalize_settlements(settle: pd.DataFrame, keyword: str = "settlement") -> pd.DataFrame:
+    """统一结算金额列名为 Total settlement amount 并转为数值"""
+    if SETTLEMENT_AMOUNT not in settle.columns:
+        settlement_cols = [c for c in settle.columns if keyword in str(c).lower()]
+        if not settlement_cols:
+            raise ValueError("结算表中找不到结算金额列")
+        settle = settle.rename(columns={settlement_cols[0]: SETTLEMENT_AMOUNT})
+
+    settle[SETTLEMENT_AMOUNT] = pd.to_numeric(settle[SETTLEMENT_AMOUNT], errors="coerce")
+    return settle
+
+
+def index_settlements(profile: dict, settle: pd.DataFrame,
+                      policy: str = "exclude") -> Tuple[SettlementIndex, pd.DataFrame]:
+    """
+    构建结算金额索引（同一订单号出现多行结算时按 policy 处理）
+
+    Returns:
+        (结算金额索引, 被排除的多行结算行；policy 不是 exclude 时为空表)
+    """
+    index = SettlementIndex.from_frame(settle, settlement_id_column(profile), SETTLEMENT_AMOUNT, policy=policy)
+    if policy == "exclude":
+        dup_settle = settle[index.duplicate_mask]
+        print(f"⚠️  排除重复结算订单: {len(dup_settle)} 行")
+    else:
+        dup_settle = settle.iloc[:0]
+        print(f"💳 多行结算订单: {index.duplicate_orders} 个（按 {policy} 处理）")
+    return index, dup_settle
+
+
+def settlement_amounts(profile: dict, settlements: SettlementIndex, order_ids: pd.Series) -> np.ndarray:
+    """订单行的订单结算金额；没有结算的订单按配置为空或填充默认值"""
+    amounts = settlements.lookup(order_ids)
+    if profile["missing_settlement"] is not None:
+        amounts = np.nan_to_num(amounts, nan=profile["missing_settlement"])
+    return amounts
+
+
+def allocate_settlement(profile: dict, amounts: pd.Series, lines) -> pd.Series:
+    """订单结算金额分配到订单行：split 按订单行数平均分摊，order 每行计入全部金额"""
+    if profile["settlement_allocation"] == "split":
+        return amounts / lines
+    return amounts
+
+
+# -------- 订单行计算 --------
+def compute_order_lines(profile: dict,
+                        order: pd.DataFrame,
+                        settlements: SettlementIndex,
+                        fees=None,
+                        low_memory: bool = False,
+                        report: Optional[Callable[[str, int], None]] = None,
+                        profiler: Optional[StageProfiler] = None) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    合并结算金额并计算每行结算金额和操作费
+
+    Args:
+        profile: 地区配置
+        order: 订单行（原始列，订单号列已标准化）
+        settlements: 结算金额索引
+        fees: 操作费规则（分档列表或SKU费用映射），None时使用配置中的规则
+        low_memory: 是否压缩列类型
+        report: 进度回调
+        profiler: 阶段统计
+
+    Returns:
+        (含 LINE_COLUMNS 计算列的订单行, [数量列, SKU列, 出库列, 状态列])
+    """
+    report = report or (lambda stage, percent: None)
+    profiler = profiler or StageProfiler()
+    id_col = order_id_column(profile)
+
+    with profiler.stage("合并结算数据", rows_in=len(order)) as stage:
+        # 识别关键列
+        columns = require_order_columns(profile, order.columns)
+        qty_col, sku_col, ship_col, status_col = columns
+        print(f"📝 识别到关键列: 数量({qty_col}), SKU({sku_col}), 出库({ship_col}), 状态({status_col})")
+
+        # 合并订单和结算数据（按索引查找，不做整表merge）
+        order = order.reset_index(drop=True)
+        order[LINE_COLUMNS["settlement"]] = settlement_amounts(profile, settlements, order[id_col])
+
+        # 数据类型转换（必须在组合SKU预处理之前进行）
+        order[qty_col] = pd.to_numeric(order[qty_col], errors="coerce").fillna(0).astype(int)
+        if low_memory:
+            label_cols = [ship_col] if profile["shipped_rule"] == "label" else []
+            optimize_order_dtypes(order, id_col, [sku_col, *label_cols, status_col])
+        stage["rows_out"] = len(order)
+
+    # -------- 组合SKU预处理 --------
+    if profile["combo_sku_patterns"]:
+        report("组合SKU预处理", 45)
+        print("🔧 开始组合SKU预处理...")
+        with profiler.stage("组合SKU预处理", rows_in=len(order)) as stage:
+            order = preprocess_combo_sku(order, sku_col, qty_col, profile["combo_sku_patterns"], copy=False)
+            if low_memory:
+                order[qty_col] = pd.to_numeric(order[qty_col], downcast="integer")
+            stage["rows_out"] = len(order)
+
+    # 计算每行结算金额和操作费
+    report("计算结算与操作费", 55)
+    with profiler.stage("计算结算与操作费", rows_in=len(order)) as stage:
+        order[LINE_COLUMNS["shipped_label"]] = shipped_labels(profile, order[ship_col], categorical=low_memory)
+        order[LINE_COLUMNS["status_label"]] = normalize_labels(order[status_col], categorical=low_memory)
+        shipped = category_mask(order[LINE_COLUMNS["shipped_label"]], profile["shipped_labels"])
+
+        if profile["fee_rule"] == "order_tiers":
+            # 按订单总件数分档，订单操作费均摊到订单各行
+            fee_table = order_fee_table(order[id_col], order[qty_col], shipped, fees or profile["fee_tiers"])
+            order[LINE_COLUMNS["order_fee"]] = fee_table["order_fee"]
+            order[LINE_COLUMNS["fee_line"]] = fee_table["fee_per_line"]
+            lines = fee_table["lines"]
+        else:
+            # 出库订单行按SKU收取固定费用
+            line_fees = sku_line_fees(order[sku_col], shipped, fees or profile["sku_fees"])
+            order[LINE_COLUMNS["order_fee"]] = line_fees
+            order[LINE_COLUMNS["fee_line"]] = line_fees
+            lines = None
+        if profile["settlement_allocation"] == "split" and lines is None:
+            lines = order_line_counts(order[id_col])
+        order[LINE_COLUMNS["settlement_line"]] = allocate_settlement(profile, order[LINE_COLUMNS["settlement"]],
+                                                                     lines)
+        stage["rows_out"] = len(order)
+
+    return order, columns
+
+
+# -------- SKU聚合与财务指标 --------
+def aggregate_sku_metrics(profile: dict, order: pd.DataFrame, sku_col: str, qty_col: str,
+                          first: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    SKU级别聚合（单次groupby）
+
+    订单数按配置计数：distinct 按 (SKU, 订单) 去重，每个组合只有第一次出现的行计入，
+    其出库/状态标记决定计入哪些计数；lines 每个有订单号的行计为一单。
+    金额和数量按行求和。所有标记列和金额列放在同一张表上，一次groupby得到全部结果。
+
+    Args:
+        profile: 地区配置
+        order: compute_order_lines 得到的订单行
+        sku_col: SKU列名
+        qty_col: 数量列名
+        first: 计入订单数的行（分块计算时由调用方按全部数据去重），None时按本表计算
+
+    Returns:
+        以SKU为索引的聚合结果（引擎指标名），缺失值填0
+    """
+    flags = line_flags(profile, order)
+    id_col = order_id_column(profile)
+
+    # 计入订单数的行，订单号缺失的行不计入
+    if first is None:
+        first = order[id_col].notna().to_numpy()
+        if profile["order_count"] == "distinct":
+            first = first & ~order.duplicated([sku_col, id_col]).to_numpy()
+    settlement = order[LINE_COLUMNS["settlement_line"]]
+    shipped, signed, cancelled = flags["shipped"], flags["signed"], flags["cancelled"]
+
+    metrics = pd.DataFrame({
+        "settlement": settlement,
+        "operation_fee": order[LINE_COLUMNS["fee_line"]],
+        "shipped_qty": np.where(shipped, order[qty_col], 0),
+        "signed_qty": np.where(signed, order[qty_col], 0),
+        "signed_amount": settlement.where(signed),
+        "orders": first,
+        "shipped_orders": first & shipped,
+        "signed_orders": first & signed,
+        "cancelled_orders": first & cancelled,
+        "cancel_before_ship": first & cancelled & flags["not_shipped"],
+        "cancel_after_ship": first & cancelled & shipped,
+        "in_transit_orders": first & flags["in_transit"],
+    }, index=order.index)
+
+    sku = metrics.groupby(order[sku_col], sort=True, observed=True).sum()
+    sku[COUNT_COLUMNS] = sku[COUNT_COLUMNS].astype("int64")
+    sku.index.name = sku_col
+    return sku.fillna(0)
+
+
+def normalize_consumption(profile: dict, cons: pd.DataFrame, sku_col: str) -> pd.DataFrame:
+    """
+    产品消耗表标准化：识别SKU/单件成本/ads/gmvmax列并转为数值，缺少的列按0计算，
+    换算人民币单件成本（配置了美元汇率时同时换算美元消耗）
+
+    Returns:
+        DataFrame[SKU列(与订单表同名), unit_cost, ads, gmvmax, (ads_usd, gmvmax_usd,) unit_cost_rmb]
+    """
+    spec = profile["consumption_columns"]
+    sku_source = first_present(cons.columns, [*spec["sku"], sku_col]) or cons.columns[0]
+    cost = pd.DataFrame({sku_col: cons[sku_source]})
+    for key in ("unit_cost", "ads", "gmvmax"):
+        source = first_present(cons.columns, spec[key])
+        if source is None:
+            print(f"⚠️  产品消耗表缺少列 {' / '.join(spec[key])}，按0计算")
+            cost[key] = 0.0
+        else:
+            cost[key] = pd.to_numeric(cons[source], errors="coerce")
+    return convert_consumption(profile, cost)
+
+
+def convert_consumption(profile: dict, cost: pd.DataFrame) -> pd.DataFrame:
+    """产品成本（本币）换算人民币单件成本，配置了美元汇率时同时换算美元消耗（原地添加列）"""
+    if profile["local_per_usd"]:
+        cost["ads_usd"] = cost["ads"] / profile["local_per_usd"]
+        cost["gmvmax_usd"] = cost["gmvmax"] / profile["local_per_usd"]
+    cost["unit_cost_rmb"] = cost["unit_cost"] / profile["local_per_rmb"]
+    return cost
+
+
+def _ratio(numerator: pd.Series, denominator: pd.Series, zero_value: Optional[float]) -> pd.Series:
+    """分母为0时取 zero_value（None为空）"""
+    ratio = numerator / denominator.where(denominator != 0)
+    return ratio if zero_value is None else ratio.fillna(zero_value)
+
+
+def finalize_sku_metrics(profile: dict, sku: pd.DataFrame, cost: pd.DataFrame, sku_col: str) -> pd.DataFrame:
+    """
+    由SKU聚合结果计算运营率，合并产品成本并计算财务指标（本币）
+
+    Args:
+        profile: 地区配置
+        sku: aggregate_sku_metrics 的结果
+        cost: normalize_consumption 处理后的产品成本
+        sku_col: SKU列名
+
+    Returns:
+        财务指标表（每个SKU一行，SKU为普通列）
+    """
+    # 运营率计算
+    for rate, count in RATE_COLUMNS.items():
+        sku[rate] = sku[count] / sku["orders"]
+
+    # 合并产品成本
+    sku = sku.reset_index().merge(cost, on=sku_col, how="left").fillna(0)
+
+    # -------- 财务指标计算 --------
+    local_per_rmb = profile["local_per_rmb"]
+    sku["fee_local"] = sku["operation_fee"] * local_per_rmb
+    sku["ad_spend"] = sku["ads"] + sku["gmvmax"]
+    sku["product_cost"] = sku["unit_cost"] * sku["shipped_qty"]
+    sku["profit"] = sku["settlement"] - sku["fee_local"] - sku["product_cost"] - sku["ad_spend"]
+    sku["profit_rmb"] = sku["profit"] / local_per_rmb
+    sku["margin"] = _ratio(sku["profit"], sku[profile["margin_base"]], profile["zero_division"])
+    sku["profit_per_order"] = _ratio(sku["profit_rmb"], sku["signed_orders"], profile["zero_division"])
+    return sku
+
+
+def fee_basis(profile: dict, order: pd.DataFrame, sku_col: str, qty_col: str) -> pd.DataFrame:
+    """
+    操作费基数（场景测算按新的费用规则重新计费时使用）
+
+    - order_tiers: 有出库行的订单按总件数收费并均摊到订单各行，
+      基数为 (SKU, 订单总件数) -> 分摊到该SKU的行权重之和（每行 1/订单行数）
+    - sku: 出库行按SKU收费，基数为每个SKU的出库行数
+
+    Returns:
+        DataFrame[sku, (order_qty,) weight]
+    """
+    shipped = category_mask(order[LINE_COLUMNS["shipped_label"]], profile["shipped_labels"])
+    skus = order[sku_col].astype(object)
+    if profile["fee_rule"] != "order_tiers":
+        basis = pd.DataFrame({"sku": skus, "weight": shipped.astype(float)})
+        return basis.groupby("sku", sort=True).sum().reset_index()
+
+    codes, uniques = pd.factorize(order[order_id_column(profile)])
+    valid = codes >= 0
+    lines = np.bincount(codes[valid], minlength=len(uniques)).astype(float)
+    total_qty = np.bincount(codes[valid], weights=order[qty_col].to_numpy(dtype=float)[valid],
+                            minlength=len(uniques))
+    charged = np.bincount(codes[valid], weights=shipped[valid], minlength=len(uniques)) > 0
+    weight = np.zeros(len(codes))
+    order_qty = np.zeros(len(codes))
+    weight[valid] = np.where(charged[codes[valid]], 1 / lines[codes[valid]], 0.0)
+    order_qty[valid] = total_qty[codes[valid]]
+    basis = pd.DataFrame({"sku": skus, "order_qty": order_qty, "weight": weight})[weight > 0]
+    return basis.groupby(["sku", "order_qty"], sort=True).sum().reset_index()
+
+
+# -------- 本地分析数据库 --------
+def store_batch(profile: dict, store_path: Optional[Union[str, Path]], label: str):
+    """本地分析数据库的批次写入器（见 sku_store.open_batch，退出时提交），未配置数据库时为空上下文"""
+    if store_path is None:
+        return nullcontext()
+    from sku_store import open_batch
+
+    return open_batch(store_path, profile, label)
+
+
+def store_sku_metrics(profile: dict, store_path: Union[str, Path], batch_id: int, sku_col: str,
+                      profiler: StageProfiler) -> pd.DataFrame:
+    """
+    由SQL计算已写入批次的SKU聚合，再按 finalize_sku_metrics 计算财务指标
+
+    Returns:
+        财务指标表（引擎指标名），与不使用数据库时的结果相同
+    """
+    from sku_store import SkuStore
+
+    with SkuStore(store_path) as store, profiler.stage("财务指标计算") as stage:
+        sku = store.batch_sku_metrics(batch_id, profile)
+        stage["rows_out"] = len(sku)
+    return sku.rename(columns={"sku": sku_col})
+
+
+# -------- 增量更新 --------
+def _sku_contribution(profile: dict, lines: pd.DataFrame, sku_col: str, qty_col: str) -> pd.DataFrame:
+    """一组订单行对SKU聚合结果的贡献（另记行数，用于判断SKU是否已无订单行）"""
+    sku = aggregate_sku_metrics(profile, lines, sku_col, qty_col)
+    sku["_lines"] = lines.groupby(sku_col, sort=True).size()
+    return sku
+
+
+def apply_incremental_update(profile: dict,
+                             store: OrderStateStore,
+                             order: pd.DataFrame,
+                             settle: pd.DataFrame,
+                             fees=None,
+                             report: Optional[Callable[[str, int], None]] = None,
+                             profiler: Optional[StageProfiler] = None,
+                             settlement_policy: str = "exclude"
+                             ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, List[str], SettlementIndex]:
+    """
+    增量更新：只计算新增或变化的订单，并对SKU聚合结果做增量修正
+
+    - 新上传中出现的订单以本次上传的订单行为准（整单替换），原始订单行指纹未变化的订单跳过
+    - 状态变化（在途 -> 签收/取消）的订单指纹会变化，整单重新计算
+    - 新结算行只追加未出现过的行；结算到达较晚或变为多行结算的订单只重算每行结算金额
+    - SKU聚合结果 = 旧结果 - 受影响订单的旧贡献 + 受影响订单的新贡献
+
+    Args:
+        profile: 地区配置
+        store: 增量状态存储
+        order: 本次上传的订单行（原始列）
+        settle: 本次上传的结算行（已标准化结算金额列）
+        fees: 操作费规则，None时使用配置中的规则
+        report: 进度回调
+        profiler: 阶段统计（变化订单的计算阶段）
+        settlement_policy: 多行结算处理策略，需与状态目录建立时一致
+
+    Returns:
+        (全部订单行, SKU聚合结果, 被排除的多行结算, [数量列, SKU列, 出库列, 状态列], 结算金额索引)
+    """
+    report = report or (lambda stage, percent: None)
+    id_col = order_id_column(profile)
+    settle_id = settlement_id_column(profile)
+
+    with store.locked():
+        meta = store.read_meta()
+        if meta is not None and meta.get("region") != profile["name"]:
+            raise ValueError(f"增量状态属于地区 {meta.get('region')}，与 {profile['name']} 不一致，请使用新的状态目录")
+        old_lines = store.read("lines")
+        old_orders = store.read("orders")
+        old_settle = store.read("settlements")
+        old_sku = store.read("sku")
+
+        missing_id = order[id_col].isna()
+        if missing_id.any():
+            print(f"⚠️  增量模式跳过缺少订单号的订单行: {missing_id.sum()} 行")
+            order = order[~missing_id]
+
+        # -------- 结算：追加未出现过的结算行 --------
+        settle = settle.assign(_row_key=settlement_row_keys(settle))
+        if old_settle is not None:
+            added_settle = settle[~settle["_row_key"].isin(old_settle["_row_key"])]
+            all_settle = pd.concat([old_settle, added_settle], ignore_index=True)
+        else:
+            added_settle = settle
+            all_settle = settle.reset_index(drop=True)
+        if meta is not None and meta.get("settlement_policy", "exclude") != settlement_policy:
+            raise ValueError(f"多行结算策略 {settlement_policy} 与增量状态 {meta.get('settlement_policy', 'exclude')} "
+                             f"不一致，请使用新的状态目录")
+        print(f"💳 新增结算行: {len(added_settle)} 行, 累计 {len(all_settle)} 行")
+        settlements, dup_settle = index_settlements(profile, all_settle, settlement_policy)
+
+        # -------- 订单：比较指纹找出新增/变化的订单 --------
+        fingerprints = order_fingerprints(order, id_col)
+        if old_orders is not None:
+            known = fingerprints.merge(old_orders, on=id_col, how="left", suffixes=("", "_old"))
+            changed_ids = known.loc[known["fingerprint"] != known["fingerprint_old"], id_col]
+            all_orders = pd.concat([old_orders[~old_orders[id_col].isin(changed_ids)],
+                                    fingerprints[fingerprints[id_col].isin(changed_ids)]],
+                                   ignore_index=True)
+        else:
+            changed_ids = fingerprints[id_col]
+            all_orders = fingerprints
+        changed_ids = pd.Index(changed_ids)
+        print(f"🔄 新增或变化的订单: {len(changed_ids)} 个（本次上传 {len(fingerprints)} 个）")
+
+        if len(changed_ids):
+            new_lines, columns = compute_order_lines(profile, order[order[id_col].isin(changed_ids)],
+                                                     settlements, fees, report=report, profiler=profiler)
+            if meta is not None and columns != meta["columns"]:
+                raise ValueError(f"订单表关键列 {columns} 与增量状态 {meta['columns']} 不一致，请使用新的状态目录")
+        elif meta is not None:
+            new_lines, columns = None, meta["columns"]
+        else:
+            raise ValueError("没有可分析的订单")
+        qty_col, sku_col = columns[0], columns[1]
+
+        report("计算结算与操作费", 55)
+        if old_lines is None:
+            old_lines = new_lines.iloc[:0]
+
+        # 结算变化但订单行未变化的订单：只重算每行结算金额（按标准化订单号匹配，与结算金额的查找一致）
+        added_ids = normalize_order_ids(added_settle[settle_id]).dropna().unique()
+        old_ids = pd.Index(old_lines[id_col].dropna().unique())
+        resettled_ids = old_ids[normalize_order_ids(old_ids).isin(added_ids).to_numpy() & ~old_ids.isin(changed_ids)]
+        affected_ids = changed_ids.append(resettled_ids)
+
+        affected_old = old_lines[old_lines[id_col].isin(affected_ids)]
+        kept = old_lines[~old_lines[id_col].isin(changed_ids)].copy()
+        resettled = kept[id_col].isin(resettled_ids)
+        if resettled.any():
+            resettled_orders = kept.loc[resettled, id_col]
+            amounts = pd.Series(settlement_amounts(profile, settlements, resettled_orders),
+                                index=resettled_orders.index)
+            kept.loc[resettled, LINE_COLUMNS["settlement"]] = amounts
+            kept.loc[resettled, LINE_COLUMNS["settlement_line"]] = allocate_settlement(
+                profile, amounts, resettled_orders.map(resettled_orders.value_counts()))
+        print(f"💳 结算变化需重算的订单: {len(resettled_ids)} 个")
+
+        lines = pd.concat([kept, new_lines], ignore_index=True) if new_lines is not None else kept
+        affected_new = lines[lines[id_col].isin(affected_ids)]
+
+        # -------- SKU聚合增量修正 --------
+        report("SKU聚合", 65)
+        sku = old_sku.set_index(sku_col) if old_sku is not None else None
+        for part, sign in ((affected_old, -1), (affected_new, 1)):
+            if len(part):
+                delta = _sku_contribution(profile, part, sku_col, qty_col) * sign
+                sku = delta if sku is None else sku.add(delta, fill_value=0)
+        if sku is None:
+            raise ValueError("没有可分析的订单")
+        sku = sku[sku["_lines"] > 0].sort_index()
+        counts = ["_lines", *COUNT_COLUMNS]
+        sku[counts] = sku[counts].round().astype("int64")
+        print(f"📊 受影响订单 {len(affected_ids)} 个, SKU {len(sku)} 个")
+
+        store.write({
+            "lines": lines,
+            "orders": all_orders,
+            "settlements": all_settle,
+            "sku": sku.reset_index(),
+        }, {"region": profile["name"], "columns": columns, "settlement_policy": settlement_policy})
+
+    return lines, sku.drop(columns="_lines"), dup_settle.drop(columns="_row_key"), columns, settlements
+
+
+# -------- 输出 --------
+def _line_value(profile: dict, order: pd.DataFrame, key: str, qty_col: str):
+    """订单表输出列的取值：引擎计算列或由出库/状态标记派生的列"""
+    if key == "order_id":
+        return order[order_id_column(profile)]
+    if key in LINE_COLUMNS:
+        return order[LINE_COLUMNS[key]]
+    flags = line_flags(profile, order)
+    derived = {
+        "is_shipped": lambda: flags["shipped"],
+        "is_not_shipped": lambda: flags["not_shipped"],
+        "is_signed": lambda: flags["signed"],
+        "is_cancelled": lambda: flags["cancelled"],
+        "is_in_transit": lambda: flags["in_transit"],
+        "cancel_before_ship": lambda: flags["cancelled"] & ~flags["shipped"],
+        "cancel_after_ship": lambda: flags["cancelled"] & flags["shipped"],
+        "shipped_qty": lambda: np.where(flags["shipped"], order[qty_col], 0),
+        "signed_qty": lambda: np.where(flags["signed"], order[qty_col], 0),
+    }
+    if key not in derived:
+        raise ValueError(f"订单表输出列配置错误: 未知的引擎列 {key}")
+    return derived[key]()
+
+
+def order_sheet(profile: dict, order: pd.DataFrame, qty_col: str) -> pd.DataFrame:
+    """订单表输出：原始列 + 配置的计算列（按配置改名），first 中的列移到最前面"""
+    spec = profile["order_sheet"]
+    names = {key: name for name, key in spec["columns"]}
+    internal = set(LINE_COLUMNS.values())
+    raw = [c for c in order.columns if c not in internal and c not in names.values()]
+
+    sheet = order[raw]
+    for name, key in spec["columns"]:
+        sheet[name] = _line_value(profile, order, key, qty_col)
+    if spec["first"]:
+        first = [order_id_column(profile) if key == "order_id" else names[key] for key in spec["first"]]
+        sheet = sheet[first + [c for c in sheet.columns if c not in first]]
+    return sheet
+
+
+def build_result_sheets(profile: dict, order: Optional[pd.DataFrame], sku: pd.DataFrame, dup_settle: pd.DataFrame,
+                        cons: pd.DataFrame, columns: List[str]) -> Dict[str, pd.DataFrame]:
+    """按配置组装输出工作表：工作表名称 -> DataFrame（按输出顺序）"""
+    qty_col, sku_col = columns[0], columns[1]
+    sheets = {}
+    for spec in profile["sheets"]:
+        kind = spec["kind"]
+        if kind == "orders":
+            # 分块模式没有逐行的订单表
+            if order is not None:
+                sheets[profile["order_sheet"]["name"]] = order_sheet(profile, order, qty_col)
+        elif kind == "sku":
+            keys = spec["columns"]
+            frame = sku[[sku_col if key == "sku" else key for key in keys]].rename(
+                columns={key: profile["sku_names"][key] for key in keys if key != "sku"})
+            sheets[spec["name"]] = frame.reset_index() if spec.get("row_index") else frame
+        elif kind == "duplicates":
+            # 排除的多行结算订单
+            if len(dup_settle) > 0:
+                sheets[spec["name"]] = dup_settle
+        elif kind == "consumption":
+            sheets[spec["name"]] = cons
+        else:
+            raise ValueError(f"工作表配置错误: 未知的类型 {kind}")
+    return sheets
+
+
+# -------- 完整流程 --------
+def run_region(profile: Profile,
+               order_files: List[ExcelSource],
+               settlement_files: List[ExcelSource],
+               consumption_file: TableSource,
+               output_dir: OutputTarget = ".",
+               workers: Optional[int] = None,
+               progress: Optional[Callable[[str, int], None]] = None,
+               writer_engine: Optional[str] = None,
+               output_format: str = "xlsx",
+               fees=None,
+               low_memory: bool = False,
+               state_dir: Optional[Union[str, Path]] = None,
+               sku_store: Optional[Union[str, Path]] = None,
+               profiler: Optional[StageProfiler] = None,
+               settlement_policy: Optional[str] = None,
+               summary: Optional[dict] = None,
+               scenario_dir: Optional[Union[str, Path]] = None,
+               chunk_rows: Optional[int] = None,
+               memory_limit_mb: Optional[float] = None) -> OutputTarget:
+    """
+    按地区配置执行财务数据分析
+
+    Args:
+        profile: 地区名称（见 regions.REGION_PROFILES）或配置字典
+        order_files: 订单文件列表（文件路径或二进制文件对象，如上传流）
+        settlement_files: 结算文件列表
+        consumption_file: 产品消耗文件，或已解析的产品消耗表（DataFrame，多个店铺共用时只解析一次）
+        output_dir: 输出目录，或可写的二进制缓冲区（如 BytesIO，结果直接写入内存）
+        workers: 并行解析文件的进程数，None时使用默认配置
+        progress: 进度回调 progress(阶段名称, 百分比)，用于后台任务上报进度
+        writer_engine: 结果工作簿写出引擎（xlsxwriter / openpyxl），None时使用默认配置
+        output_format: 输出格式，xlsx / parquet / csv.gz（后两者为按工作表打包的zip）
+        fees: 操作费规则（order_tiers 规则为分档列表，sku 规则为SKU费用映射），None时使用配置
+        low_memory: 低内存模式：只加载订单号/关键列/结算金额列，SKU和状态列使用分类类型，
+                    订单号使用pyarrow字符串（输出的订单表只包含这些列和计算列）
+        state_dir: 增量模式的状态目录。指定后只计算新增或变化的订单（状态变化、结算晚到），
+                   并在已保存的SKU聚合结果上增量更新；输出包含该目录累计的全部订单
+        sku_store: 本地分析数据库（SQLite）文件。指定后订单行、结算和消耗数据作为一个批次写入数据库，
+                   SKU聚合由SQL计算，历史批次可直接查询；与分块模式一起使用时订单行逐块写入
+        profiler: 阶段统计（耗时、行数、RSS峰值），None时新建一个仅用于日志输出
+        settlement_policy: 同一订单多行结算的处理策略：exclude / sum / latest，None时使用配置
+        summary: 传入字典时，分析完成后写入汇总指标（订单行数、SKU数、结算金额、人民币利润等）
+        scenario_dir: 保存场景测算数据的目录（见 scenarios.ScenarioBase），之后可按新的汇率、
+                      操作费和SKU成本重算利润，不需要重新解析Excel
+        chunk_rows: 分块模式每块的订单行数（见 chunked_engine），订单表按块流式读取和计算，
+                    内存与订单总行数无关；分块模式不输出订单表工作表
+        memory_limit_mb: 分块模式的内存上限（MB），指定后开启分块模式并按上限确定块大小
+
+    Returns:
+        输出文件路径，output_dir 为缓冲区时返回该缓冲区
+    """
+    profile = resolve_profile(profile)
+    settlement_policy = settlement_policy or profile["settlement_policy"]
+    chunked = chunk_rows is not None or memory_limit_mb is not None
+    if chunked and state_dir is not None:
+        raise ValueError("分块模式不支持增量模式")
+    report = progress or (lambda stage, percent: None)
+    profiler = profiler or StageProfiler(profile["name"])
+    print(f"🚀 开始{profile['label']}财务数据分析...")
+
+    # -------- 表头校验（只读取表头行，解析前发现缺列或放错位置的文件）--------
+    report("校验表头", 2)
+    with profiler.stage("表头校验", rows_in=len(order_files) + len(settlement_files)):
+        schema = sniff_input_headers(profile, order_files, settlement_files)
+
+    # -------- 读取和合并文件 --------
+    # 订单表全部列都会输出到订单表工作表（低内存模式除外）；结算表不输出明细时只加载关键列
+    lean_settlements = low_memory or not settlement_needs_all_columns(profile, settlement_policy,
+                                                                      state_dir is not None)
+    report("读取文件", 5)
+    order = None
+    if not chunked:
+        with profiler.stage("读取订单表") as stage:
+            order = merge_order_files(profile, order_files, workers=workers, low_memory=low_memory,
+                                      lean_usecols=schema["order_usecols"])
+            stage["rows_out"] = len(order)
+    with profiler.stage("读取结算表") as stage:
+        settle = merge_settlement_files(profile, settlement_files, workers=workers, low_memory=lean_settlements,
+                                        lean_usecols=schema["settlement_usecols"])
+        stage["rows_out"] = len(settle)
+    with profiler.stage("读取消耗表") as stage:
+        cons = read_consumption_file(profile, consumption_file)
+        stage["rows_out"] = len(cons)
+    print(f"📊 已读取产品消耗文件: {source_name(consumption_file)} ({len(cons)} 行)")
+
+    # -------- 数据预处理 --------
+    report("合并结算数据", 35)
+    settle = normalize_settlements(settle, profile["settlement_amount_keyword"])
+
+    sku = None
+    basis = None
+    batch = None
+    store_label = ", ".join(source_name(f) for f in order_files)
+    if state_dir is None:
+        with profiler.stage("结算去重", rows_in=len(settle)) as stage:
+            settlements, dup_settle = index_settlements(profile, settle, settlement_policy)
+            stage["rows_out"] = len(settlements.order_ids)
+        if chunked:
+            # 订单表分块读取并计算，只保留订单级统计和SKU部分聚合
+            from chunked_engine import ChunkedOrderAggregator
+
+            # 配置了本地分析数据库时每块计算完即写入数据库，数据库中的订单行不受内存限制
+            with profiler.stage("分块计算") as stage, store_batch(profile, sku_store, store_label) as batch:
+                agg = ChunkedOrderAggregator(profile, settlements, fees, chunk_rows, memory_limit_mb,
+                                             with_fee_basis=scenario_dir is not None, report=report,
+                                             line_sink=None if batch is None else batch.add_lines,
+                                             ).run(order_files, schema["order_usecols"])
+                if batch is not None:
+                    batch.add_inputs(settle, normalize_consumption(profile, cons, agg.columns[1]), agg.columns[1])
+                stage["rows_in"] = agg.lines
+                stage["rows_out"] = len(agg.sku)
+            sku, basis, columns = agg.sku, agg.fee_basis, agg.columns
+        else:
+            order, columns = compute_order_lines(profile, order, settlements, fees, low_memory, report, profiler)
+    else:
+        if low_memory:
+            raise ValueError("增量模式不支持低内存模式")
+        with profiler.stage("增量更新", rows_in=len(order)) as stage:
+            order, sku, dup_settle, columns, settlements = apply_incremental_update(
+                profile, OrderStateStore(state_dir), order, settle, fees, report, profiler, settlement_policy)
+            stage["rows_out"] = len(order)
+    qty_col, sku_col = columns[0], columns[1]
+    cost = normalize_consumption(profile, cons, sku_col)
+
+    # -------- SKU级别聚合与财务指标计算 --------
+    report("SKU聚合", 65)
+    if sku_store is not None:
+        # 订单行、结算和消耗写入本地数据库（分块模式已逐块写入），SKU聚合由SQL计算
+        if batch is None:
+            with profiler.stage("写入分析数据库", rows_in=len(order)):
+                with store_batch(profile, sku_store, store_label) as batch:
+                    batch.add_lines(order, qty_col, sku_col)
+                    batch.add_inputs(settle, cost, sku_col)
+        report("财务指标计算", 75)
+        sku = store_sku_metrics(profile, sku_store, batch.batch_id, sku_col, profiler)
+        print(f"🗄️  SKU指标已写入本地数据库: 批次 {batch.batch_id}")
+    else:
+        if sku is None:
+            with profiler.stage("SKU聚合", rows_in=len(order)) as stage:
+                sku = aggregate_sku_metrics(profile, order, sku_col, qty_col)
+                stage["rows_out"] = len(sku)
+        report("财务指标计算", 75)
+        with profiler.stage("财务指标计算", rows_in=len(sku)) as stage:
+            sku = finalize_sku_metrics(profile, sku, cost, sku_col)
+            stage["rows_out"] = len(sku)
+
+    # -------- 输出结果 --------
+    report("导出结果", 85)
+    sheets = build_result_sheets(profile, order, sku, dup_settle, cons, columns)
+    with profiler.stage("导出结果", rows_in=sum(len(df) for df in sheets.values())):
+        output_path = write_result(sheets, output_dir, profile["output_stem"],
+                                   output_format=output_format, writer_engine=writer_engine)
+
+    if scenario_dir is not None:
+        with profiler.stage("保存场景测算数据", rows_in=len(sku)):
+            fee_rule = profile["fee_tiers"] if profile["fee_rule"] == "order_tiers" else profile["sku_fees"]
+            if basis is None:
+                basis = fee_basis(profile, order, sku_col, qty_col)
+            ScenarioBase.from_run(profile, sku, basis, sku_col, fees or fee_rule).save(scenario_dir)
+
+    report("完成", 100)
+    profiler.finish()
+    order_lines = agg.lines if chunked else len(order)
+    if summary is not None:
+        summary.update({
+            "订单行数": order_lines,
+            "SKU数": len(sku),
+            "多行结算订单数": settlements.duplicate_orders,
+            "结算金额(本币)": float(sku["settlement"].sum()),
+            "币种": profile["currency"],
+            "人民币利润": float(sku["profit_rmb"].sum()),
+        })
+    print(f"✅ {profile['label']}分析完成! 结果已保存到: {target_name(output_path)}")
+    print(f"📈 处理了 {len(order_files)} 个订单文件, {len(settlement_files)} 个结算文件")
+    print(f"📊 总计订单: {order_lines} 行, SKU数量: {len(sku)} 个")
+    print(f"⏱️  各阶段耗时: 共 {profiler.seconds:.2f} 秒\n{profiler.summary()}")
+    return output_path
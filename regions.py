@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+regions.py
+------------------------------------------------
+地区配置（声明式），由分析引擎 region_engine 统一执行
+- 列识别：订单号 / 数量 / SKU / 出库 / 状态列的列名或关键字，结算表订单号与结算金额列
+- 状态词表：签收、取消、在途状态（统一去除首尾空白并转小写后比较）
+- 操作费规则：按订单总件数分档（order_tiers）或按SKU固定（sku），费用为人民币
+- 汇率：本币/人民币、本币/美元
+- 输出：工作表及各工作表的列名
+
+配置只包含数据（可pickle，传给解析子进程），新增市场只需增加一项配置并注册到 REGION_PROFILES。
+"""
+
+from typing import Dict
+
+# -------- 印尼本土店 --------
+INDONESIA = {
+    "name": "indonesia",
+    "label": "印尼",
+    "currency": "IDR",
+    "local_per_rmb": 2300,
+    "local_per_usd": 16000,
+    "cache_prefix": "",
+    "output_stem": "财务分析结果_多文件",
+
+    # 订单表：第一列为订单号（统一命名为 order_id），关键列按列名包含的关键字识别（不区分大小写）
+    "order_read": {"dtype": "str", "skiprows": None, "strip_headers": False, "drop_missing_id": False},
+    "order_id_column": None,
+    "column_match": "contains",
+    "order_columns": {"qty": "数量", "sku": "sku", "shipped": "是否出库", "status": "平台状态"},
+    # label: 出库列取值为 yes / no；time: 出库时间非空即为已出库
+    "shipped_rule": "label",
+    "shipped_labels": ["yes"],
+    "not_shipped_labels": ["no"],
+    "signed_statuses": ["delivered", "completed"],
+    "cancelled_statuses": ["cancelled"],
+    "in_transit_statuses": ["in transit"],
+    # 组合SKU: (正则, 基础SKU后缀)，按顺序匹配，命中第一个即停止（grease-2 -> grease-1 ×2）
+    "combo_sku_patterns": [(r"^(.+)-(\d+)$", "-1"), (r"^(.+)\*(\d+)$", "*1")],
+
+    # 结算表：第一列为订单号，结算金额列为列名包含 settlement 的第一列
+    "settlement_read": {"dtype": "str", "usecols": None, "strip_headers": False,
+                        "type_column": None, "type_value": None},
+    "settlement_id_column": None,
+    "settlement_amount_keyword": "settlement",
+    "settlement_policy": "exclude",
+    # 订单没有结算时的结算金额（None保持为空）
+    "missing_settlement": None,
+    # split: 订单结算金额平均分到订单各行；order: 每行计入订单的全部结算金额
+    "settlement_allocation": "split",
+    # distinct: 订单数按 (SKU, 订单) 去重；lines: 每个订单行计为一单
+    "order_count": "distinct",
+
+    # 操作费（人民币）: (最小件数, 最大件数(含，None为不限), 费用)
+    "fee_rule": "order_tiers",
+    "fee_tiers": [(1, 1, 2.0), (2, None, 2.5)],
+    "sku_fees": None,
+
+    # 产品消耗表：SKU列优先使用订单表SKU列名，否则为第一列；金额为本币
+    "consumption_read": {"dtype": "str", "strip_headers": False},
+    "consumption_columns": {
+        "sku": [],
+        "unit_cost": ["印尼盾单sku成本"],
+        "ads": ["印尼盾ads消耗"],
+        "gmvmax": ["印尼盾gmvmax消耗"],
+    },
+    # 毛利率分母：signed_amount（签收金额）/ settlement（总结算金额）；分母为0时的取值（None为空）
+    "margin_base": "signed_amount",
+    "zero_division": None,
+
+    # -------- 输出 --------
+    # 订单表追加的计算列: [输出列名, 引擎列]，first 为移到最前面的引擎列
+    "order_sheet": {
+        "name": "订单表_含结算与操作费",
+        "columns": [
+            ["Total settlement amount", "settlement"],
+            ["_shipped", "shipped_label"],
+            ["_status", "status_label"],
+            ["settlement_per_line", "settlement_line"],
+            ["order_fee_rmb", "order_fee"],
+            ["operation_fee_per_line_rmb", "fee_line"],
+        ],
+        "first": [],
+    },
+    # SKU指标引擎列 -> 输出列名
+    "sku_names": {
+        "settlement": "sku_total_settlement",
+        "operation_fee": "sku_total_operation_fee",
+        "fee_local": "印尼盾操作费",
+        "shipped_qty": "出库数量",
+        "signed_amount": "签收金额",
+        "orders": "订单数",
+        "shipped_orders": "出库订单数数量",
+        "signed_orders": "签收订单数",
+        "signed_rate": "签收率",
+        "cancel_rate": "取消率",
+        "cancel_before_ship_rate": "出库前取消率",
+        "cancel_after_ship_rate": "出库后取消率",
+        "in_transit_rate": "仍在途率",
+        "ads": "印尼盾ads消耗",
+        "gmvmax": "印尼盾gmvmax消耗",
+        "ads_usd": "美金ads消耗",
+        "gmvmax_usd": "美金gmvmax消耗",
+        "unit_cost": "印尼盾单sku成本",
+        "unit_cost_rmb": "人民币单sku成本",
+        "ad_spend": "印尼盾消耗",
+        "product_cost": "印尼盾产品成本",
+        "profit": "利润",
+        "profit_rmb": "人民币利润",
+        "margin": "签收毛利率",
+        "profit_per_order": "每单利润",
+    },
+    # 工作表（按输出顺序）：orders / sku / duplicates（多行结算被排除时）/ consumption（原始产品消耗表）
+    # row_index 为True时第一列为行号（index）
+    "sheets": [
+        {"kind": "orders"},
+        {"kind": "sku", "name": "sku汇总_结算与操作费", "row_index": True,
+         "columns": ["settlement", "operation_fee"]},
+        {"kind": "duplicates", "name": "排除订单_多行结算"},
+        {"kind": "sku", "name": "sku财务指标", "row_index": True,
+         "columns": ["sku", "settlement", "operation_fee", "fee_local", "shipped_qty", "signed_amount", "orders",
+                     "shipped_orders", "signed_orders", "signed_rate", "cancel_rate", "cancel_before_ship_rate",
+                     "cancel_after_ship_rate", "in_transit_rate", "ads", "gmvmax", "ads_usd", "gmvmax_usd",
+                     "unit_cost", "unit_cost_rmb", "ad_spend", "product_cost", "profit", "profit_rmb", "margin",
+                     "profit_per_order"]},
+    ],
+}
+
+# -------- 马来跨境店 --------
+MALAYSIA = {
+    "name": "malaysia",
+    "label": "马来",
+    "currency": "MYR",
+    "local_per_rmb": 0.6,
+    "local_per_usd": None,
+    "cache_prefix": "mal_",
+    "output_stem": "马来跨境店财务分析结果",
+
+    # 订单表：第2行为注释行，列名固定
+    "order_read": {"dtype": None, "skiprows": [1], "strip_headers": True, "drop_missing_id": True},
+    "order_id_column": "Order ID",
+    "column_match": "exact",
+    "order_columns": {"qty": "Quantity", "sku": "Seller SKU", "shipped": "Shipped Time", "status": "Order Status"},
+    "shipped_rule": "time",
+    "shipped_labels": ["yes"],
+    "not_shipped_labels": ["no"],
+    "signed_statuses": ["completed", "delivered"],
+    "cancelled_statuses": ["canceled"],
+    "in_transit_statuses": [],
+    "combo_sku_patterns": [],
+
+    # 结算表：只加载用到的列，只保留 Type 为 order 的记录
+    "settlement_read": {"dtype": None, "usecols": ["Type", "Order/adjustment ID", "Total settlement amount"],
+                        "strip_headers": True, "type_column": "Type", "type_value": "order"},
+    "settlement_id_column": "Order/adjustment ID",
+    "settlement_amount_keyword": "settlement",
+    "settlement_policy": "latest",
+    "missing_settlement": 0.0,
+    "settlement_allocation": "order",
+    "order_count": "lines",
+
+    # 出库订单行按SKU固定收取的操作费（人民币）
+    "fee_rule": "sku",
+    "fee_tiers": None,
+    "sku_fees": {"xifashui": 2.5, "kingstick": 2.5},
+
+    "consumption_read": {"dtype": None, "strip_headers": True},
+    "consumption_columns": {
+        "sku": ["Seller SKU", "seller sku"],
+        "unit_cost": ["单sku马来币成本", "马来币单sku成本"],
+        "ads": ["马来币ads消耗"],
+        "gmvmax": ["马来币gmvmax消耗"],
+    },
+    "margin_base": "settlement",
+    "zero_division": 0.0,
+
+    "order_sheet": {
+        "name": "订单表_含结算金额和操作费",
+        "columns": [
+            ["Total settlement amount", "settlement"],
+            ["is_shipped", "is_shipped"],
+            ["is_signed", "is_signed"],
+            ["is_cancelled", "is_cancelled"],
+            ["cancel_before_ship", "cancel_before_ship"],
+            ["cancel_after_ship", "cancel_after_ship"],
+            ["操作费", "fee_line"],
+            ["shipped_qty", "shipped_qty"],
+            ["signed_qty", "signed_qty"],
+        ],
+        "first": ["order_id", "settlement", "fee_line"],
+    },
+    "sku_names": {
+        "settlement": "总结算金额",
+        "operation_fee": "总操作费",
+        "orders": "订单数",
+        "shipped_orders": "出库订单数",
+        "signed_orders": "签收订单数",
+        "shipped_qty": "出库sku数",
+        "signed_qty": "签收sku数",
+        "cancel_before_ship": "出库前取消订单",
+        "cancel_after_ship": "出库后取消订单",
+        "signed_rate": "签收率",
+        "cancel_before_ship_rate": "出库前取消率",
+        "cancel_after_ship_rate": "出库后取消率",
+        "unit_cost": "单sku马来币成本",
+        "ads": "马来币ads消耗",
+        "gmvmax": "马来币gmvmax消耗",
+        "product_cost": "sku产品成本",
+        "fee_local": "马来币操作费",
+        "profit": "利润",
+        "profit_rmb": "人民币利润",
+        "margin": "毛利率",
+        "profit_per_order": "每单利润",
+    },
+    "sheets": [
+        {"kind": "orders"},
+        {"kind": "sku", "name": "sku总结算金额和操作费", "row_index": False,
+         "columns": ["sku", "settlement", "operation_fee", "orders", "shipped_orders", "signed_orders",
+                     "shipped_qty", "signed_qty", "cancel_before_ship", "cancel_after_ship", "signed_rate",
+                     "cancel_before_ship_rate", "cancel_after_ship_rate", "unit_cost", "ads", "gmvmax",
+                     "product_cost", "fee_local", "profit", "profit_rmb", "margin", "profit_per_order"]},
+        {"kind": "consumption", "name": "产品消耗成本表"},
+    ],
+}
+
+REGION_PROFILES: Dict[str, dict] = {
+    "indonesia": INDONESIA,
+    "malaysia": MALAYSIA,
+}
+
+
+def get_profile(region: str) -> dict:
+    """按地区名称获取配置"""
+    try:
+        return REGION_PROFILES[region]
+    except KeyError:
+        raise ValueError(f"不支持的地区: {region}，可选 {', '.join(REGION_PROFILES)}") from None
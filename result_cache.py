@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+result_cache.py
+------------------------------------------------
+整次分析结果缓存（按输入文件内容哈希 + 分析参数寻址）
+- 同一组文件、同一分析模块和输出参数再次提交时直接返回之前生成的结果文件，不再运行分析流程
+- 相同请求同时到达时只计算一次：后到的请求等待先到请求的结果（进程内线程锁 + 跨worker文件锁）
+- 条目超过保存时间（TTL）即失效；按缓存总大小做LRU淘汰（以条目目录修改时间作为最近使用时间）
+
+键的组成：缓存版本、分析模块、地区配置指纹、输出参数，以及订单/结算/消耗文件各自的内容哈希。
+同一类文件保持上传顺序：文件顺序会影响输出（订单表行顺序、马来结算表"取最新"策略）。
+
+通过环境变量配置：
+- RESULT_CACHE_DIR: 缓存目录，为空时不启用缓存
+- RESULT_CACHE_MAX_BYTES: 缓存总大小上限（字节），默认 1GB
+- RESULT_CACHE_TTL_SECONDS: 条目保存时间（秒），默认 24 小时
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows（waitress）：只做进程内合并
+    fcntl = None
+
+# 分析流程或输出格式变化时递增，使旧结果自动失效（地区配置的变化由配置指纹体现）
+RESULT_CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+# 条目元数据文件（位于条目目录，最后写入）
+META_FILE = "meta.json"
+
+# 计算结果: producer(条目临时目录) -> (结果文件路径, 下载文件名)
+ResultProducer = Callable[[Path], Tuple[Path, str]]
+
+
+def result_key(analysis_type: str,
+               order_hashes: List[str],
+               settlement_hashes: List[str],
+               consumption_hash: str,
+               profile: Optional[dict] = None,
+               **params) -> str:
+    """
+    计算结果缓存键
+
+    Args:
+        analysis_type: 分析模块（indonesia / malaysia）
+        order_hashes / settlement_hashes: 订单、结算文件内容哈希（上传顺序）
+        consumption_hash: 产品消耗表内容哈希
+        profile: 地区配置（汇率、操作费、列名等），配置变化时旧结果失效
+        **params: 其他影响输出的参数（输出格式、写出引擎等）
+
+    Returns:
+        SHA-256 十六进制字符串
+    """
+    payload = {
+        "version": RESULT_CACHE_VERSION,
+        "analysis_type": analysis_type,
+        "orders": list(order_hashes),
+        "settlements": list(settlement_hashes),
+        "consumption": consumption_hash,
+        "profile": profile,
+        "params": params,
+    }
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """基于目录的结果缓存，每个条目一个目录（结果文件 + 附带数据 + meta.json）"""
+
+    def __init__(self, root: Union[str, Path], max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / "locks").mkdir(exist_ok=True)
+        # 进程内每个键一把锁（引用计数，无人使用时删除）
+        self._locks: Dict[str, list] = {}
+        self._locks_guard = threading.Lock()
+
+    def entry_dir(self, key: str) -> Path:
+        return self.root / key
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        读取缓存条目，未命中或已过期返回None；命中时刷新其最近使用时间
+
+        Returns:
+            条目元数据: result_path（结果文件）、download_name、created_at、entry_dir
+        """
+        entry = self.entry_dir(key)
+        try:
+            meta = json.loads((entry / META_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if time.time() - meta["created_at"] > self.ttl_seconds:
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        result_path = entry / meta["result_file"]
+        if not result_path.exists():
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            return None
+        return {**meta, "result_path": result_path, "entry_dir": entry}
+
+    def get_or_compute(self, key: str, producer: ResultProducer,
+                       on_wait: Optional[Callable[[], None]] = None) -> Tuple[dict, str]:
+        """
+        命中时直接返回缓存条目，否则计算并写入缓存；相同键同时只有一个计算
+
+        Args:
+            key: 缓存键（result_key）
+            producer: 把结果写入给定目录的函数，返回 (结果文件路径, 下载文件名)
+            on_wait: 相同请求正在计算、需要等待时调用（如更新任务进度）
+
+        Returns:
+            (条目元数据, 状态)，状态为 hit（已有结果）/ coalesced（等待了相同请求的计算）/ miss（本次计算）
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry, "hit"
+
+        with self._key_lock(key, on_wait) as waited:
+            entry = self.get(key)
+            if entry is not None:
+                return entry, "coalesced" if waited else "hit"
+            return self._compute(key, producer), "miss"
+
+    def computing(self, key: str) -> bool:
+        """相同键的结果是否正在计算（本进程或其他worker持有键锁）"""
+        with self._locks_guard:
+            holder = self._locks.get(key)
+            if holder is not None and holder[0].locked():
+                return True
+        lock_path = self.root / "locks" / f"{key}.lock"
+        if fcntl is None or not lock_path.exists():
+            return False
+        try:
+            with open(lock_path, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return True
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except OSError:
+            return False
+        return False
+
+    def _compute(self, key: str, producer: ResultProducer) -> dict:
+        """在临时目录中生成结果，写入元数据后整体替换为条目目录"""
+        tmp = Path(tempfile.mkdtemp(dir=self.root, suffix=".tmp"))
+        try:
+            result_path, download_name = producer(tmp)
+            result_path = Path(result_path)
+            meta = {
+                "key": key,
+                "download_name": download_name,
+                "result_file": result_path.relative_to(tmp).as_posix(),
+                "created_at": time.time(),
+            }
+            (tmp / META_FILE).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+            entry = self.entry_dir(key)
+            # 过期或不完整的旧条目
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+        return {**meta, "result_path": entry / meta["result_file"], "entry_dir": entry}
+
+    @contextmanager
+    def _key_lock(self, key: str, on_wait: Optional[Callable[[], None]] = None) -> Iterator[bool]:
+        """键级独占锁（进程内 + 跨进程），返回是否等待过其他请求"""
+        with self._locks_guard:
+            holder = self._locks.setdefault(key, [threading.Lock(), 0])
+            holder[1] += 1
+        lock = holder[0]
+        waited = False
+        try:
+            if not lock.acquire(blocking=False):
+                waited = True
+                if on_wait is not None:
+                    on_wait()
+                lock.acquire()
+            try:
+                with open(self.root / "locks" / f"{key}.lock", "w") as lock_file:
+                    if fcntl is not None:
+                        try:
+                            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except BlockingIOError:
+                            if not waited and on_wait is not None:
+                                on_wait()
+                            waited = True
+                            fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield waited
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            finally:
+                lock.release()
+        finally:
+            with self._locks_guard:
+                holder[1] -= 1
+                if holder[1] == 0:
+                    del self._locks[key]
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """删除过期条目，再按最近使用时间从旧到新删除，直到总大小不超过上限（keep 为刚写入的条目，不删除）"""
+        now = time.time()
+        entries = []
+        for path in self.root.iterdir():
+            if not path.is_dir() or path.name == "locks":
+                continue
+            try:
+                mtime = path.stat().st_mtime
+                if path.suffix == ".tmp":
+                    # 异常退出遗留的临时目录
+                    if now - mtime > 3600:
+                        shutil.rmtree(path, ignore_errors=True)
+                    continue
+                if now - mtime > self.ttl_seconds and path.name != keep:
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                size = sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path.name == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+        # 已无对应条目的锁文件
+        for path in (self.root / "locks").glob("*.lock"):
+            try:
+                if now - path.stat().st_mtime > self.ttl_seconds:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """按环境变量构建缓存实例；未配置目录时返回None"""
+    root = os.environ.get("RESULT_CACHE_DIR")
+    if not root:
+        return None
+    max_bytes = int(os.environ.get("RESULT_CACHE_MAX_BYTES") or DEFAULT_MAX_BYTES)
+    ttl_seconds = int(os.environ.get("RESULT_CACHE_TTL_SECONDS") or DEFAULT_TTL_SECONDS)
+    return ResultCache(root, max_bytes, ttl_seconds)
+
+
+def copy_entry(entry: dict, target_dir: Path) -> Path:
+    """
+    把缓存条目中的文件复制（能硬链接时硬链接）到目标目录，返回结果文件在目标目录中的路径
+    （条目之后被淘汰不影响已复制的文件）
+    """
+    def link_or_copy(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    source = entry["entry_dir"]
+    for path in source.rglob("*"):
+        if path.name == META_FILE and path.parent == source:
+            continue
+        dst = target_dir / path.relative_to(source)
+        if path.is_dir():
+            dst.mkdir(parents=True, exist_ok=True)
+        else:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(path, dst)
+    return target_dir / entry["result_file"]
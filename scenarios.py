@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+scenarios.py
+------------------------------------------------
+利润场景测算（what-if）：按新的汇率、操作费规则、SKU成本/消耗重算利润，不重新解析Excel
+- 分析时保存每个SKU的中间结果（结算金额、出库数量、签收订单数、操作费、成本和消耗）
+  以及操作费基数：按订单总件数分档的规则保存 (SKU, 订单总件数) -> 分摊行权重，
+  按SKU固定的规则保存每个SKU的出库行数，新的费用规则只需在基数上重新计费
+- 多个场景一次计算：SKU × 场景 的矩阵运算，结果为 利润 / 人民币利润 / 毛利率 / 每单利润
+- 未覆盖的参数沿用原分析的取值，不修改任何参数的场景与原分析结果一致
+
+场景格式（JSON，除 name 外均可省略）:
+{
+  "name": "汇率2250",
+  "local_per_rmb": 2250,                          # 本币/人民币汇率
+  "fees": [[1, 1, 2.0], [2, null, 3.0]],          # 分档规则（印尼）或 {"xifashui": 2.0}（马来）
+  "unit_cost": {"grease-1": 9000},                # SKU本币单件成本
+  "ads": {"grease-1": 0}, "gmvmax": {}            # SKU本币ads / gmvmax消耗
+}
+
+用法: python scenarios.py 场景目录 场景.json [-o 测算结果.xlsx]
+"""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from fee_rules import tier_fee
+from parse_cache import parquet_available
+from regions import get_profile
+
+# 保存的SKU中间结果列（引擎指标名）
+BASE_COLUMNS = ["settlement", "operation_fee", "shipped_qty", "signed_orders", "unit_cost", "ads", "gmvmax",
+                "profit_rmb"]
+
+# 场景中可覆盖的参数
+SCENARIO_KEYS = {"name", "local_per_rmb", "fees", "unit_cost", "ads", "gmvmax"}
+
+# 每个SKU可单独覆盖的金额
+SKU_OVERRIDES = ("unit_cost", "ads", "gmvmax")
+
+# 场景测算输出的SKU指标（引擎指标名）
+RESULT_COLUMNS = ["fee_local", "product_cost", "profit", "profit_rmb", "margin", "profit_per_order"]
+
+META_FILE = "meta.json"
+
+
+class ScenarioBase:
+    """一次分析的SKU中间结果，用于按新的汇率、操作费和成本快速重算利润"""
+
+    def __init__(self, region: str, sku: pd.DataFrame, fee_basis: pd.DataFrame,
+                 local_per_rmb: float, fees):
+        """
+        Args:
+            region: 地区名称（见 regions.REGION_PROFILES）
+            sku: 以SKU为索引的中间结果，包含 BASE_COLUMNS 和毛利率分母列 margin_base
+            fee_basis: 操作费基数，order_tiers 规则为 [sku, order_qty, weight]，sku 规则为 [sku, weight]
+            local_per_rmb: 原分析使用的本币/人民币汇率
+            fees: 原分析使用的操作费规则
+        """
+        self.region = region
+        self.profile = get_profile(region)
+        self.sku = sku
+        self.fee_basis = fee_basis
+        self.local_per_rmb = local_per_rmb
+        self.fees = fees
+        # 操作费基数展开为 SKU × 订单总件数 的权重矩阵（sku 规则为每个SKU的出库行数），
+        # 多个费用规则的计费为一次矩阵乘法
+        codes = sku.index.get_indexer(fee_basis["sku"])
+        known = codes >= 0
+        weight = fee_basis["weight"].to_numpy(dtype=float)[known]
+        if self.profile["fee_rule"] == "order_tiers":
+            qty_codes, self._fee_qty = pd.factorize(fee_basis["order_qty"].to_numpy(dtype=float)[known], sort=True)
+            self._fee_weight = np.zeros((len(sku), len(self._fee_qty)))
+            np.add.at(self._fee_weight, (codes[known], qty_codes), weight)
+        else:
+            self._fee_weight = np.bincount(codes[known], weights=weight, minlength=len(sku))
+
+    @classmethod
+    def from_run(cls, profile: dict, sku: pd.DataFrame, fee_basis: pd.DataFrame, sku_col: str,
+                 fees) -> "ScenarioBase":
+        """由分析得到的财务指标表（引擎指标名）和操作费基数构建"""
+        base = sku.set_index(sku[sku_col].astype(str))[BASE_COLUMNS].astype(float)
+        base["margin_base"] = sku[profile["margin_base"]].to_numpy(dtype=float)
+        base.index.name = "sku"
+        # 产品消耗表中重复的SKU在财务指标表中会重复出现，场景测算按第一行计算
+        duplicated = base.index.duplicated()
+        if duplicated.any():
+            print(f"⚠️  场景测算忽略重复的SKU行: {duplicated.sum()} 行")
+            base = base[~duplicated]
+        basis = fee_basis.assign(sku=fee_basis["sku"].astype(str))
+        return cls(profile["name"], base, basis, profile["local_per_rmb"], fees)
+
+    # -------- 保存与读取 --------
+    def save(self, path: Union[str, Path]) -> Optional[Path]:
+        """保存到目录（parquet），未安装pyarrow时不保存并返回None"""
+        if not parquet_available():
+            print("⚠️  未安装pyarrow，不保存场景测算数据")
+            return None
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.sku.reset_index().to_parquet(path / "sku.parquet", index=False)
+        self.fee_basis.to_parquet(path / "fee_basis.parquet", index=False)
+        (path / META_FILE).write_text(json.dumps({
+            "region": self.region,
+            "local_per_rmb": self.local_per_rmb,
+            "fees": self.fees,
+        }, ensure_ascii=False), encoding="utf-8")
+        return path
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ScenarioBase":
+        """读取 save 保存的目录"""
+        path = Path(path)
+        meta = json.loads((path / META_FILE).read_text(encoding="utf-8"))
+        sku = pd.read_parquet(path / "sku.parquet").set_index("sku")
+        fee_basis = pd.read_parquet(path / "fee_basis.parquet")
+        return cls(meta["region"], sku, fee_basis, meta["local_per_rmb"], meta["fees"])
+
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        return (Path(path) / META_FILE).exists()
+
+    # -------- 场景计算 --------
+    def operation_fees(self, rules: Sequence) -> np.ndarray:
+        """
+        按新的操作费规则计算每个SKU的操作费（人民币）
+
+        Returns:
+            SKU × 规则 矩阵
+        """
+        if self.profile["fee_rule"] == "order_tiers":
+            # 每个规则只需对去重后的订单总件数计费
+            fee = np.column_stack([tier_fee(self._fee_qty, [tuple(tier) for tier in rule]) for rule in rules])
+            return self._fee_weight @ fee
+        skus = self.sku.index
+        fee = np.column_stack([skus.map(rule).fillna(0).to_numpy(dtype=float) for rule in rules])
+        return self._fee_weight[:, None] * fee
+
+    def operation_fee(self, fees) -> np.ndarray:
+        """按单个操作费规则计算每个SKU的操作费（人民币）"""
+        return self.operation_fees([fees])[:, 0]
+
+    def _override_matrix(self, key: str, scenarios: Sequence[dict]) -> np.ndarray:
+        """SKU × 场景 的金额矩阵：原分析的取值，场景中指定的SKU替换为新值（全部场景一次查找SKU位置）"""
+        values = np.repeat(self.sku[key].to_numpy(dtype=float)[:, None], len(scenarios), axis=1)
+        columns, skus, amounts = [], [], []
+        for j, scenario in enumerate(scenarios):
+            for sku, amount in (scenario.get(key) or {}).items():
+                columns.append(j)
+                skus.append(sku)
+                amounts.append(amount)
+        if skus:
+            values[self.sku.index.get_indexer(skus), columns] = np.asarray(amounts, dtype=float)
+        return values
+
+    def validate(self, scenarios: Sequence[dict]) -> None:
+        """检查场景参数，未知参数、类型错误或本次分析中不存在的SKU时报错"""
+        known_skus = set(self.sku.index)
+        for i, scenario in enumerate(scenarios):
+            label = scenario.get("name") or f"场景{i + 1}"
+            unknown = set(scenario) - SCENARIO_KEYS
+            if unknown:
+                raise ValueError(f"{label}: 不支持的参数 {', '.join(sorted(unknown))}")
+            rate = scenario.get("local_per_rmb")
+            if rate is not None and (not isinstance(rate, (int, float)) or rate <= 0):
+                raise ValueError(f"{label}: local_per_rmb 必须为正数")
+            fees = scenario.get("fees")
+            if fees is not None:
+                expected = list if self.profile["fee_rule"] == "order_tiers" else dict
+                if not isinstance(fees, expected):
+                    raise ValueError(f"{label}: {self.profile['label']}的 fees 应为"
+                                     f"{'分档列表 [[最小件数, 最大件数, 费用], ...]' if expected is list else 'SKU费用映射'}")
+            for key in SKU_OVERRIDES:
+                overrides = scenario.get(key) or {}
+                if not isinstance(overrides, dict):
+                    raise ValueError(f"{label}: {key} 应为 SKU -> 金额 的映射")
+                missing = [sku for sku in overrides if sku not in known_skus]
+                if missing:
+                    raise ValueError(f"{label}: 本次分析中没有这些SKU: {', '.join(map(str, missing))}")
+
+    def evaluate(self, scenarios: Sequence[dict]) -> Dict[str, np.ndarray]:
+        """
+        批量计算多个场景
+
+        Args:
+            scenarios: 场景列表（格式见模块说明）
+
+        Returns:
+            引擎指标名 -> SKU × 场景 矩阵（RESULT_COLUMNS），另含 rate（每个场景的汇率）
+        """
+        self.validate(scenarios)
+        n_scenarios = len(scenarios)
+        rate = np.array([s.get("local_per_rmb") or self.local_per_rmb for s in scenarios], dtype=float)
+
+        # 操作费：指定了费用规则的场景一次矩阵乘法算出，其余沿用原分析的操作费
+        fee_rmb = np.repeat(self.sku["operation_fee"].to_numpy(dtype=float)[:, None], n_scenarios, axis=1)
+        with_fees = [j for j, scenario in enumerate(scenarios) if scenario.get("fees") is not None]
+        if with_fees:
+            fee_rmb[:, with_fees] = self.operation_fees([scenarios[j]["fees"] for j in with_fees])
+
+        settlement = self.sku["settlement"].to_numpy(dtype=float)[:, None]
+        shipped_qty = self.sku["shipped_qty"].to_numpy(dtype=float)[:, None]
+        signed_orders = self.sku["signed_orders"].to_numpy(dtype=float)[:, None]
+        margin_base = self.sku["margin_base"].to_numpy(dtype=float)[:, None]
+
+        # 与 region_engine.finalize_sku_metrics 相同的计算顺序，不覆盖参数时结果与原分析一致
+        fee_local = fee_rmb * rate
+        product_cost = self._override_matrix("unit_cost", scenarios) * shipped_qty
+        ad_spend = self._override_matrix("ads", scenarios) + self._override_matrix("gmvmax", scenarios)
+        profit = settlement - fee_local - product_cost - ad_spend
+        profit_rmb = profit / rate
+        zero_value = self.profile["zero_division"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            margin = np.where(margin_base != 0, profit / margin_base, np.nan)
+            profit_per_order = np.where(signed_orders != 0, profit_rmb / signed_orders, np.nan)
+        if zero_value is not None:
+            margin = np.where(np.isnan(margin), zero_value, margin)
+            profit_per_order = np.where(np.isnan(profit_per_order), zero_value, profit_per_order)
+        return {
+            "rate": rate,
+            "fee_local": fee_local,
+            "product_cost": product_cost,
+            "profit": profit,
+            "profit_rmb": profit_rmb,
+            "margin": margin,
+            "profit_per_order": profit_per_order,
+        }
+
+    def scenario_names(self, scenarios: Sequence[dict]) -> List[str]:
+        return [s.get("name") or f"场景{i + 1}" for i, s in enumerate(scenarios)]
+
+    def totals(self, scenarios: Sequence[dict], result: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+        """每个场景一行：汇率、本币利润合计、人民币利润合计及相对原分析的变化"""
+        result = result or self.evaluate(scenarios)
+        profit_rmb = result["profit_rmb"].sum(axis=0)
+        return pd.DataFrame({
+            "场景": self.scenario_names(scenarios),
+            "汇率": result["rate"],
+            "利润合计": result["profit"].sum(axis=0),
+            "人民币利润合计": profit_rmb,
+            "人民币利润变化": profit_rmb - self.sku["profit_rmb"].sum(),
+        })
+
+    def sku_frame(self, scenarios: Sequence[dict], result: Optional[Dict[str, np.ndarray]] = None,
+                  skus: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        SKU明细（长表，每个 场景 × SKU 一行），列名使用地区输出列名
+
+        Args:
+            scenarios: 场景列表
+            result: evaluate 的结果，None时重新计算
+            skus: 只输出这些SKU，None时输出全部
+        """
+        result = result or self.evaluate(scenarios)
+        rows = np.arange(len(self.sku)) if skus is None else self.sku.index.get_indexer(list(skus))
+        rows = rows[rows >= 0]
+        n_scenarios = len(scenarios)
+        names = self.profile["sku_names"]
+        frame = pd.DataFrame({
+            "场景": np.repeat(self.scenario_names(scenarios), len(rows)),
+            "SKU": np.tile(self.sku.index.to_numpy()[rows], n_scenarios),
+        })
+        for key in RESULT_COLUMNS:
+            frame[names.get(key, key)] = result[key][rows].T.reshape(-1)
+        frame["人民币利润变化"] = (result["profit_rmb"][rows] - self.sku["profit_rmb"].to_numpy()[rows, None]).T.reshape(-1)
+        return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="利润场景测算")
+    parser.add_argument("base", help="分析时保存的场景测算目录")
+    parser.add_argument("scenarios", help="场景列表（JSON）")
+    parser.add_argument("-o", "--output", help="结果写入Excel文件（场景汇总 + SKU明细）")
+    args = parser.parse_args()
+
+    base = ScenarioBase.load(args.base)
+    scenarios = json.loads(Path(args.scenarios).read_text(encoding="utf-8"))
+    result = base.evaluate(scenarios)
+    totals = base.totals(scenarios, result)
+    print(totals.to_string(index=False))
+    if args.output:
+        with pd.ExcelWriter(args.output) as writer:
+            totals.to_excel(writer, sheet_name="场景汇总", index=False)
+            base.sku_frame(scenarios, result).to_excel(writer, sheet_name="SKU明细", index=False)
+        print(f"✅ 已写出 {len(scenarios)} 个场景到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+settlement_index.py
+------------------------------------------------
+结算金额索引（印尼、马来两个模块共用）
+- 订单号统一标准化一次（数值型订单号转为整数字符串、去除首尾空白），再编码为整数编码
+- 同一订单出现多行结算时按策略处理：
+    exclude: 整单排除（不计结算金额，多行结算单独列出）
+    sum:     多行结算金额求和
+    latest:  取最后出现的一行（按上传文件及行的顺序）
+- 结算金额按编码存放在数组中，订单行查找只做一次哈希定位和数组取值，不复制订单表
+"""
+
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+SETTLEMENT_POLICIES = ("exclude", "sum", "latest")
+
+
+def normalize_order_ids(ids: Union[pd.Series, np.ndarray, list]) -> pd.Series:
+    """
+    订单号标准化：数值型（Excel中存为数字）转为整数字符串，文本去除首尾空白，空值保持为空
+
+    Args:
+        ids: 订单号列
+
+    Returns:
+        标准化后的订单号（与输入等长）
+    """
+    ids = pd.Series(ids).reset_index(drop=True)
+    if pd.api.types.is_numeric_dtype(ids.dtype):
+        as_int = ids.astype("Int64")
+        return as_int.astype(str).where(as_int.notna())
+    if pd.api.types.infer_dtype(ids, skipna=True) in ("string", "empty"):
+        return ids.str.strip()
+    # 混合类型（部分单元格为数字）：逐个转为文本
+    return ids.map(_normalize_order_id)
+
+
+def _normalize_order_id(value):
+    if value is None or value != value:
+        return None
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return str(int(value))
+    return str(value).strip()
+
+
+class SettlementIndex:
+    """按订单号索引的结算金额"""
+
+    def __init__(self, order_ids: Union[pd.Series, np.ndarray], amounts: Union[pd.Series, np.ndarray],
+                 policy: str = "exclude"):
+        """
+        Args:
+            order_ids: 结算行订单号
+            amounts: 结算行金额（非数值按空值处理）
+            policy: 多行结算处理策略，exclude / sum / latest
+        """
+        if policy not in SETTLEMENT_POLICIES:
+            raise ValueError(f"不支持的多行结算策略: {policy}，可选 {', '.join(SETTLEMENT_POLICIES)}")
+        self.policy = policy
+
+        codes, uniques = pd.factorize(normalize_order_ids(order_ids))
+        values = pd.to_numeric(pd.Series(amounts).reset_index(drop=True), errors="coerce").to_numpy(dtype=float)
+        valid = codes >= 0
+        n = len(uniques)
+        counts = np.bincount(codes[valid], minlength=n)
+
+        if policy == "sum":
+            present = ~np.isnan(values) & valid
+            amount = np.bincount(codes[present], weights=values[present], minlength=n)
+            # 全部为空的订单保持为空
+            amount[np.bincount(codes[present], minlength=n) == 0] = np.nan
+        else:
+            # 每个订单最后出现的结算行
+            last_rows = pd.Series(codes[valid]).drop_duplicates(keep="last")
+            amount = np.full(n, np.nan)
+            amount[last_rows.to_numpy()] = values[np.flatnonzero(valid)[last_rows.index.to_numpy()]]
+            if policy == "exclude":
+                amount[counts > 1] = np.nan
+
+        self.order_ids = pd.Index(uniques)
+        self.amounts = amount
+        self.row_counts = counts
+        # 输入结算行中属于多行结算订单的行
+        self.duplicate_mask = np.zeros(len(codes), dtype=bool)
+        self.duplicate_mask[valid] = counts[codes[valid]] > 1
+
+    @classmethod
+    def from_frame(cls, settle: pd.DataFrame, id_col: str = "order_id",
+                   amount_col: str = "Total settlement amount", policy: str = "exclude") -> "SettlementIndex":
+        """由结算表构建索引"""
+        return cls(settle[id_col], settle[amount_col], policy)
+
+    @property
+    def duplicate_orders(self) -> int:
+        """多行结算的订单数"""
+        return int((self.row_counts > 1).sum())
+
+    def lookup(self, order_ids: Union[pd.Series, np.ndarray]) -> np.ndarray:
+        """
+        查找订单行的结算金额
+
+        Args:
+            order_ids: 订单行的订单号
+
+        Returns:
+            与输入等长的float数组，没有结算（或按 exclude 策略排除）的订单为NaN
+        """
+        # 已索引订单号在前、待查订单号在后一起编码：已索引订单号互不相同，编码即为其位置，
+        # 待查订单号的编码小于索引长度即为命中（比 Index.get_indexer 逐个哈希字符串更快）
+        n = len(self.order_ids)
+        codes, _ = pd.factorize(pd.concat([pd.Series(self.order_ids, dtype=object if n == 0 else None),
+                                           normalize_order_ids(order_ids)], ignore_index=True))
+        positions = codes[n:]
+        positions = np.where(positions < n, positions, -1)
+        result = np.full(len(positions), np.nan)
+        found = positions >= 0
+        result[found] = self.amounts[positions[found]]
+        return result
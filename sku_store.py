@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sku_store.py
+------------------------------------------------
+本地分析数据库（SQLite，各地区共用一套表结构）
+- 每次分析的标准化订单行、结算行和产品消耗行作为一个批次写入数据库文件，
+  按 order_id、SKU 建索引；订单行可以分块写入（分块模式下每块计算完即写入），批次在一个事务中提交
+- SKU聚合（金额、数量、订单计数）由SQL在数据库中计算，聚合不再依赖整张订单表在 pandas 中分组；
+  运营率、利润、每单利润等财务指标由分析引擎的 finalize_sku_metrics 计算，与不使用数据库时是同一套公式
+- 历史批次保留在数据库中，可直接查询任一批次或某个SKU的历史利润，无需重新上传Excel
+
+汇率和订单计数规则随批次保存，历史批次按当时的配置计算。
+
+用法: python sku_store.py <数据库文件> [--region indonesia|malaysia] [--batch N] [--sku SKU] [-o 输出.xlsx]
+"""
+
+import argparse
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from region_engine import (COUNT_COLUMNS, LINE_COLUMNS, SETTLEMENT_AMOUNT, convert_consumption,
+                           finalize_sku_metrics, line_flags, order_id_column, settlement_id_column)
+from regions import REGION_PROFILES, get_profile
+
+# 批量写入时每批行数
+INSERT_CHUNK_ROWS = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    region        TEXT NOT NULL,
+    created_at    REAL NOT NULL,
+    label         TEXT,
+    local_per_rmb REAL,
+    local_per_usd REAL,
+    order_count   TEXT
+);
+
+-- order_id / sku 不指定类型：保留原始取值（Excel中的数字SKU仍为数字），与产品消耗表按原值匹配
+CREATE TABLE IF NOT EXISTS order_lines (
+    batch_id       INTEGER NOT NULL,
+    line_no        INTEGER NOT NULL,
+    order_id,
+    sku,
+    qty            INTEGER,
+    shipped        TEXT,
+    status         TEXT,
+    is_shipped     INTEGER,
+    is_not_shipped INTEGER,
+    is_signed      INTEGER,
+    is_cancelled   INTEGER,
+    is_in_transit  INTEGER,
+    settlement     REAL,
+    operation_fee  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_lines_sku ON order_lines (batch_id, sku, order_id, line_no);
+CREATE INDEX IF NOT EXISTS idx_lines_order ON order_lines (order_id);
+
+CREATE TABLE IF NOT EXISTS settlements (
+    batch_id INTEGER NOT NULL,
+    order_id,
+    amount   REAL
+);
+CREATE INDEX IF NOT EXISTS idx_settlements_order ON settlements (order_id);
+
+CREATE TABLE IF NOT EXISTS consumption (
+    batch_id  INTEGER NOT NULL,
+    sku,
+    unit_cost REAL,
+    ads       REAL,
+    gmvmax    REAL
+);
+CREATE INDEX IF NOT EXISTS idx_consumption_sku ON consumption (batch_id, sku);
+"""
+
+# -------- SKU聚合（与 region_engine.aggregate_sku_metrics 的结果相同）--------
+# 订单数按批次的计数规则：distinct 按 (SKU, 订单) 去重，每个组合只有第一次出现的行（line_no最小）计入；
+# lines 每个有订单号的行计为一单
+SKU_AGGREGATE_SQL = """
+WITH lines AS (
+    SELECT l.batch_id, l.sku, l.qty, l.is_shipped, l.is_not_shipped, l.is_signed, l.is_cancelled,
+           l.is_in_transit, l.settlement, l.operation_fee,
+           l.order_id IS NOT NULL
+           AND (b.order_count != 'distinct'
+                OR ROW_NUMBER() OVER (PARTITION BY l.batch_id, l.sku, l.order_id ORDER BY l.line_no) = 1) AS first
+    FROM order_lines l
+    JOIN batches b ON b.batch_id = l.batch_id
+    WHERE l.batch_id IN ({batches}) AND l.sku IS NOT NULL {sku_filter}
+)
+SELECT batch_id, sku,
+       TOTAL(settlement)                                  AS settlement,
+       TOTAL(operation_fee)                               AS operation_fee,
+       SUM(CASE WHEN is_shipped THEN qty ELSE 0 END)      AS shipped_qty,
+       SUM(CASE WHEN is_signed THEN qty ELSE 0 END)       AS signed_qty,
+       TOTAL(CASE WHEN is_signed THEN settlement END)     AS signed_amount,
+       SUM(first)                                         AS orders,
+       SUM(first AND is_shipped)                          AS shipped_orders,
+       SUM(first AND is_signed)                           AS signed_orders,
+       SUM(first AND is_cancelled)                        AS cancelled_orders,
+       SUM(first AND is_cancelled AND is_not_shipped)     AS cancel_before_ship,
+       SUM(first AND is_cancelled AND is_shipped)         AS cancel_after_ship,
+       SUM(first AND is_in_transit)                       AS in_transit_orders
+FROM lines
+GROUP BY batch_id, sku
+ORDER BY batch_id, sku
+"""
+
+
+# -------- 表结构转换 --------
+def line_rows(profile: dict, order: pd.DataFrame, qty_col: str, sku_col: str, start: int = 0) -> pd.DataFrame:
+    """
+    订单行（compute_order_lines 的结果或分块模式的一块）转换为 order_lines 表结构
+
+    Args:
+        start: 第一行的行号（分块写入时为已写入的行数，SQL按行号确定 (SKU, 订单) 第一次出现的行）
+
+    Returns:
+        出库/状态在此处转换为标记列，SQL中不再解析状态文本
+    """
+    flags = line_flags(profile, order)
+    return pd.DataFrame({
+        "line_no": np.arange(start, start + len(order)),
+        "order_id": order[order_id_column(profile)].astype(object),
+        "sku": order[sku_col].astype(object),
+        "qty": order[qty_col].astype("int64"),
+        "shipped": order[LINE_COLUMNS["shipped_label"]].astype(object),
+        "status": order[LINE_COLUMNS["status_label"]].astype(object),
+        "is_shipped": flags["shipped"],
+        "is_not_shipped": flags["not_shipped"],
+        "is_signed": flags["signed"],
+        "is_cancelled": flags["cancelled"],
+        "is_in_transit": flags["in_transit"],
+        "settlement": order[LINE_COLUMNS["settlement_line"]].astype(float),
+        "operation_fee": order[LINE_COLUMNS["fee_line"]].astype(float),
+    })
+
+
+class BatchWriter:
+    """向一个批次写入数据（由 SkuStore.batch 创建，退出时整个批次一起提交）"""
+
+    def __init__(self, store: "SkuStore", batch_id: int, profile: dict):
+        self.store = store
+        self.batch_id = batch_id
+        self.profile = profile
+        self.lines = 0
+
+    def add_lines(self, order: pd.DataFrame, qty_col: str, sku_col: str) -> None:
+        """写入订单行（可多次调用，按调用顺序编行号）"""
+        rows = line_rows(self.profile, order, qty_col, sku_col, start=self.lines)
+        self.store._insert("order_lines", self.batch_id, rows)
+        self.lines += len(order)
+
+    def add_inputs(self, settle: pd.DataFrame, cost: pd.DataFrame, sku_col: str) -> None:
+        """
+        写入结算行和产品消耗行
+
+        Args:
+            settle: normalize_settlements 处理后的结算表
+            cost: normalize_consumption 处理后的产品成本（本币）
+        """
+        self.store._insert("settlements", self.batch_id, pd.DataFrame({
+            "order_id": settle[settlement_id_column(self.profile)].astype(object),
+            "amount": settle[SETTLEMENT_AMOUNT].astype(float),
+        }))
+        self.store._insert("consumption", self.batch_id, pd.DataFrame({
+            "sku": cost[sku_col].astype(object),
+            "unit_cost": cost["unit_cost"].astype(float),
+            "ads": cost["ads"].astype(float),
+            "gmvmax": cost["gmvmax"].astype(float),
+        }))
+
+
+class SkuStore:
+    """SQLite分析数据库：写入批次数据，用SQL计算SKU聚合"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self) -> "SkuStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _insert(self, table: str, batch_id: int, df: pd.DataFrame) -> None:
+        """按块写入（不提交，由批次的事务统一提交）；缺失值写为NULL"""
+        columns = ["batch_id", *df.columns]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        for start in range(0, len(df), INSERT_CHUNK_ROWS):
+            part = df.iloc[start:start + INSERT_CHUNK_ROWS].astype(object)
+            part = part.where(part.notna(), None)
+            self.conn.executemany(sql, ((batch_id, *row) for row in part.itertuples(index=False, name=None)))
+
+    @contextmanager
+    def batch(self, profile: dict, label: Optional[str] = None) -> Iterator[BatchWriter]:
+        """
+        新建一个批次并在一个事务中写入，正常退出时提交，出错时整个批次回滚
+
+        Args:
+            profile: 本次分析的地区配置（汇率和订单计数规则随批次保存）
+            label: 批次说明（如上传的文件名）
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO batches (region, created_at, label, local_per_rmb, local_per_usd, order_count) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (profile["name"], time.time(), label, profile["local_per_rmb"], profile["local_per_usd"],
+                 profile["order_count"]))
+            yield BatchWriter(self, cursor.lastrowid, profile)
+
+    # -------- 查询 --------
+    def batch_profile(self, batch_id: int) -> dict:
+        """批次的地区配置（汇率和订单计数规则为写入时的取值）"""
+        row = self.conn.execute("SELECT region, local_per_rmb, local_per_usd, order_count FROM batches "
+                                "WHERE batch_id = ?", (int(batch_id),)).fetchone()
+        if row is None:
+            raise ValueError(f"批次不存在: {batch_id}")
+        region, local_per_rmb, local_per_usd, order_count = row
+        return {**get_profile(region), "local_per_rmb": local_per_rmb, "local_per_usd": local_per_usd,
+                "order_count": order_count}
+
+    def sku_aggregates(self, batch_ids: Sequence[int], sku: Optional[str] = None) -> pd.DataFrame:
+        """
+        用SQL计算指定批次的SKU聚合
+
+        Returns:
+            每个 (批次, SKU) 一行（batch_id, sku 及引擎指标名），按批次和SKU排序
+        """
+        batch_ids = [int(b) for b in batch_ids]
+        if not batch_ids:
+            raise ValueError("未指定批次")
+        sql = SKU_AGGREGATE_SQL.format(batches=", ".join("?" * len(batch_ids)),
+                                       sku_filter="AND l.sku = ?" if sku is not None else "")
+        result = pd.read_sql_query(sql, self.conn, params=batch_ids + ([sku] if sku is not None else []))
+        result[COUNT_COLUMNS + ["shipped_qty", "signed_qty"]] = (
+            result[COUNT_COLUMNS + ["shipped_qty", "signed_qty"]].astype("int64"))
+        return result
+
+    def consumption(self, batch_id: int) -> pd.DataFrame:
+        """批次的产品成本（本币）: [sku, unit_cost, ads, gmvmax]"""
+        return pd.read_sql_query("SELECT sku, unit_cost, ads, gmvmax FROM consumption WHERE batch_id = ?",
+                                 self.conn, params=[int(batch_id)])
+
+    def batch_sku_metrics(self, batch_id: int, profile: Optional[dict] = None,
+                          sku: Optional[str] = None) -> pd.DataFrame:
+        """
+        单个批次的SKU财务指标（SQL聚合 + finalize_sku_metrics）
+
+        Args:
+            profile: 计算使用的地区配置，None时使用批次保存的配置
+            sku: 只查询某个SKU，None表示全部
+
+        Returns:
+            财务指标表（引擎指标名，SKU列为 sku）
+        """
+        profile = profile or self.batch_profile(batch_id)
+        sku_table = self.sku_aggregates([batch_id], sku).drop(columns="batch_id").set_index("sku")
+        return finalize_sku_metrics(profile, sku_table, convert_consumption(profile, self.consumption(batch_id)),
+                                    "sku")
+
+    def sku_metrics(self, batch_ids: Sequence[int], sku: Optional[str] = None) -> pd.DataFrame:
+        """多个批次的SKU财务指标（各批次按保存时的配置计算），首列为 batch_id"""
+        frames = [self.batch_sku_metrics(b, sku=sku).assign(batch_id=int(b)) for b in batch_ids]
+        if not frames:
+            raise ValueError("未指定批次")
+        result = pd.concat(frames, ignore_index=True)
+        return result[["batch_id", *result.columns.drop("batch_id")]]
+
+    def list_batches(self, region: Optional[str] = None) -> pd.DataFrame:
+        """列出已保存的批次"""
+        sql = "SELECT batch_id, region, datetime(created_at, 'unixepoch', 'localtime') AS created, label FROM batches"
+        params: List = []
+        if region is not None:
+            sql += " WHERE region = ?"
+            params.append(region)
+        return pd.read_sql_query(sql + " ORDER BY batch_id", self.conn, params=params)
+
+    def sku_history(self, region: str, sku: Optional[str] = None) -> pd.DataFrame:
+        """某个SKU（或全部SKU）在所有历史批次中的财务指标"""
+        batch_ids = self.list_batches(region)["batch_id"].tolist()
+        if not batch_ids:
+            return pd.DataFrame()
+        return self.sku_metrics(batch_ids, sku=sku)
+
+
+@contextmanager
+def open_batch(path: Union[str, Path], profile: dict, label: Optional[str] = None) -> Iterator[BatchWriter]:
+    """打开数据库并新建一个批次（见 SkuStore.batch），退出时提交并关闭数据库"""
+    with SkuStore(path) as store, store.batch(profile, label) as batch:
+        yield batch
+
+
+def display_metrics(profile: dict, metrics: pd.DataFrame) -> pd.DataFrame:
+    """财务指标表转换为地区的输出列名（只保留配置中有的指标）"""
+    keys = [key for key in profile["sku_names"] if key in metrics.columns]
+    ids = [col for col in ("batch_id", "sku") if col in metrics.columns]
+    return metrics[ids + keys].rename(columns=profile["sku_names"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询本地分析数据库中的SKU财务指标")
+    parser.add_argument("database", help="数据库文件")
+    parser.add_argument("--region", choices=list(REGION_PROFILES), default="indonesia")
+    parser.add_argument("--batch", type=int, help="批次ID；不指定时列出全部批次")
+    parser.add_argument("--sku", help="只查询某个SKU的历史指标")
+    parser.add_argument("-o", "--output", help="结果写入Excel文件")
+    args = parser.parse_args()
+
+    with SkuStore(args.database) as store:
+        if args.batch is not None:
+            result = display_metrics(store.batch_profile(args.batch), store.sku_metrics([args.batch], sku=args.sku))
+        elif args.sku is not None:
+            result = store.sku_history(args.region, args.sku)
+            if len(result):
+                result = display_metrics(get_profile(args.region), result)
+        else:
+            result = store.list_batches(args.region)
+
+    if args.output:
+        result.to_excel(args.output, index=False)
+        print(f"✅ 已写出 {len(result)} 行到 {args.output}")
+    else:
+        with pd.option_context("display.max_columns", None, "display.width", 200):
+            print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
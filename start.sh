@@ -30,10 +30,19 @@ done
 
 echo "✅ 所有依赖已就绪"
 echo ""
-echo "🚀 启动Web服务器..."
-echo "📊 访问地址: http://localhost:8080"
+# 启动模式: prod（默认，gunicorn / waitress 多worker）或 dev（Flask开发服务器）
+MODE=${1:-${MODE:-prod}}
+
+echo "🚀 启动Web服务器（$MODE）..."
+echo "📊 访问地址: http://localhost:${PORT:-8080}"
 echo "💡 使用 Ctrl+C 停止服务器"
 echo ""
 
-# 启动Flask应用
-python app.py 
\ No newline at end of file
+if [ "$MODE" = "dev" ]; then
+    python app.py
+elif command -v gunicorn &> /dev/null; then
+    exec gunicorn -c gunicorn.conf.py wsgi:app
+else
+    # Windows 等无 gunicorn 的环境使用 waitress
+    exec python wsgi.py
+fi 
\ No newline at end of file
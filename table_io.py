@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+table_io.py
+------------------------------------------------
+表格文件读写层（印尼 / 马来模块共用）
+- Excel读取引擎可插拔：优先 python-calamine，未安装时回退到 openpyxl 只读流式读取
+- 通过 skiprows 在解析阶段跳过注释行，不再先把整张表物化成 Python 列表
+- 通过 usecols 只加载流程需要的列
+- 多文件并行解析（进程池），保持输入顺序并逐个文件汇报失败
+- 结果工作簿写出：openpyxl 或 xlsxwriter 流式写出（constant_memory，逐行落盘）
+- 列式结果输出：按工作表打包的 Parquet / gzip CSV（zip），跳过Excel序列化
+- 输入既可以是文件路径，也可以是已打开的二进制文件对象（上传流、BytesIO），
+  结果也可以直接写入内存缓冲区，整个流程不落盘
+"""
+
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+# 读取引擎: auto（默认，自动选择最快的可用引擎）/ calamine / openpyxl
+# 可通过环境变量 EXCEL_READ_ENGINE 覆盖
+EXCEL_READ_ENGINE = os.environ.get("EXCEL_READ_ENGINE", "auto")
+
+# 并行解析的进程数，None/未配置时使用CPU核数；1 表示逐个文件顺序解析
+# 可通过环境变量 EXCEL_READ_WORKERS 覆盖
+EXCEL_READ_WORKERS = int(os.environ["EXCEL_READ_WORKERS"]) if os.environ.get("EXCEL_READ_WORKERS") else None
+
+# 写出引擎: auto（默认，已安装 xlsxwriter 时使用流式写出）/ xlsxwriter / openpyxl
+# 可通过环境变量 EXCEL_WRITE_ENGINE 覆盖，也可按次通过 writer_engine 参数指定
+EXCEL_WRITE_ENGINE = os.environ.get("EXCEL_WRITE_ENGINE", "auto")
+
+# 流式写出时每批转换的行数
+WRITE_CHUNK_ROWS = 10_000
+
+# 分块读取时每块的默认行数
+READ_CHUNK_ROWS = 100_000
+
+# Excel错误值（openpyxl 按值读取时为字符串），按 pandas 的处理转为空值
+EXCEL_ERROR_VALUES = frozenset({"#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A"})
+
+# 结果输出格式 -> 文件扩展名
+# parquet / csv.gz 为 zip 包，每个工作表一个成员文件（<工作表名>.parquet / <工作表名>.csv.gz）
+OUTPUT_FORMATS = {
+    "xlsx": ".xlsx",
+    "parquet": ".parquet.zip",
+    "csv.gz": ".csv.zip",
+}
+
+# 文件路径，或可 seek 的二进制文件对象（如 werkzeug 上传流、BytesIO）
+ExcelSource = Union[str, Path, BinaryIO]
+# 输出目录，或可写的二进制缓冲区（结果直接写入内存）
+OutputTarget = Union[str, Path, BinaryIO]
+UseCols = Optional[Union[Sequence[str], Callable[[str], bool]]]
+# 已解析的表也可直接作为输入（如批量运行时多个店铺共用的产品消耗表只解析一次），
+# attrs["source_name"] 为日志中显示的文件名
+TableSource = Union[ExcelSource, pd.DataFrame]
+
+
+def is_path(source) -> bool:
+    """source 是否为文件路径（而不是文件对象）"""
+    return isinstance(source, (str, os.PathLike))
+
+
+def source_name(source: ExcelSource) -> str:
+    """日志和报错中显示的文件名；文件对象优先使用上传文件名"""
+    if isinstance(source, pd.DataFrame):
+        return source.attrs.get("source_name", "<已解析的表>")
+    if is_path(source):
+        return Path(source).name
+    for attr in ("filename", "name"):
+        name = getattr(source, attr, None)
+        if isinstance(name, str) and name:
+            return Path(name).name
+    return "<内存文件>"
+
+
+def target_name(target: OutputTarget) -> str:
+    """日志中显示的输出位置：文件路径，或写入内存缓冲区时的说明"""
+    return str(target) if is_path(target) else "<内存缓冲区>"
+
+
+def rewind(source: ExcelSource) -> ExcelSource:
+    """文件对象可能被读取过（计算哈希、读取表头），解析前回到开头"""
+    if not is_path(source):
+        source.seek(0)
+    return source
+
+
+class NamedBytesIO(io.BytesIO):
+    """带文件名的内存文件，可被pickle后传给解析进程"""
+
+    def __init__(self, data: bytes = b"", filename: Optional[str] = None):
+        super().__init__(data)
+        self.filename = filename
+
+
+def picklable_source(source: ExcelSource) -> ExcelSource:
+    """进程池只能传递可pickle的参数：文件路径原样返回，其他文件对象读成 NamedBytesIO"""
+    if is_path(source) or isinstance(source, io.BytesIO):
+        return source
+    return NamedBytesIO(rewind(source).read(), filename=source_name(source))
+
+
+@lru_cache(maxsize=None)
+def xlsxwriter_available() -> bool:
+    """是否安装了 xlsxwriter"""
+    try:
+        import xlsxwriter  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def calamine_available() -> bool:
+    """是否安装了 python-calamine"""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_read_engine(engine: Optional[str] = None) -> Optional[str]:
+    """
+    解析实际使用的读取引擎
+
+    Args:
+        engine: 指定引擎，为None时使用 EXCEL_READ_ENGINE 配置
+
+    Returns:
+        传给 pd.read_excel 的 engine 参数；None 表示交给 pandas 按扩展名选择
+        （xlsx 为 openpyxl 只读模式）
+    """
+    engine = (engine or EXCEL_READ_ENGINE or "auto").lower()
+    if engine == "auto":
+        return "calamine" if calamine_available() else None
+    if engine == "calamine" and not calamine_available():
+        raise ValueError("未安装 python-calamine，无法使用 calamine 读取引擎")
+    return engine
+
+
+def read_excel(source: ExcelSource,
+               dtype=None,
+               usecols: UseCols = None,
+               skiprows: Optional[Sequence[int]] = None,
+               engine: Optional[str] = None) -> pd.DataFrame:
+    """
+    读取Excel文件的第一个工作表
+
+    Args:
+        source: 文件路径或二进制文件对象
+        dtype: 列类型，同 pd.read_excel
+        usecols: 需要加载的列名列表或判断函数，None表示全部列
+        skiprows: 需要跳过的行号（0为表头行）
+        engine: 读取引擎，None时使用 EXCEL_READ_ENGINE 配置
+
+    Returns:
+        读取的DataFrame
+    """
+    return pd.read_excel(rewind(source), dtype=dtype, usecols=usecols, skiprows=skiprows,
+                         engine=resolve_read_engine(engine))
+
+
+def read_header(source: ExcelSource, engine: Optional[str] = None) -> List[str]:
+    """
+    只读取第一个工作表的表头行，返回列名列表
+
+    未指定引擎时 xlsx 使用 openpyxl 只读模式流式读取首行（calamine 即使只取表头也会解析整个工作表），
+    openpyxl 无法打开的文件（如 xls）再使用配置的读取引擎
+    """
+    if engine is None:
+        try:
+            header = pd.read_excel(rewind(source), nrows=0, engine="openpyxl")
+            return [str(c) for c in header.columns]
+        except Exception:
+            pass
+    header = pd.read_excel(rewind(source), nrows=0, engine=resolve_read_engine(engine))
+    return [str(c) for c in header.columns]
+
+
+def sheet_dimensions(source: ExcelSource) -> Optional[Tuple[int, int]]:
+    """
+    第一个工作表声明的 (行数, 列数)，只读取工作表的 dimension 标记，不解析数据
+
+    Returns:
+        (行数, 列数)，文件不是xlsx或没有声明尺寸时返回None
+    """
+    try:
+        from openpyxl import load_workbook
+        book = load_workbook(rewind(source), read_only=True, keep_links=False)
+    except Exception:
+        return None
+    try:
+        sheet = book.worksheets[0]
+        rows, columns = sheet.max_row, sheet.max_column
+    finally:
+        book.close()
+        rewind(source)
+    if not rows or not columns:
+        return None
+    return rows, columns
+
+
+def _convert_value(value):
+    """单元格取值转换，与 pandas 的 openpyxl 读取器一致：空单元格为空串、错误值为空值、整数值的浮点数转为int"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str) and value in EXCEL_ERROR_VALUES:
+        return np.nan
+    return value
+
+
+class ExcelChunkReader:
+    """
+    按行分块流式读取Excel第一个工作表（openpyxl 只读模式，内存中只保留当前块）
+
+    每块与 pd.read_excel 的转换方式一致（表头、skiprows、usecols、dtype、空值、工作表中间的空行），
+    指定 usecols 时只转换需要的列；表头之外的列不读取。chunk_rows 可在迭代过程中调整（按内存上限缩小块）。
+    openpyxl 无法打开的文件（如 xls）整表读取后再分块。
+    """
+
+    def __init__(self, source: ExcelSource, chunk_rows: int = READ_CHUNK_ROWS, dtype=None,
+                 usecols: UseCols = None, skiprows: Optional[Sequence[int]] = None):
+        self.source = source
+        self.chunk_rows = chunk_rows
+        self.dtype = dtype
+        self.usecols = usecols
+        self.skiprows = frozenset(skiprows or ())
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        try:
+            from openpyxl import load_workbook
+            book = load_workbook(rewind(self.source), read_only=True, data_only=True, keep_links=False)
+        except Exception:
+            yield from self._iter_frame()
+            return
+        try:
+            sheet = book.worksheets[0]
+            sheet.reset_dimensions()
+            yield from self._iter_rows(sheet.iter_rows(values_only=True))
+        finally:
+            book.close()
+
+    def _iter_frame(self) -> Iterator[pd.DataFrame]:
+        df = read_excel(self.source, dtype=self.dtype, usecols=self.usecols, skiprows=sorted(self.skiprows))
+        start = 0
+        while start < len(df) or start == 0:
+            yield df.iloc[start:start + self.chunk_rows].reset_index(drop=True)
+            start += self.chunk_rows
+
+    def _select(self, header: list) -> List[int]:
+        """需要转换的列位置（按表头名称判断 usecols）"""
+        if self.usecols is None:
+            return list(range(len(header)))
+        if callable(self.usecols):
+            return [i for i, name in enumerate(header) if self.usecols(name)]
+        wanted = set(self.usecols)
+        return [i for i, name in enumerate(header) if name in wanted]
+
+    def _iter_rows(self, rows) -> Iterator[pd.DataFrame]:
+        header, positions = None, None
+        chunk: List[list] = []
+        blank_rows = 0
+        emitted = False
+        for number, row in enumerate(rows):
+            if number in self.skiprows:
+                continue
+            values = [_convert_value(v) for v in row]
+            while values and values[-1] == "":
+                values.pop()
+            if header is None:
+                header = values
+                positions = self._select(header)
+                continue
+            if not values:
+                # 空行只有在后面还有数据时才保留（与 pandas 去掉末尾空行一致）
+                blank_rows += 1
+                continue
+            if blank_rows:
+                chunk.extend([[""] * len(positions)] * blank_rows)
+                blank_rows = 0
+            values += [""] * (len(header) - len(values))
+            chunk.append([values[i] for i in positions])
+            if len(chunk) >= self.chunk_rows:
+                yield self._parse(header, positions, chunk)
+                chunk = []
+                emitted = True
+        # 最后一块；没有数据行时返回只有表头的空表
+        if header is not None and (chunk or not emitted):
+            yield self._parse(header, positions, chunk)
+
+    def _parse(self, header: list, positions: List[int], rows: List[list]) -> pd.DataFrame:
+        names = [header[i] for i in positions]
+        return TextParser([names] + rows, header=0, dtype=self.dtype, skip_blank_lines=False).read()
+
+
+class FileReadError(ValueError):
+    """一个或多个文件解析失败，failures 为 (文件, 异常) 列表"""
+
+    def __init__(self, label: str, failures: List[Tuple[ExcelSource, BaseException]]):
+        self.label = label
+        self.failures = failures
+        details = "; ".join(f"{source_name(src)}: {exc}" for src, exc in failures)
+        super().__init__(f"{len(failures)} 个{label}读取失败 - {details}")
+
+
+def resolve_workers(workers: Optional[int], n_files: int) -> int:
+    """根据配置和文件数确定实际使用的进程数"""
+    if workers is None:
+        workers = EXCEL_READ_WORKERS or os.cpu_count() or 1
+    return max(1, min(workers, n_files))
+
+
+@lru_cache(maxsize=None)
+def pool_context() -> multiprocessing.context.BaseContext:
+    """
+    解析进程池的启动方式
+
+    分析在后台任务线程中运行，fork 会把其他线程持有的锁原样复制到子进程中（可能死锁），
+    因此子进程由 forkserver 从干净的服务进程派生（不支持时使用 spawn）。
+    服务进程预先导入 pandas，子进程不需要重新导入。
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["pandas", __name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def read_files(reader: Callable[[ExcelSource], pd.DataFrame],
+               sources: Sequence[ExcelSource],
+               workers: Optional[int] = None,
+               label: str = "文件") -> List[pd.DataFrame]:
+    """
+    使用进程池并行解析多个文件
+
+    Args:
+        reader: 单文件读取函数（必须可被pickle，即模块级函数或其partial）
+        sources: 文件列表（路径或文件对象；多进程解析时文件对象先读入内存再传给子进程）
+        workers: 进程数，None时使用 EXCEL_READ_WORKERS 配置或CPU核数
+        label: 日志和报错中使用的文件类别名称
+
+    Returns:
+        与 sources 顺序一致的DataFrame列表
+
+    Raises:
+        FileReadError: 任一文件解析失败时，汇总所有失败文件后抛出
+    """
+    sources = list(sources)
+    workers = resolve_workers(workers, len(sources))
+    results: List[Optional[pd.DataFrame]] = [None] * len(sources)
+    failures = []
+
+    if workers <= 1:
+        for i, src in enumerate(sources):
+            try:
+                results[i] = reader(src)
+            except Exception as e:
+                failures.append((i, e))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+            futures = {pool.submit(reader, picklable_source(src)): i for i, src in enumerate(sources)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    failures.append((i, e))
+
+    if failures:
+        failures.sort(key=lambda item: item[0])
+        for i, e in failures:
+            print(f"❌ 读取{label}失败 {source_name(sources[i])}: {e}")
+        raise FileReadError(label, [(sources[i], e) for i, e in failures])
+
+    for src, df in zip(sources, results):
+        print(f"✅ 已读取{label}: {source_name(src)} ({len(df)} 行)")
+    return results
+
+
+def resolve_write_engine(engine: Optional[str] = None) -> str:
+    """解析实际使用的写出引擎"""
+    engine = (engine or EXCEL_WRITE_ENGINE or "auto").lower()
+    if engine == "auto":
+        return "xlsxwriter" if xlsxwriter_available() else "openpyxl"
+    if engine not in ("xlsxwriter", "openpyxl"):
+        raise ValueError(f"不支持的Excel写出引擎: {engine}")
+    if engine == "xlsxwriter" and not xlsxwriter_available():
+        raise ValueError("未安装 xlsxwriter，无法使用流式写出引擎")
+    return engine
+
+
+def _cell_values(column: pd.Series) -> list:
+    """把一列转换为可直接写入单元格的Python对象，缺失值转为None（空单元格）"""
+    if pd.api.types.is_datetime64_any_dtype(column):
+        values = column.dt.tz_localize(None) if column.dt.tz is not None else column
+        return [None if pd.isna(v) else v.to_pydatetime() for v in values]
+    values = column.astype(object)
+    return values.where(column.notna(), None).tolist()
+
+
+def _write_sheets_xlsxwriter(sheets: Dict[str, pd.DataFrame], output_path: OutputTarget) -> None:
+    """使用 xlsxwriter constant_memory 模式逐行写出，内存占用与行数无关"""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(str(output_path) if is_path(output_path) else output_path, {
+        "constant_memory": True,
+        "nan_inf_to_errors": True,
+        "strings_to_numbers": False,
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    })
+    # 与 pandas 默认表头样式一致
+    header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    try:
+        for sheet_name, df in sheets.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            header = [c if isinstance(c, (int, float)) else str(c) for c in df.columns]
+            worksheet.write_row(0, 0, header, header_format)
+
+            # constant_memory 模式要求按行顺序写入，分批把列转换为行
+            for start in range(0, len(df), WRITE_CHUNK_ROWS):
+                chunk = df.iloc[start:start + WRITE_CHUNK_ROWS]
+                columns = [_cell_values(chunk.iloc[:, i]) for i in range(chunk.shape[1])]
+                for offset, row in enumerate(zip(*columns), start=start + 1):
+                    worksheet.write_row(offset, 0, row)
+    finally:
+        workbook.close()
+
+
+def write_excel_sheets(sheets: Dict[str, pd.DataFrame],
+                       output_path: OutputTarget,
+                       engine: Optional[str] = None) -> OutputTarget:
+    """
+    把多个DataFrame按顺序写入同一个工作簿（不写索引）
+
+    Args:
+        sheets: 工作表名称 -> DataFrame（按字典顺序写出）
+        output_path: 输出文件路径或可写的二进制缓冲区
+        engine: 写出引擎，None时使用 EXCEL_WRITE_ENGINE 配置
+
+    Returns:
+        输出文件路径（Path）或传入的缓冲区
+    """
+    engine = resolve_write_engine(engine)
+    if engine == "xlsxwriter":
+        _write_sheets_xlsxwriter(sheets, output_path)
+    else:
+        with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
+            for sheet_name, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return Path(output_path) if is_path(output_path) else output_path
+
+
+def _parquet_bytes(df: pd.DataFrame) -> bytes:
+    """把DataFrame序列化为Parquet；混合类型的object列转为字符串后重试"""
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, index=False)
+    except Exception:
+        mixed = {c: "string" for c in df.columns if df[c].dtype == object}
+        buffer = io.BytesIO()
+        df.astype(mixed).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _csv_gz_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, compression={"method": "gzip", "mtime": 0})
+    return buffer.getvalue()
+
+
+def write_sheet_bundle(sheets: Dict[str, pd.DataFrame],
+                       output_path: OutputTarget,
+                       output_format: str) -> OutputTarget:
+    """
+    把每个工作表写成独立的 Parquet 或 gzip CSV 文件并打包为 zip
+
+    Args:
+        sheets: 工作表名称 -> DataFrame
+        output_path: 输出zip路径或可写的二进制缓冲区
+        output_format: parquet 或 csv.gz
+
+    Returns:
+        输出文件路径（Path）或传入的缓冲区
+    """
+    if output_format == "parquet":
+        serialize, suffix = _parquet_bytes, ".parquet"
+    elif output_format == "csv.gz":
+        serialize, suffix = _csv_gz_bytes, ".csv.gz"
+    else:
+        raise ValueError(f"不支持的打包格式: {output_format}")
+
+    # 成员文件本身已压缩，zip 只做存储
+    with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_STORED) as bundle:
+        for sheet_name, df in sheets.items():
+            bundle.writestr(f"{sheet_name}{suffix}", serialize(df))
+    return Path(output_path) if is_path(output_path) else output_path
+
+
+def write_result(sheets: Dict[str, pd.DataFrame],
+                 output_dir: OutputTarget,
+                 stem: str,
+                 output_format: str = "xlsx",
+                 writer_engine: Optional[str] = None) -> OutputTarget:
+    """
+    按指定格式写出分析结果
+
+    Args:
+        sheets: 工作表名称 -> DataFrame
+        output_dir: 输出目录；传入可写的二进制缓冲区（如 BytesIO）时结果直接写入缓冲区
+        stem: 输出文件名（不含扩展名）
+        output_format: xlsx / parquet / csv.gz
+        writer_engine: xlsx 写出引擎
+
+    Returns:
+        输出文件路径（Path）或传入的缓冲区
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}，可选: {', '.join(OUTPUT_FORMATS)}")
+    output_path = Path(output_dir) / f"{stem}{OUTPUT_FORMATS[output_format]}" if is_path(output_dir) else output_dir
+    if output_format == "xlsx":
+        return write_excel_sheets(sheets, output_path, engine=writer_engine)
+    return write_sheet_bundle(sheets, output_path, output_format)
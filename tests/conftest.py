@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：把项目根目录和 benchmarks/（合成数据生成器）加入导入路径，关闭解析缓存；
+web_app 夹具导入 Flask 应用（缓存、任务、状态目录指向临时目录）
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+# 测试不读写项目目录下的解析缓存
+os.environ["PARSE_CACHE_DIR"] = ""
+
+
+@pytest.fixture(scope="session")
+def web_app(tmp_path_factory):
+    """app 模块（首次使用时导入：结果缓存、任务、增量状态、剖析目录均在临时目录，不预加载分析模块）"""
+    root = tmp_path_factory.mktemp("app")
+    with pytest.MonkeyPatch.context() as patch:
+        for name in ("RESULT_CACHE_DIR", "JOB_DIR", "INCREMENTAL_STATE_DIR", "PROFILE_DIR"):
+            patch.setenv(name, str(root / name.lower()))
+        patch.setenv("ANALYSIS_PRELOAD", "off")
+        patch.setenv("ANALYSIS_MEMORY_BUDGET_MB", "4096")
+        import app
+        yield app
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存准入调度（admission.AdmissionScheduler）：公平排队、防饥饿、超预算任务独占、执行池容量、按worker分配预算
+"""
+
+import threading
+import time
+
+from admission import AdmissionScheduler, get_scheduler
+from jobs import FINISHED, JobManager
+
+
+class Recorder:
+    """记录准入顺序的假 start 回调"""
+
+    def __init__(self, scheduler: AdmissionScheduler):
+        self.scheduler = scheduler
+        self.started = []
+        self.tickets = {}
+
+    def submit(self, name: str, owner: str, estimate_mb: float, pool=None):
+        ticket = self.scheduler.submit(owner, estimate_mb, lambda t: self.started.append(name), name, pool)
+        self.tickets[name] = ticket
+        return ticket
+
+    def release(self, name: str):
+        self.scheduler.release(self.tickets[name])
+
+
+def test_owner_with_fewer_running_jobs_goes_first():
+    jobs = Recorder(AdmissionScheduler(100))
+    for name in ("a1", "a2", "a3"):
+        jobs.submit(name, "A", 40)
+    jobs.submit("b1", "B", 40)
+    assert jobs.started == ["a1", "a2"]
+    # A 仍有一个任务在运行，B 没有：B 的任务先于 A 的第三个任务
+    jobs.release("a1")
+    assert jobs.started == ["a1", "a2", "b1"]
+    jobs.release("a2")
+    assert jobs.started == ["a1", "a2", "b1", "a3"]
+
+
+def test_least_recently_admitted_owner_breaks_ties():
+    jobs = Recorder(AdmissionScheduler(100))
+    jobs.submit("a1", "A", 60)
+    jobs.submit("a2", "A", 60)
+    jobs.submit("b1", "B", 60)
+    jobs.submit("c1", "C", 60)
+    for name in ("a1", "b1", "c1"):
+        jobs.release(name)
+    assert jobs.started == ["a1", "b1", "c1", "a2"]
+
+
+def test_starved_head_blocks_smaller_jobs():
+    jobs = Recorder(AdmissionScheduler(100, starvation_seconds=60))
+    jobs.submit("running", "R", 50)
+    big = jobs.submit("big", "X", 80)
+    # 没有等待过久的任务时，放得下的小任务可以插队
+    jobs.submit("small1", "S", 30)
+    assert jobs.started == ["running", "small1"]
+    jobs.release("small1")
+
+    big.enqueued_at = time.time() - 120
+    jobs.submit("small2", "S", 30)
+    assert jobs.started == ["running", "small1"]
+    jobs.release("running")
+    assert jobs.started == ["running", "small1", "big"]
+    jobs.release("big")
+    assert jobs.started == ["running", "small1", "big", "small2"]
+
+
+def test_estimate_larger_than_budget_runs_alone():
+    jobs = Recorder(AdmissionScheduler(100))
+    jobs.submit("small", "A", 10)
+    jobs.submit("huge", "B", 500)
+    assert jobs.started == ["small"]
+    jobs.release("small")
+    assert jobs.started == ["small", "huge"]
+    jobs.submit("small2", "A", 10)
+    # 超预算任务运行时不再准入其他任务
+    assert jobs.scheduler.snapshot()["queued"] == 1
+    jobs.release("huge")
+    assert jobs.started == ["small", "huge", "small2"]
+
+
+def test_pool_limit_keeps_extra_jobs_queued_without_reserving_budget():
+    scheduler = AdmissionScheduler(1000)
+    scheduler.set_pool_limit("jobs", 1)
+    jobs = Recorder(scheduler)
+    jobs.submit("job1", "A", 100, pool="jobs")
+    jobs.submit("job2", "B", 100, pool="jobs")
+    jobs.submit("sync", "C", 100)
+    assert jobs.started == ["job1", "sync"]
+    assert scheduler.snapshot()["reserved_mb"] == 200
+    jobs.release("job1")
+    assert jobs.started == ["job1", "sync", "job2"]
+
+
+def test_starved_job_waiting_for_its_pool_does_not_block_others():
+    scheduler = AdmissionScheduler(1000, starvation_seconds=60)
+    scheduler.set_pool_limit("jobs", 1)
+    jobs = Recorder(scheduler)
+    jobs.submit("job1", "A", 100, pool="jobs")
+    waiting = jobs.submit("job2", "B", 100, pool="jobs")
+    waiting.enqueued_at = time.time() - 120
+    jobs.submit("sync", "C", 100)
+    assert jobs.started == ["job1", "sync"]
+
+
+def test_budget_is_split_across_workers(monkeypatch):
+    monkeypatch.setenv("ANALYSIS_MEMORY_BUDGET_MB", "1000")
+    monkeypatch.delenv("WEB_WORKERS", raising=False)
+    assert get_scheduler().budget_mb == 1000
+    monkeypatch.setenv("WEB_WORKERS", "4")
+    assert get_scheduler().budget_mb == 250
+
+
+def test_job_manager_admits_at_most_max_workers_jobs(tmp_path):
+    scheduler = AdmissionScheduler(10_000)
+    manager = JobManager(tmp_path, max_workers=1, scheduler=scheduler)
+    release = threading.Event()
+
+    def runner(job):
+        release.wait(timeout=30)
+        path = job.work_dir / "result.txt"
+        path.write_text("ok")
+        return path, "result.txt"
+
+    jobs = [manager.create_job("indonesia") for _ in range(3)]
+    for i, job in enumerate(jobs):
+        manager.submit(job, runner, owner=f"shop{i}", estimate_mb=100)
+    state = scheduler.snapshot()
+    assert (state["running"], state["queued"], state["reserved_mb"]) == (1, 2, 100)
+
+    # 同步请求不被排队中的后台任务阻挡
+    with scheduler.admit("sync", 100) as ticket:
+        assert ticket.admitted_at is not None
+
+    release.set()
+    deadline = time.time() + 30
+    while time.time() < deadline and not all(job.status == FINISHED for job in jobs):
+        time.sleep(0.05)
+    assert all(job.status == FINISHED for job in jobs)
+    assert scheduler.snapshot()["reserved_mb"] == 0
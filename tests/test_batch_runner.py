@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量分析（batch_runner）：清单检查产品消耗表是否存在；共用产品消耗表解析失败只影响用到它的店铺
+"""
+
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from batch_runner import load_manifest, run_batch
+
+FIXTURES = Path(__file__).parent / "fixtures" / "parity"
+
+
+def write_manifest(tmp_path: Path, shops: list) -> Path:
+    for region in ("indonesia", "malaysia"):
+        shutil.copytree(FIXTURES / region, tmp_path / region)
+    manifest = tmp_path / "清单.json"
+    manifest.write_text(json.dumps({"output_dir": "out", "shops": shops}, ensure_ascii=False), encoding="utf-8")
+    return manifest
+
+
+def shop(name: str, region: str, consumption: str) -> dict:
+    return {"name": name, "region": region, "orders": [f"{region}/{region}_orders_*.xlsx"],
+            "settlements": [f"{region}/{region}_settlements.xlsx"], "consumption": consumption}
+
+
+def test_missing_consumption_file_is_a_manifest_error(tmp_path):
+    manifest = write_manifest(tmp_path, [shop("跑6", "indonesia", "indonesia/不存在.xlsx")])
+    with pytest.raises(FileNotFoundError, match="跑6"):
+        load_manifest(manifest)
+
+
+def test_unreadable_shared_consumption_fails_only_its_shops(tmp_path):
+    manifest = write_manifest(tmp_path, [
+        shop("跑6", "indonesia", "indonesia/indonesia_consumption.xlsx"),
+        shop("马7", "malaysia", "broken.xlsx"),
+        shop("马8", "malaysia", "broken.xlsx"),
+    ])
+    (tmp_path / "broken.xlsx").write_bytes(b"not a workbook")
+    shops, settings = load_manifest(manifest)
+
+    summary = run_batch(shops, settings["output_dir"], workers=1).set_index("店铺")
+    assert summary.loc["跑6", "状态"] == "成功"
+    for name in ("马7", "马8"):
+        assert summary.loc[name, "状态"] == "失败"
+        assert "产品消耗表" in summary.loc[name, "错误"]
+    assert (settings["output_dir"] / "批量分析汇总.xlsx").exists()
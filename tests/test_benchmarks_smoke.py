@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能测试脚本的冒烟测试：每个脚本按极小规模完整运行一次（各脚本自带的结果一致性校验同时执行）
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BENCHMARKS = Path(__file__).resolve().parent.parent / "benchmarks"
+
+# 脚本 -> 极小规模的参数
+SCRIPTS = {
+    "synthetic_data.py": ["--rows", "200", "--skus", "20", "--order-files", "2", "-o", "synthetic"],
+    "bench_combo_sku.py": ["--sizes", "500", "--legacy-max-rows", "500"],
+    "bench_settlement_index.py": ["--sizes", "500"],
+    "bench_sku_metrics.py": ["--rows", "500", "--skus", "50"],
+    "bench_stages.py": ["--scales", "300", "--repeat", "1", "--skus", "20", "--save", "stages.json"],
+    "bench_scenarios.py": ["--rows", "300", "--scenarios", "1", "3"],
+    "bench_memory.py": ["--rows", "300", "--memory-limit-mb", "1024"],
+    "bench_xlsx_writer.py": ["--rows", "300"],
+    "bench_startup.py": ["--repeat", "1"],
+    "calibrate_admission.py": ["--rows", "200", "400"],
+    "check_outputs.py": ["--rows", "300", "--only", "indonesia_exclude,malaysia_latest", "--save", "reference",
+                         "--compare", "reference"],
+}
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_benchmark_runs(script, tmp_path):
+    result = subprocess.run([sys.executable, str(BENCHMARKS / script), *SCRIPTS[script]],
+                            cwd=tmp_path, capture_output=True, text=True, timeout=300,
+                            env={**os.environ, "PARSE_CACHE_DIR": ""})
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-2000:]
+
+
+def test_every_benchmark_is_covered():
+    assert {path.name for path in BENCHMARKS.glob("*.py")} == set(SCRIPTS)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+表头校验（region_engine.sniff_input_headers）：放错位置或缺列的文件在解析任何文件之前报错，
+/process 返回400和每个文件的问题
+"""
+
+import contextlib
+import io
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import region_engine
+from region_engine import HeaderValidationError, run_region, sniff_input_headers
+from regions import get_profile
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "parity"
+ORDERS = [FIXTURES / "malaysia" / "malaysia_orders_1.xlsx", FIXTURES / "malaysia" / "malaysia_orders_2.xlsx"]
+SETTLEMENTS = [FIXTURES / "malaysia" / "malaysia_settlements.xlsx"]
+CONSUMPTION = FIXTURES / "malaysia" / "malaysia_consumption.xlsx"
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """记录订单表、结算表、产品消耗表的完整解析调用"""
+    calls = []
+
+    def spy(name, original):
+        def wrapper(*args, **kwargs):
+            calls.append(name)
+            return original(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(region_engine, "read_files", spy("read_files", region_engine.read_files))
+    monkeypatch.setattr(region_engine, "read_consumption_file",
+                        spy("read_consumption_file", region_engine.read_consumption_file))
+    return calls
+
+
+@pytest.fixture
+def settlement_without_id(tmp_path):
+    path = tmp_path / "结算_无订单号.xlsx"
+    pd.read_excel(SETTLEMENTS[0]).drop(columns="Order/adjustment ID").to_excel(path, index=False)
+    return path
+
+
+def test_valid_headers_resolve_key_columns():
+    with contextlib.redirect_stdout(io.StringIO()):
+        schema = sniff_input_headers(get_profile("malaysia"), ORDERS, SETTLEMENTS)
+    assert schema["order_columns"] == ["Quantity", "Seller SKU", "Shipped Time", "Order Status"]
+    assert schema["settlement_usecols"]("Total settlement amount")
+    assert not schema["settlement_usecols"]("Statement date")
+
+
+def test_all_problems_reported_at_once(settlement_without_id):
+    with pytest.raises(HeaderValidationError) as error, contextlib.redirect_stdout(io.StringIO()):
+        # 结算表放进了订单位置；另一个结算表缺少订单号列
+        sniff_input_headers(get_profile("malaysia"), [ORDERS[0], SETTLEMENTS[0]], [settlement_without_id])
+    problems = error.value.problems
+    assert len(problems) == 2
+    assert problems[0].startswith("订单文件 malaysia_settlements.xlsx: 缺少")
+    assert "结算_无订单号.xlsx" in problems[1] and "订单号列" in problems[1]
+
+
+def test_run_fails_before_parsing(parses, tmp_path):
+    with pytest.raises(HeaderValidationError), contextlib.redirect_stdout(io.StringIO()):
+        run_region("malaysia", [SETTLEMENTS[0]], SETTLEMENTS, CONSUMPTION, output_dir=tmp_path, workers=1)
+    assert parses == []
+    # 表头正确时才解析
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_region("malaysia", ORDERS, SETTLEMENTS, CONSUMPTION, output_dir=tmp_path, workers=1)
+    assert parses == ["read_files", "read_files", "read_consumption_file"]
+
+
+def test_process_returns_problems(web_app, parses, settlement_without_id):
+    def upload(path):
+        return (open(path, "rb"), Path(path).name)
+
+    response = web_app.app.test_client().post("/process", data={
+        "analysis_type": "malaysia",
+        "orders": [upload(ORDERS[0]), upload(SETTLEMENTS[0])],
+        "settlements": [upload(settlement_without_id)],
+        "consumption": upload(CONSUMPTION),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 400
+    body = response.get_json()
+    assert len(body["problems"]) == 2
+    assert any("malaysia_settlements.xlsx" in problem for problem in body["problems"])
+    assert parses == []
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解析缓存：缓存键包含读取配置（加载的列、地区配置中的解析选项、读取引擎）
+"""
+
+import contextlib
+import io
+from pathlib import Path
+
+import pytest
+
+import table_io
+from region_engine import read_order_file, read_settlement_file
+from regions import INDONESIA
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "parity" / "indonesia"
+ORDERS = FIXTURES / "indonesia_orders_1.xlsx"
+SETTLEMENTS = FIXTURES / "indonesia_settlements.xlsx"
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("PARSE_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def quiet(read, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return read(*args, **kwargs)
+
+
+def test_usecols_are_part_of_the_key(cache_dir):
+    narrow = quiet(read_order_file, INDONESIA, ORDERS, low_memory=True, lean_usecols=["订单号", "sku"])
+    wide = quiet(read_order_file, INDONESIA, ORDERS, low_memory=True, lean_usecols=["订单号", "sku", "数量"])
+    assert list(narrow.columns) == ["order_id", "sku"]
+    assert list(wide.columns) == ["order_id", "sku", "数量"]
+    # 列名列表与顺序无关
+    again = quiet(read_order_file, INDONESIA, ORDERS, low_memory=True, lean_usecols=["sku", "订单号", "数量"])
+    assert list(again.columns) == list(wide.columns)
+    assert len(list(cache_dir.glob("*.parquet"))) == 2
+
+
+def test_profile_read_options_are_part_of_the_key(cache_dir):
+    everything = quiet(read_settlement_file, INDONESIA, SETTLEMENTS)
+    read = {**INDONESIA["settlement_read"], "type_column": "Type", "type_value": "refund"}
+    refunds = quiet(read_settlement_file, {**INDONESIA, "settlement_read": read}, SETTLEMENTS)
+    assert len(everything) > 0
+    assert len(refunds) == 0
+
+
+def test_read_engine_is_part_of_the_key(cache_dir, monkeypatch):
+    quiet(read_order_file, INDONESIA, ORDERS)
+    monkeypatch.setattr(table_io, "EXCEL_READ_ENGINE", "openpyxl")
+    quiet(read_order_file, INDONESIA, ORDERS)
+    expected = 2 if table_io.resolve_read_engine("auto") != "openpyxl" else 1
+    assert len(list(cache_dir.glob("*.parquet"))) == expected
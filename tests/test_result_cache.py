@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+整次分析结果缓存（result_cache）：命中、相同请求合并（线程 / 跨进程文件锁）、按大小和TTL淘汰、缓存键
+"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import result_cache
+from result_cache import META_FILE, ResultCache, result_key
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def producer(content: bytes = b"x" * 1000, calls: list = None):
+    def produce(directory: Path):
+        if calls is not None:
+            calls.append(directory)
+        path = directory / "结果.xlsx"
+        path.write_bytes(content)
+        return path, "结果.xlsx"
+    return produce
+
+
+def age(path: Path, seconds: float) -> None:
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_second_request_is_a_hit(tmp_path):
+    cache = ResultCache(tmp_path)
+    calls = []
+    entry, status = cache.get_or_compute("k", producer(b"result", calls))
+    assert status == "miss"
+    entry, status = cache.get_or_compute("k", producer(b"other", calls))
+    assert status == "hit"
+    assert len(calls) == 1
+    assert entry["result_path"].read_bytes() == b"result"
+    assert entry["download_name"] == "结果.xlsx"
+
+
+def test_concurrent_requests_compute_once(tmp_path):
+    cache = ResultCache(tmp_path)
+    started, release = threading.Event(), threading.Event()
+    waiting = threading.Semaphore(0)
+    calls, statuses = [], []
+
+    def slow(directory):
+        started.set()
+        release.wait(timeout=30)
+        return producer(calls=calls)(directory)
+
+    def request(produce):
+        statuses.append(cache.get_or_compute("k", produce, on_wait=waiting.release)[1])
+
+    first = threading.Thread(target=request, args=(slow,))
+    first.start()
+    assert started.wait(timeout=30)
+    assert cache.computing("k")
+    others = [threading.Thread(target=request, args=(producer(calls=calls),)) for _ in range(2)]
+    for thread in others:
+        thread.start()
+    for _ in others:
+        assert waiting.acquire(timeout=30)
+    release.set()
+    for thread in [first, *others]:
+        thread.join(timeout=30)
+
+    assert sorted(statuses) == ["coalesced", "coalesced", "miss"]
+    assert len(calls) == 1
+    assert not cache.computing("k")
+
+
+def test_evicts_least_recently_used_over_size_limit(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=2500)
+    for key in ("a", "b"):
+        cache.get_or_compute(key, producer())
+    age(cache.entry_dir("a"), 200)
+    age(cache.entry_dir("b"), 100)
+    # 命中刷新最近使用时间：a 比 b 新，超过上限时先淘汰 b
+    assert cache.get("a") is not None
+    cache.get_or_compute("c", producer())
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = ResultCache(tmp_path, ttl_seconds=60)
+    cache.get_or_compute("old", producer())
+    meta_path = cache.entry_dir("old") / META_FILE
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta_path.write_text(json.dumps({**meta, "created_at": meta["created_at"] - 120}), encoding="utf-8")
+
+    calls = []
+    _, status = cache.get_or_compute("old", producer(calls=calls))
+    assert status == "miss" and len(calls) == 1
+
+    # 淘汰时按目录修改时间删除过期条目
+    cache.get_or_compute("stale", producer())
+    age(cache.entry_dir("stale"), 120)
+    cache.evict()
+    assert not cache.entry_dir("stale").exists()
+    assert cache.entry_dir("old").exists()
+
+
+def test_key_depends_on_output_parameters():
+    base = dict(analysis_type="indonesia", order_hashes=["o1", "o2"], settlement_hashes=["s1"],
+                consumption_hash="c", profile={"local_per_rmb": 2300})
+    key = result_key(**base, output_format="xlsx", writer_engine="xlsxwriter")
+    assert key == result_key(**base, output_format="xlsx", writer_engine="xlsxwriter")
+    assert key != result_key(**base, output_format="csv.gz", writer_engine="xlsxwriter")
+    assert key != result_key(**base, output_format="xlsx", writer_engine="openpyxl")
+    assert key != result_key(**{**base, "order_hashes": ["o2", "o1"]}, output_format="xlsx",
+                             writer_engine="xlsxwriter")
+    assert key != result_key(**{**base, "profile": {"local_per_rmb": 2200}}, output_format="xlsx",
+                             writer_engine="xlsxwriter")
+
+
+@pytest.mark.skipif(result_cache.fcntl is None, reason="需要 fcntl 文件锁")
+def test_waits_for_computation_in_another_process(tmp_path):
+    # 子进程（另一个 worker）持有键的文件锁计算结果，本进程的相同请求等待并使用其结果
+    ready, go = tmp_path / "ready", tmp_path / "go"
+    child = subprocess.Popen([sys.executable, "-c", textwrap.dedent(f"""
+        import sys, time
+        from pathlib import Path
+        sys.path.insert(0, {str(ROOT)!r})
+        from result_cache import ResultCache
+
+        def produce(directory):
+            Path({str(ready)!r}).touch()
+            while not Path({str(go)!r}).exists():
+                time.sleep(0.02)
+            path = directory / "结果.xlsx"
+            path.write_bytes(b"from child")
+            return path, "结果.xlsx"
+
+        ResultCache({str(tmp_path / "cache")!r}).get_or_compute("k", produce)
+    """)])
+    try:
+        deadline = time.time() + 30
+        while not ready.exists() and time.time() < deadline:
+            time.sleep(0.02)
+        assert ready.exists()
+
+        cache = ResultCache(tmp_path / "cache")
+        assert cache.computing("k")
+        waited, result = threading.Event(), []
+        thread = threading.Thread(target=lambda: result.append(
+            cache.get_or_compute("k", producer(b"from parent"), on_wait=waited.set)))
+        thread.start()
+        assert waited.wait(timeout=30)
+        go.touch()
+        thread.join(timeout=30)
+        assert child.wait(timeout=30) == 0
+    finally:
+        go.touch()
+        child.wait(timeout=30)
+
+    entry, status = result[0]
+    assert status == "coalesced"
+    assert entry["result_path"].read_bytes() == b"from child"
+    assert not cache.computing("k")
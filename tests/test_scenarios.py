@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+利润场景测算（scenarios.ScenarioBase、/jobs/<id>/scenarios）：不覆盖参数的场景与原分析一致，
+覆盖汇率 / 操作费 / SKU成本的场景与按同样参数完整重跑一致
+"""
+
+import contextlib
+import io
+import time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from region_engine import run_region
+from regions import get_profile
+from scenarios import ScenarioBase
+from synthetic_data import make_indonesia_tables, make_malaysia_tables, write_inputs
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "parity"
+
+# 地区 -> (财务指标工作表, 数据生成器, 产品消耗表中的SKU列和单件成本列)
+REGIONS = {
+    "indonesia": ("sku财务指标", make_indonesia_tables, "sku", "印尼盾单sku成本"),
+    "malaysia": ("sku总结算金额和操作费", make_malaysia_tables, "Seller SKU", "单sku马来币成本"),
+}
+RESULT_KEYS = ["profit", "profit_rmb", "margin", "profit_per_order"]
+
+
+def run(region, inputs, out, **options):
+    """运行一次分析，返回以SKU为索引的财务指标工作表"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        path = run_region(region, inputs["orders"], inputs["settlements"], inputs["consumption"],
+                          output_dir=out, workers=1, **options)
+    name = region if isinstance(region, str) else region["name"]
+    frame = pd.read_excel(path, sheet_name=REGIONS[name][0])
+    return frame.set_index(frame.columns[0] if name == "malaysia" else "sku")
+
+
+def scenario_metrics(base, scenario, region):
+    """单个场景的SKU明细，列名为地区输出列名，以SKU为索引"""
+    frame = base.sku_frame([scenario]).set_index("SKU")
+    names = get_profile(region)["sku_names"]
+    return frame[[names[key] for key in RESULT_KEYS]]
+
+
+def assert_metrics_equal(actual, expected, region):
+    names = get_profile(region)["sku_names"]
+    expected = expected[~expected.index.duplicated()]
+    expected = expected.set_axis(expected.index.astype(str))[[names[key] for key in RESULT_KEYS]]
+    pd.testing.assert_frame_equal(actual.loc[expected.index], expected, rtol=1e-9, check_dtype=False,
+                                  check_names=False)
+
+
+@pytest.fixture(params=list(REGIONS))
+def analysis(request, tmp_path):
+    """原分析：输入、结果工作表和保存的场景测算数据"""
+    region = request.param
+    tables = REGIONS[region][1](600, n_skus=30, seed=5)
+    inputs = write_inputs(tables, tmp_path / "input", region)
+    (tmp_path / "base").mkdir()
+    sku = run(region, inputs, tmp_path / "base", scenario_dir=tmp_path / "scenario")
+    return region, tables, sku, ScenarioBase.load(tmp_path / "scenario")
+
+
+def test_base_scenario_reproduces_run(analysis):
+    region, _, sku, base = analysis
+    assert_metrics_equal(scenario_metrics(base, {"name": "原分析"}, region), sku, region)
+    totals = base.totals([{"name": "原分析"}])
+    names = get_profile(region)["sku_names"]
+    assert totals["人民币利润合计"].iloc[0] == pytest.approx(sku[names["profit_rmb"]].sum(), rel=1e-9)
+    assert totals["人民币利润变化"].iloc[0] == pytest.approx(0, abs=1e-6)
+
+
+def test_overrides_match_full_rerun(analysis, tmp_path):
+    region, tables, _, base = analysis
+    profile = get_profile(region)
+    _, _, sku_column, cost_column = REGIONS[region]
+    consumption = tables["consumption"]
+    changed_sku = str(consumption[sku_column].iloc[0])
+    fees = [[1, 1, 1.5], [2, 3, 3.0], [4, None, 4.0]] if profile["fee_rule"] == "order_tiers" \
+        else {sku: 4.0 for sku in profile["sku_fees"]}
+    scenario = {"name": "调整", "local_per_rmb": profile["local_per_rmb"] * 0.9, "fees": fees,
+                "unit_cost": {changed_sku: 12.5}}
+
+    # 完整重跑：同样的汇率、操作费规则和SKU成本
+    rerun_tables = {**tables, "consumption": consumption.assign(**{
+        cost_column: consumption[cost_column].where(consumption[sku_column].astype(str) != changed_sku, 12.5)})}
+    inputs = write_inputs(rerun_tables, tmp_path / "rerun_input", region)
+    (tmp_path / "rerun").mkdir()
+    fee_rule = [tuple(tier) for tier in fees] if isinstance(fees, list) else fees
+    expected = run({**profile, "local_per_rmb": scenario["local_per_rmb"]}, inputs, tmp_path / "rerun",
+                   fees=fee_rule)
+
+    assert_metrics_equal(scenario_metrics(base, scenario, region), expected, region)
+    assert abs(base.totals([scenario])["人民币利润变化"].iloc[0]) > 1
+
+
+def test_scenarios_endpoint(web_app):
+    client = web_app.app.test_client()
+    directory = FIXTURES / "indonesia"
+
+    def upload(name):
+        return (open(directory / name, "rb"), name)
+
+    response = client.post("/jobs", data={
+        "analysis_type": "indonesia",
+        "orders": [upload("indonesia_orders_1.xlsx"), upload("indonesia_orders_2.xlsx")],
+        "settlements": [upload("indonesia_settlements.xlsx")],
+        "consumption": upload("indonesia_consumption.xlsx"),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        status = client.get(f"/jobs/{job_id}").get_json()["status"]
+        if status in ("finished", "failed"):
+            break
+        time.sleep(0.1)
+    assert status == "finished"
+
+    result = pd.read_excel(io.BytesIO(client.get(f"/jobs/{job_id}/result").data), sheet_name="sku财务指标")
+    response = client.post(f"/jobs/{job_id}/scenarios",
+                           json={"scenarios": [{"name": "原分析"}, {"name": "汇率", "local_per_rmb": 2000}],
+                                 "skus": [str(result["sku"].iloc[0])]})
+    assert response.status_code == 200
+    body = response.get_json()
+    totals = {row["场景"]: row for row in body["totals"]}
+    assert totals["原分析"]["人民币利润合计"] == pytest.approx(result["人民币利润"].sum(), rel=1e-9)
+    assert totals["原分析"]["人民币利润变化"] == pytest.approx(0, abs=1e-6)
+    assert totals["汇率"]["汇率"] == 2000
+    assert {row["SKU"] for row in body["skus"]} == {str(result["sku"].iloc[0])}
+    assert body["skus"][0]["人民币利润"] == pytest.approx(result["人民币利润"].iloc[0], rel=1e-9)
+
+    workbook = client.post(f"/jobs/{job_id}/scenarios?format=xlsx", json={"scenarios": [{"name": "原分析"}]})
+    assert set(pd.read_excel(io.BytesIO(workbook.data), sheet_name=None)) == {"场景汇总", "SKU明细"}
+
+    bad = client.post(f"/jobs/{job_id}/scenarios", json={"scenarios": [{"unit_cost": {"不存在的SKU": 1}}]})
+    assert bad.status_code == 400 and "不存在的SKU" in bad.get_json()["error"]
+    assert client.post(f"/jobs/{job_id}/scenarios", json={"scenarios": []}).status_code == 400
+    assert client.post("/jobs/unknown/scenarios", json={"scenarios": [{}]}).status_code == 404
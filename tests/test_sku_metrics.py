@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sku财务指标：单次groupby（aggregate_sku_metrics + finalize_sku_metrics）与优化前实现逐列对比
+"""
+
+import numpy as np
+import pandas as pd
+
+from region_engine import LINE_COLUMNS, aggregate_sku_metrics, finalize_sku_metrics, normalize_consumption
+from regions import INDONESIA
+
+IDR_PER_RMB, IDR_PER_USD = 2300, 16000
+
+
+def order_lines() -> pd.DataFrame:
+    """
+    固定的小样本订单行：
+    - a: 同一订单两行（按 (SKU, 订单) 去重）、签收和在途
+    - b: 只有取消订单（签收订单数为0 -> 每单利润分母为0）
+    - c: 签收但结算金额为0（签收金额为0 -> 毛利率分母为0）
+    - d: 订单号缺失的行（不计入订单数）与未结算的行
+    - e: 产品消耗表中没有该SKU
+    """
+    rows = [
+        # order_id, sku, 数量, _shipped, _status, _settlement_line, _fee_line
+        ("o1", "a", 1, "yes", "delivered", 100.0, 1.0),
+        ("o1", "a", 2, "yes", "delivered", 100.0, 1.0),
+        ("o2", "a", 1, "yes", "in transit", 50.0, 2.0),
+        ("o3", "b", 1, "no", "cancelled", 0.0, 0.0),
+        ("o4", "b", 3, "yes", "cancelled", 30.0, 2.5),
+        ("o5", "c", 2, "yes", "completed", 0.0, 2.5),
+        ("o6", "c", 1, "no", "unpaid", np.nan, 0.0),
+        (np.nan, "d", 1, "yes", "delivered", 40.0, 2.0),
+        ("o7", "d", 1, "yes", "delivered", np.nan, 2.0),
+        ("o8", "e", 4, "yes", "completed", 70.0, 2.5),
+    ]
+    columns = ["order_id", "sku", "数量", LINE_COLUMNS["shipped_label"], LINE_COLUMNS["status_label"],
+               LINE_COLUMNS["settlement_line"], LINE_COLUMNS["fee_line"]]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def consumption() -> pd.DataFrame:
+    return pd.DataFrame({
+        "sku": ["a", "b", "c", "d", "f"],
+        "印尼盾单sku成本": ["10", "20", "5", "8", "1"],
+        "印尼盾ads消耗": ["1000", "0", "500", "", "7"],
+        "印尼盾gmvmax消耗": ["200", "300", "0", "100", "9"],
+    })
+
+
+def legacy_sku_metrics(order: pd.DataFrame, cons: pd.DataFrame, sku_col: str, qty_col: str) -> pd.DataFrame:
+    """优化前的实现：每个指标单独过滤、groupby/nunique 后逐个join"""
+    order = order.rename(columns={LINE_COLUMNS["settlement_line"]: "settlement_per_line",
+                                  LINE_COLUMNS["fee_line"]: "operation_fee_per_line_rmb"})
+    pair_df = order[[sku_col, "order_id", "_shipped", "_status"]].drop_duplicates([sku_col, "order_id"])
+    metrics = {
+        "订单数": pair_df.groupby(sku_col)["order_id"].nunique(),
+        "出库订单数数量": pair_df[pair_df["_shipped"] == "yes"].groupby(sku_col)["order_id"].nunique(),
+        "签收订单数": pair_df[pair_df["_status"].isin(["delivered", "completed"])]
+                     .groupby(sku_col)["order_id"].nunique(),
+        "取消订单数": pair_df[pair_df["_status"] == "cancelled"].groupby(sku_col)["order_id"].nunique(),
+        "出库前取消订单数": pair_df[(pair_df["_status"] == "cancelled") & (pair_df["_shipped"] == "no")]
+                         .groupby(sku_col)["order_id"].nunique(),
+        "出库后取消订单数": pair_df[(pair_df["_status"] == "cancelled") & (pair_df["_shipped"] == "yes")]
+                         .groupby(sku_col)["order_id"].nunique(),
+        "仍在途订单数": pair_df[pair_df["_status"] == "in transit"].groupby(sku_col)["order_id"].nunique(),
+    }
+    shipped_order = order[order["_shipped"] == "yes"]
+    delivered_order = order[order["_status"].isin(["delivered", "completed"])]
+    sku = order.groupby(sku_col).agg(
+        sku_total_settlement=("settlement_per_line", "sum"),
+        sku_total_operation_fee=("operation_fee_per_line_rmb", "sum"),
+    )
+    sku = sku.join(shipped_order.groupby(sku_col)[qty_col].sum().rename("出库数量"), how="left")
+    sku = sku.join(delivered_order.groupby(sku_col)["settlement_per_line"].sum().rename("签收金额"), how="left")
+    for k, v in metrics.items():
+        sku = sku.join(v.rename(k), how="left")
+    sku = sku.fillna(0)
+
+    sku["签收率"] = sku["签收订单数"] / sku["订单数"]
+    sku["取消率"] = sku["取消订单数"] / sku["订单数"]
+    sku["出库前取消率"] = sku["出库前取消订单数"] / sku["订单数"]
+    sku["出库后取消率"] = sku["出库后取消订单数"] / sku["订单数"]
+    sku["仍在途率"] = sku["仍在途订单数"] / sku["订单数"]
+    sku = sku.reset_index()
+
+    cons = cons.copy()
+    for c in cons.columns:
+        if c != sku_col:
+            cons[c] = pd.to_numeric(cons[c], errors="coerce")
+    cons["美金ads消耗"] = cons["印尼盾ads消耗"] / IDR_PER_USD
+    cons["美金gmvmax消耗"] = cons["印尼盾gmvmax消耗"] / IDR_PER_USD
+    cons["人民币单sku成本"] = cons["印尼盾单sku成本"] / IDR_PER_RMB
+    keep = [sku_col, "印尼盾ads消耗", "印尼盾gmvmax消耗", "美金ads消耗",
+            "美金gmvmax消耗", "印尼盾单sku成本", "人民币单sku成本"]
+    sku = sku.merge(cons[keep], on=sku_col, how="left").fillna(0)
+
+    sku["印尼盾操作费"] = sku["sku_total_operation_fee"] * IDR_PER_RMB
+    sku["印尼盾消耗"] = sku["印尼盾ads消耗"] + sku["印尼盾gmvmax消耗"]
+    sku["印尼盾产品成本"] = sku["印尼盾单sku成本"] * sku["出库数量"]
+    sku["利润"] = sku["sku_total_settlement"] - sku["印尼盾操作费"] - sku["印尼盾产品成本"] - sku["印尼盾消耗"]
+    sku["人民币利润"] = sku["利润"] / IDR_PER_RMB
+    sku["签收毛利率"] = sku["利润"] / sku["签收金额"].replace(0, np.nan)
+    sku["每单利润"] = sku["人民币利润"] / sku["签收订单数"].replace(0, np.nan)
+    return sku
+
+
+def test_single_pass_matches_legacy():
+    order, cons = order_lines(), consumption()
+    sku = aggregate_sku_metrics(INDONESIA, order, "sku", "数量")
+    sku = finalize_sku_metrics(INDONESIA, sku, normalize_consumption(INDONESIA, cons, "sku"), "sku")
+
+    sheet = next(s for s in INDONESIA["sheets"] if s.get("name") == "sku财务指标")
+    names = {"sku": "sku", **INDONESIA["sku_names"]}
+    result = sku[sheet["columns"]].rename(columns=names)
+    expected = legacy_sku_metrics(order, cons, "sku", "数量")[result.columns]
+
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    by_sku = result.set_index("sku")
+    # 分母为0的指标保持为空
+    assert by_sku.loc["b", "签收订单数"] == 0 and pd.isna(by_sku.loc["b", "每单利润"])
+    assert by_sku.loc["c", "签收金额"] == 0 and pd.isna(by_sku.loc["c", "签收毛利率"])
+    assert by_sku.loc["d", "订单数"] == 1
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地分析数据库（sku_store）：SQL聚合 + finalize_sku_metrics 与不使用数据库时的结果一致（两个地区、整表和分块写入）
+"""
+
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from region_engine import run_region
+from sku_store import SkuStore
+from synthetic_data import make_indonesia_tables, make_malaysia_tables, write_inputs
+
+ORDER_SHEETS = {"indonesia": "订单表_含结算与操作费", "malaysia": "订单表_含结算金额和操作费"}
+
+
+def make_inputs(region, tmp_path):
+    if region == "indonesia":
+        tables = make_indonesia_tables(600, n_skus=30, seed=3)
+    else:
+        # 数字和文本混合的SKU：数据库中保留原始取值，与产品消耗表按原值匹配
+        tables = make_malaysia_tables(600, n_skus=30, seed=4)
+        numeric = {sku: 10000 + i for i, sku in enumerate(tables["consumption"]["Seller SKU"][-10:])}
+        for key in ("orders", "consumption"):
+            tables[key]["Seller SKU"] = tables[key]["Seller SKU"].map(lambda s: numeric.get(s, s)).astype(object)
+    return write_inputs(tables, tmp_path / "input", region)
+
+
+def run(region, inputs, out, **options):
+    out.mkdir()
+    with contextlib.redirect_stdout(io.StringIO()):
+        path = run_region(region, inputs["orders"], inputs["settlements"], inputs["consumption"],
+                          output_dir=out, workers=1, **options)
+    return pd.read_excel(path, sheet_name=None)
+
+
+@pytest.mark.parametrize("region", ["indonesia", "malaysia"])
+def test_sql_metrics_match_engine(region, tmp_path):
+    inputs = make_inputs(region, tmp_path)
+    database = tmp_path / "analysis.db"
+    expected = run(region, inputs, tmp_path / "plain")
+    stored = run(region, inputs, tmp_path / "store", sku_store=database)
+    chunked = run(region, inputs, tmp_path / "chunked", sku_store=database, chunk_rows=37)
+
+    assert list(stored) == list(expected)
+    assert set(expected) - set(chunked) == {ORDER_SHEETS[region]}
+    for name, frame in expected.items():
+        pd.testing.assert_frame_equal(stored[name], frame, rtol=1e-9, check_dtype=False, obj=name)
+        if name in chunked:
+            pd.testing.assert_frame_equal(chunked[name], frame, rtol=1e-9, check_dtype=False, obj=name)
+
+    # 历史批次按保存的配置重新计算，整表写入和分块写入的批次结果相同
+    with SkuStore(database) as store:
+        history = store.sku_history(region)
+        assert store.list_batches(region)["batch_id"].tolist() == [1, 2]
+    first, second = (group.drop(columns="batch_id").reset_index(drop=True)
+                     for _, group in history.groupby("batch_id"))
+    pd.testing.assert_frame_equal(first, second, rtol=1e-9)
+    assert history["profit_rmb"].notna().all()
+
+
+def test_failed_run_leaves_no_batch(tmp_path, monkeypatch):
+    # 分块写入的订单行在批次提交前失败时整个批次回滚
+    def fail(*args):
+        raise RuntimeError("写入中断")
+
+    monkeypatch.setattr("sku_store.BatchWriter.add_inputs", fail)
+    inputs = make_inputs("indonesia", tmp_path)
+    database = tmp_path / "analysis.db"
+    with pytest.raises(RuntimeError, match="写入中断"):
+        run("indonesia", inputs, tmp_path / "out", sku_store=database, chunk_rows=37)
+    with SkuStore(database) as store:
+        assert store.list_batches().empty
+        assert store.conn.execute("SELECT COUNT(*) FROM order_lines").fetchone()[0] == 0
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+table_io.read_files：进程池并行解析
+"""
+
+import contextlib
+import io
+import threading
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
+
+from region_engine import read_order_file
+from regions import INDONESIA
+from table_io import read_files
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "parity" / "indonesia"
+
+
+def test_parallel_read_from_worker_thread():
+    # 分析在后台任务线程中运行：进程池在非主线程中创建，结果与串行解析一致且保持文件顺序
+    files = sorted(FIXTURES.glob("indonesia_orders_*.xlsx")) * 2
+    reader = partial(read_order_file, INDONESIA)
+    results = {}
+
+    def work():
+        with contextlib.redirect_stdout(io.StringIO()):
+            results["parallel"] = read_files(reader, files, workers=2)
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join(timeout=120)
+    assert not thread.is_alive()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        serial = read_files(reader, files, workers=1)
+    assert len(results["parallel"]) == len(files)
+    for parallel_frame, serial_frame in zip(results["parallel"], serial):
+        pd.testing.assert_frame_equal(parallel_frame, serial_frame)
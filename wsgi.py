@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WSGI入口 - 生产环境部署
+
+- gunicorn（Linux/macOS）: gunicorn -c gunicorn.conf.py wsgi:app
+- waitress（Windows 或未安装 gunicorn）: python wsgi.py
+"""
+
+import os
+
+# 在当前线程同步预热，不启动后台预加载线程（gunicorn 主进程 fork 时不应有正在导入的线程）
+os.environ.setdefault('ANALYSIS_PRELOAD', 'off')
+
+from app import app, warm_up  # noqa: E402
+
+# 导入时预热：gunicorn preload_app 下在主进程执行一次，worker fork 后直接复用
+warm_up()
+
+
+def main():
+    """用 waitress 启动多线程服务"""
+    from waitress import serve
+
+    host = os.environ.get("HOST", "0.0.0.0")
+    port = int(os.environ.get("PORT", 8080))
+    print(f"🚀 启动财务数据分析系统（waitress）: http://{host}:{port}")
+    serve(app, host=host, port=port,
+          threads=int(os.environ.get("WEB_THREADS", 4)),
+          channel_timeout=int(os.environ.get("WEB_TIMEOUT", 600)),
+          max_request_body_size=app.config['MAX_CONTENT_LENGTH'])
+
+
+if __name__ == "__main__":
+    main()